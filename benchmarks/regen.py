@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# License: GPL2/BSD
+
+"""Benchmark metadata regeneration against synthetic ebuild repositories.
+
+Generates a repo of the requested shape, then times a full regen of it for
+every combination of thread count, eclass caching, and cache backend,
+dumping the results as JSON.
+"""
+
+from __future__ import print_function
+
+import json
+from multiprocessing import cpu_count
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    from pkgcore.cache import flat_hash, packed
+    from pkgcore.ebuild import eclass_cache, processor, repository
+    from pkgcore.operations import observer as observer_mod
+    from pkgcore.util import commandline
+except ImportError:
+    print('Cannot import pkgcore!', file=sys.stderr)
+    print('Verify it is properly installed and/or PYTHONPATH is set correctly.', file=sys.stderr)
+    if '--debug' not in sys.argv:
+        print('Add --debug to the commandline for a traceback.', file=sys.stderr)
+    else:
+        raise
+    sys.exit(1)
+
+
+# marks trees generated by make_tree, the only ones the benchmark touches
+TREE_MARKER = '.pkgcore-bench'
+
+# cache backends to regen into, each taking a scratch dir
+cache_backends = {
+    'md5-dict': lambda tmp: flat_hash.md5_cache(tmp, readonly=False),
+    'flat_hash': lambda tmp: flat_hash.database(
+        os.path.join(tmp, 'flat_hash'), readonly=False),
+    'packed': lambda tmp: packed.database(
+        os.path.join(tmp, 'packed'), readonly=False),
+}
+
+
+def _write(path, data):
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+def make_tree(path, categories=4, packages=25, versions=3, eclasses=20,
+              eclass_depth=3, inherits=3, seed=0):
+    """Generate a synthetic ebuild repository.
+
+    :param categories: number of categories
+    :param packages: number of packages per category
+    :param versions: number of versions per package
+    :param eclasses: number of eclasses
+    :param eclass_depth: length of the inherit chains eclasses form,
+        1 meaning eclasses don't inherit others
+    :param inherits: number of eclasses each ebuild directly inherits
+    :param seed: random seed, the same parameters and seed generate the same tree
+    :return: number of ebuilds generated
+    """
+    rand = random.Random(seed)
+    _write(os.path.join(path, TREE_MARKER), '')
+    _write(os.path.join(path, 'profiles', 'repo_name'), 'bench\n')
+    _write(os.path.join(path, 'profiles', 'categories'),
+           ''.join('bench-cat%i\n' % x for x in range(categories)))
+    _write(os.path.join(path, 'metadata', 'layout.conf'),
+           'masters =\ncache-formats = md5-dict\n')
+
+    names = ['bench%i' % x for x in range(eclasses)]
+    for i, name in enumerate(names):
+        l = []
+        # chain each eclass to the next, breaking chains every eclass_depth
+        if (i + 1) % eclass_depth and i + 1 < eclasses:
+            l.append('inherit %s\n' % names[i + 1])
+        l.append(
+            'EXPORT_FUNCTIONS src_compile\n'
+            'IUSE+=" %(name)s"\n'
+            'DEPEND+=" %(name)s? ( dev-libs/%(name)s )"\n'
+            '%(name)s_helper() {\n'
+            '\tlocal x\n'
+            '\tfor x in "$@"; do\n'
+            '\t\techo "${x}"\n'
+            '\tdone\n'
+            '}\n'
+            '%(name)s_src_compile() {\n'
+            '\t%(name)s_helper "${A}"\n'
+            '}\n' % {'name': name})
+        _write(os.path.join(path, 'eclass', name + '.eclass'), ''.join(l))
+
+    count = 0
+    for c in range(categories):
+        for p in range(packages):
+            for v in range(versions):
+                inherit = ' '.join(rand.sample(names, min(inherits, eclasses)))
+                _write(os.path.join(
+                    path, 'bench-cat%i' % c, 'pkg%i' % p, 'pkg%i-%i.ebuild' % (p, v + 1)),
+                    'EAPI=6\n'
+                    '%s'
+                    'DESCRIPTION="synthetic package %i"\n'
+                    'HOMEPAGE="https://example.com"\n'
+                    'SRC_URI="https://example.com/${P}.tar.gz"\n'
+                    'LICENSE="BSD"\n'
+                    'SLOT="0"\n'
+                    'KEYWORDS="~amd64 ~x86"\n'
+                    'IUSE="doc test"\n'
+                    'RDEPEND="dev-libs/dep%i:= doc? ( app-doc/doc%i )"\n'
+                    'DEPEND="${RDEPEND} test? ( dev-util/test )"\n'
+                    % ('inherit %s\n' % inherit if inherit else '', p, p, c))
+                count += 1
+    return count
+
+
+class _counting_observer(observer_mod.null_output):
+
+    def __init__(self):
+        self.errors = 0
+
+    def error(self, msg, *args, **kwds):
+        self.errors += 1
+
+
+def time_regen(path, tmp, backend, threads, eclass_caching, jobs_mode):
+    """Time a single regen of the tree at path into an empty cache.
+
+    The tree itself is left untouched; every backend regens into tmp.
+
+    :return: tuple of seconds taken, and the number of errors encountered
+    """
+    # start from scratch; no cache entries, processors or stored eclass functions
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    processor.shutdown_all_processors()
+    processor.EbuildProcessor.eclass_function_cache = \
+        processor.EclassFunctionCache(os.path.join(tmp, 'eclass-functions'))
+
+    cache = cache_backends[backend](tmp)
+    repo = repository._UnconfiguredTree(
+        path, eclass_cache=eclass_cache.cache(os.path.join(path, 'eclass')),
+        cache=(cache,))
+    observer = _counting_observer()
+    start = time.time()
+    repo.operations.regen_cache(
+        threads=threads, jobs_mode=jobs_mode, observer=observer,
+        eclass_caching=eclass_caching)
+    return time.time() - start, observer.errors
+
+
+argparser = commandline.ArgumentParser(
+    config=False, domain=False, color=False, description=__doc__)
+tree = argparser.add_argument_group('synthetic tree')
+tree.add_argument(
+    '--categories', type=int, default=4, help='number of categories')
+tree.add_argument(
+    '--packages', type=int, default=25, help='number of packages per category')
+tree.add_argument(
+    '--versions', type=int, default=3, help='number of versions per package')
+tree.add_argument(
+    '--eclasses', type=int, default=20, help='number of eclasses')
+tree.add_argument(
+    '--eclass-depth', type=int, default=3,
+    help='length of eclass inherit chains')
+tree.add_argument(
+    '--inherits', type=int, default=3,
+    help='number of eclasses each ebuild inherits')
+tree.add_argument(
+    '--seed', type=int, default=0, help='random seed used generating the tree')
+tree.add_argument(
+    '--tree', help='generate the tree at the given path and keep it, '
+    'reusing a tree previously generated at that path')
+runs = argparser.add_argument_group('runs')
+runs.add_argument(
+    '-t', '--threads', type=int, default=None,
+    help='maximum thread count, regen is timed for 1 up to this (default: cpu count)')
+runs.add_argument(
+    '--jobs-mode', choices=('thread', 'process'), default='thread',
+    help='whether threads are run as threads or forked processes')
+runs.add_argument(
+    '--backend', action='append', choices=sorted(cache_backends),
+    help='cache backend to regen into, may be given multiple times (default: all)')
+runs.add_argument(
+    '--eclass-caching', choices=('on', 'off', 'both'), default='both',
+    help='whether to time regen with eclass caching enabled, disabled, or both')
+runs.add_argument(
+    '-n', '--repeat', type=int, default=3,
+    help='number of times each combination is timed')
+argparser.add_argument(
+    '-o', '--output', help='file to write the JSON results to (default: stdout)')
+
+
+@argparser.bind_final_check
+def check_args(parser, namespace):
+    for attr in ('categories', 'packages', 'versions', 'eclass_depth', 'repeat'):
+        if getattr(namespace, attr) < 1:
+            parser.error('--%s must be positive' % attr.replace('_', '-'))
+    if namespace.threads is None:
+        namespace.threads = cpu_count()
+    if not namespace.backend:
+        namespace.backend = sorted(cache_backends)
+    namespace.eclass_caching = {
+        'on': (True,), 'off': (False,), 'both': (True, False)}[namespace.eclass_caching]
+
+
+@argparser.bind_main_func
+def main(options, out, err):
+    params = {x: getattr(options, x) for x in (
+        'categories', 'packages', 'versions', 'eclasses', 'eclass_depth',
+        'inherits', 'seed')}
+
+    workdir = tempfile.mkdtemp(prefix='pkgcore-bench-')
+    try:
+        path = options.tree
+        if path is None:
+            path = os.path.join(workdir, 'tree')
+        if os.path.exists(os.path.join(path, TREE_MARKER)):
+            ebuilds = sum(
+                len([f for f in files if f.endswith('.ebuild')])
+                for _root, _dirs, files in os.walk(path))
+        elif os.path.exists(path) and os.listdir(path):
+            argparser.error(
+                "refusing to use %r, it's not a tree generated by a prior "
+                "--tree run" % (path,))
+        else:
+            ebuilds = make_tree(path, **params)
+
+        results = []
+        for backend in options.backend:
+            for eclass_caching in options.eclass_caching:
+                for threads in range(1, options.threads + 1):
+                    times = []
+                    errors = 0
+                    for x in range(options.repeat):
+                        elapsed, run_errors = time_regen(
+                            path, os.path.join(workdir, 'scratch'), backend,
+                            threads, eclass_caching, options.jobs_mode)
+                        times.append(elapsed)
+                        errors += run_errors
+                    times.sort()
+                    results.append({
+                        'backend': backend,
+                        'eclass_caching': eclass_caching,
+                        'threads': threads,
+                        'jobs_mode': options.jobs_mode,
+                        'times': times,
+                        'min': times[0],
+                        'median': times[len(times) // 2],
+                        'ebuilds_per_second': ebuilds / times[0],
+                        'errors': errors,
+                    })
+                    err.write('%s, eclass caching %s, %i thread(s): %.2fs' % (
+                        backend, 'on' if eclass_caching else 'off',
+                        threads, times[0]))
+    finally:
+        processor.shutdown_all_processors()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    data = {
+        'tree': dict(params, ebuilds=ebuilds),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if options.output is None:
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(options.output, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    commandline.main(argparser)
@@ -196,6 +196,7 @@ __ebd_exec_main() {
 
 	__colored_output_disable
 	declare -A PKGCORE_PRELOADED_ECLASSES
+	declare -A PKGCORE_ECLASS_PATHS
 
 	trap __ebd_sigint_handler SIGINT
 	trap __ebd_sigkill_handler SIGKILL
@@ -324,6 +325,19 @@ __ebd_process_ebuild_phases() {
 			alive)
 				__ebd_write_line "yep!"
 				;;
+			negotiate_protocol\ *)
+				# pick the first requested protocol we speak, falling back to
+				# line based text
+				PKGCORE_EBD_PROTOCOL=text
+				for x in ${com#negotiate_protocol }; do
+					if [[ ${x} == "framed" ]]; then
+						PKGCORE_EBD_PROTOCOL=${x}
+						break
+					fi
+				done
+				__ebd_write_line "protocol ${PKGCORE_EBD_PROTOCOL}"
+				unset -v x
+				;;
 			*)
 				echo "received unknown com during phase processing: ${line}" >&2
 				exit 1
@@ -441,11 +455,52 @@ __ebd_main_loop() {
 				__ebd_write_line "preload_eclass ${success}"
 				unset -v e x success
 				;;
+			preload_eclass_bodies\ *)
+				# bulk transfer of functions previously dumped via
+				# dump_preloaded_eclass, thus already validated; the python
+				# side verifies the entries' ownership prior to sending them
+				line=${com#preload_eclass_bodies }
+				__ebd_read_size "${line}" line
+				if eval "${line}"; then
+					__ebd_write_line "preload_eclass_bodies succeeded"
+				else
+					__ebd_write_line "preload_eclass_bodies failed"
+				fi
+				;;
+			dump_preloaded_eclass\ *)
+				# dump_preloaded_eclass <eclass> <tmp path> <path>
+				read -r x e y <<< "${com#dump_preloaded_eclass }"
+				x=${PKGCORE_PRELOADED_ECLASSES[${x}]}
+				# entries are refused if writable by others; see EclassFunctionCache
+				if [[ -n ${x} ]] && ( umask 0022; declare -f "${x}" > "${e}" ) 2> /dev/null; then
+					mv -f "${e}" "${y}" 2> /dev/null || rm -f "${e}"
+				else
+					rm -f "${e}" 2> /dev/null
+				fi
+				# failures only cost future runs a lazy preload, so don't report them
+				__ebd_write_line "dump_preloaded_eclass done"
+				unset -v e x y
+				;;
 			clear_preloaded_eclasses)
 				unset -v PKGCORE_PRELOADED_ECLASSES
 				declare -A PKGCORE_PRELOADED_ECLASSES
 				__ebd_write_line "clear_preloaded_eclasses succeeded"
 				;;
+			set_eclass_paths\ *)
+				# set_eclass_paths <size>, followed by '<eclass> <path>' lines;
+				# while set, inherits are resolved without asking python
+				line=${com#set_eclass_paths }
+				unset -v PKGCORE_ECLASS_PATHS
+				declare -A PKGCORE_ECLASS_PATHS
+				if [[ ${line} -gt 0 ]]; then
+					__ebd_read_size "${line}" line
+					while read -r x e; do
+						[[ -n ${x} ]] && PKGCORE_ECLASS_PATHS[${x}]=${e}
+					done <<< "${line}"
+				fi
+				__ebd_write_line "eclass_paths_received"
+				unset -v e x
+				;;
 			set_metadata_path\ *)
 				line=${com#set_metadata_path }
 				__ebd_read_size "${line}" PKGCORE_METADATA_PATH
@@ -464,6 +519,19 @@ __ebd_main_loop() {
 			alive)
 				__ebd_write_line "yep!"
 				;;
+			negotiate_protocol\ *)
+				# pick the first requested protocol we speak, falling back to
+				# line based text
+				PKGCORE_EBD_PROTOCOL=text
+				for x in ${com#negotiate_protocol }; do
+					if [[ ${x} == "framed" ]]; then
+						PKGCORE_EBD_PROTOCOL=${x}
+						break
+					fi
+				done
+				__ebd_write_line "protocol ${PKGCORE_EBD_PROTOCOL}"
+				unset -v x
+				;;
 			*)
 				echo "received unknown com: ${com}" >&2
 				exit 1
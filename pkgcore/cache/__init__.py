@@ -14,11 +14,12 @@ import operator
 
 from snakeoil import klass
 from snakeoil.chksum import get_handler
-from snakeoil.compatibility import raise_from
+from snakeoil.compatibility import intern, raise_from
 from snakeoil.mappings import (
     ProtectedDict, autoconvert_py3k_methods_metaclass, make_SlottedDict_kls)
 
 from pkgcore.cache import errors
+from pkgcore.cache.eclass_index import EclassIndex
 from pkgcore.ebuild.const import metadata_keys
 
 
@@ -45,6 +46,8 @@ class base(object):
 
     frozen = klass.alias_attr('readonly')
 
+    _eclass_index = None
+
     __metaclass__ = autoconvert_py3k_methods_metaclass
 
     def __init__(self, auxdbkeys=None, readonly=False):
@@ -66,6 +69,9 @@ class base(object):
         self.readonly = readonly
         self.set_sync_rate(self.default_sync_rate)
         self.updates = 0
+        # canonical (eclass, chksums) tuples, shared by every entry read
+        # that inherits the same eclass version
+        self._eclass_entries = {}
 
     @staticmethod
     def _get_chf_serializer(chf):
@@ -146,6 +152,8 @@ class base(object):
 
         d[self._chf_key] = self._chf_serializer(d.pop('_chf_'))
         self._setitem(cpv, d)
+        if self._eclass_index is not None:
+            self._eclass_index.add(cpv, values.get('_eclasses_') or ())
         self._sync_if_needed(True)
 
     def _setitem(self, name, values):
@@ -165,6 +173,8 @@ class base(object):
         if self.readonly:
             raise errors.ReadOnly()
         self._delitem(cpv)
+        if self._eclass_index is not None:
+            self._eclass_index.discard(cpv)
         self._sync_if_needed(True)
 
     def _delitem(self, cpv):
@@ -208,6 +218,64 @@ class base(object):
     def commit(self, force=False):
         if not self.autocommits:
             raise NotImplementedError
+        self._flush_eclass_index()
+
+    @property
+    def eclass_index(self):
+        """:obj:`pkgcore.cache.eclass_index.EclassIndex` of the entries
+
+        Loaded from disk if the backend persists it and it's still valid,
+        otherwise rebuilt by scanning the cache; once loaded it's kept up to
+        date as entries are added or removed.
+        """
+        if self._eclass_index is None:
+            self.load_eclass_index()
+        return self._eclass_index
+
+    def load_eclass_index(self, rebuild=True):
+        """Load the eclass index, returning whether it's now available.
+
+        :param rebuild: if False, only load a valid persisted index rather
+            than falling back to scanning the cache.
+        """
+        if self._eclass_index is not None:
+            return True
+        index = self._read_eclass_index()
+        if index is None:
+            if not rebuild:
+                return False
+            index = EclassIndex()
+            for cpv in self.iterkeys():
+                try:
+                    eclasses = self[cpv].get('_eclasses_', ())
+                except (KeyError, errors.CacheError):
+                    continue
+                index.add(cpv, (eclass for eclass, _chfs in eclasses))
+            self._eclass_index = index
+            self._flush_eclass_index()
+        else:
+            self._eclass_index = index
+        return True
+
+    def _read_eclass_index(self):
+        """Return the persisted eclass index if it's still valid, else None.
+
+        Override this in derived classes able to persist the index.
+        """
+        return None
+
+    def _write_eclass_index(self, index):
+        """Persist the eclass index; override this in derived classes."""
+
+    def _flush_eclass_index(self):
+        index = self._eclass_index
+        if index is None or not index.modified or self.readonly:
+            return
+        try:
+            self._write_eclass_index(index)
+        except errors.CacheError:
+            # the index is an optimization; it'll be rebuilt next time.
+            pass
 
     def deconstruct_eclasses(self, eclass_dict):
         """takes a dict, returns a string representing said dict"""
@@ -249,9 +317,13 @@ class base(object):
         # Finally, the first item, and that chain, is zipped into
         # a dict; in effect, if 2 chfs, this results in a stream of-
         # (eclass_name, ((chf1,chf1_val), (chf2, chf2_val))).
+        intern_entry = self._eclass_entries.setdefault
         try:
-            return [(eclass, tuple(self._deserialize_eclass_chfs(i)))
-                for eclass in i]
+            l = []
+            for eclass in i:
+                entry = (intern(eclass), tuple(self._deserialize_eclass_chfs(i)))
+                l.append(intern_entry(entry, entry))
+            return l
         except ValueError:
             raise_from(errors.CacheCorruption(
                 cpv, 'ValueError reading %r' % (eclass_string,)))
@@ -315,3 +387,4 @@ class bulk(base):
         if self._pending_updates or force:
             self._write_data()
             self._pending_updates = []
+        self._flush_eclass_index()
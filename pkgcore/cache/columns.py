@@ -0,0 +1,105 @@
+# License: GPL2/BSD
+
+"""
+columnar store of pkg metadata, for bulk queries across a repo
+
+Rather than a pkg object per cpv, each metadata key gets a list holding its
+value for every pkg, a pkg's position in those lists being its ordinal.
+Values are pooled, so pkgs sharing a value share the object; aggregations
+only process each distinct value once.
+"""
+
+__all__ = ("MetadataColumns",)
+
+from collections import Counter
+
+
+class MetadataColumns(object):
+    """Per key columns of metadata values, indexed by pkg ordinal.
+
+    Values are stored as found in cache entries, missing keys as empty
+    strings; ``_eclasses_`` is stored as the sorted tuple of inherited
+    eclass names.
+
+    :ivar keys: tuple of the metadata keys stored
+    :ivar cpvs: list of the cpv strings of the stored pkgs, in ordinal order
+    :ivar failures: mapping of the cpv strings of pkgs whose metadata
+        couldn't be loaded to the exception raised
+    """
+
+    def __init__(self, keys):
+        self.keys = tuple(keys)
+        self.cpvs = []
+        self.failures = {}
+        self._columns = {k: [] for k in self.keys}
+        self._ordinals = {}
+        self._pool = {}
+
+    def append(self, cpvstr, data):
+        """Add the metadata of a pkg, returning its ordinal."""
+        pool = self._pool
+        for key, column in self._columns.iteritems():
+            val = data.get(key, '')
+            if key == '_eclasses_':
+                val = tuple(sorted(val)) if val else ()
+            column.append(pool.setdefault(val, val))
+        ordinal = self._ordinals[cpvstr] = len(self.cpvs)
+        self.cpvs.append(cpvstr)
+        return ordinal
+
+    def ordinal(self, cpvstr):
+        """Return the ordinal of a pkg, raising KeyError if it isn't stored."""
+        return self._ordinals[cpvstr]
+
+    def column(self, key):
+        """Return the list of values of key, indexed by ordinal."""
+        return self._columns[key]
+
+    def get(self, cpvstr, key):
+        """Return the value of key for a pkg."""
+        return self._columns[key][self._ordinals[cpvstr]]
+
+    def row(self, ordinal):
+        """Return a dict of all values stored for the pkg at ordinal."""
+        return {k: v[ordinal] for k, v in self._columns.iteritems()}
+
+    def select(self, key, predicate):
+        """Return the ordinals of the pkgs whose value of key predicate accepts.
+
+        predicate is invoked once per distinct value.
+        """
+        results = {}
+        l = []
+        for ordinal, val in enumerate(self._columns[key]):
+            matched = results.get(val)
+            if matched is None:
+                matched = results[val] = bool(predicate(val))
+            if matched:
+                l.append(ordinal)
+        return l
+
+    def histogram(self, key, split=None):
+        """Count the pkgs each value of key is found in.
+
+        :param split: if given, callable turning a value into the items to
+            count instead; it's invoked once per distinct value, and must
+            not return an item more than once
+        :return: :obj:`collections.Counter` instance
+        """
+        counts = Counter(self._columns[key])
+        if split is None:
+            return counts
+        items = Counter()
+        for val, count in counts.iteritems():
+            for item in split(val):
+                items[item] += count
+        return items
+
+    def __contains__(self, cpvstr):
+        return cpvstr in self._ordinals
+
+    def __len__(self):
+        return len(self.cpvs)
+
+    def __iter__(self):
+        return iter(self.cpvs)
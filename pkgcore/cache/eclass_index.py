@@ -0,0 +1,106 @@
+# License: GPL2/BSD
+
+"""
+reverse eclass index, mapping eclasses to the cache entries inheriting them
+"""
+
+__all__ = ("EclassIndex", "read_index", "write_index")
+
+from pkgcore.cache import index_file
+
+_MAGIC = "pkgcore-eclass-index 1"
+
+
+class EclassIndex(object):
+    """Tracks which eclasses each cache entry inherits, and the reverse.
+
+    :ivar modified: whether the index changed since it was last persisted
+    """
+
+    def __init__(self, entries=()):
+        self._inherits = {}
+        self._consumers = {}
+        for cpv, eclasses in entries:
+            self.add(cpv, eclasses)
+        self.modified = False
+
+    def add(self, cpv, eclasses):
+        """Set the eclasses inherited by cpv, replacing any prior entry."""
+        self.discard(cpv)
+        eclasses = tuple(eclasses)
+        self._inherits[cpv] = eclasses
+        for eclass in eclasses:
+            self._consumers.setdefault(eclass, set()).add(cpv)
+        self.modified = True
+
+    def discard(self, cpv):
+        """Drop cpv from the index, if it's present."""
+        eclasses = self._inherits.pop(cpv, None)
+        if eclasses is None:
+            return
+        for eclass in eclasses:
+            consumers = self._consumers[eclass]
+            consumers.discard(cpv)
+            if not consumers:
+                del self._consumers[eclass]
+        self.modified = True
+
+    def consumers(self, eclasses):
+        """Return a frozenset of the cpvs inheriting any of the given eclasses."""
+        if isinstance(eclasses, basestring):
+            eclasses = (eclasses,)
+        l = set()
+        for eclass in eclasses:
+            l.update(self._consumers.get(eclass, ()))
+        return frozenset(l)
+
+    def get(self, cpv, default=None):
+        """Return the eclasses cpv inherits, or default if it isn't indexed."""
+        return self._inherits.get(cpv, default)
+
+    def eclasses(self):
+        """Return the eclasses at least one entry inherits."""
+        return self._consumers.keys()
+
+    def __contains__(self, cpv):
+        return cpv in self._inherits
+
+    def __iter__(self):
+        return iter(self._inherits)
+
+    def __len__(self):
+        return len(self._inherits)
+
+    def iteritems(self):
+        return self._inherits.iteritems()
+
+
+def _parse(lines):
+    entries = []
+    for line in lines:
+        l = line.split('\t')
+        entries.append((l[0], l[1:]))
+    return EclassIndex(entries)
+
+
+def _serialize(index):
+    for cpv, eclasses in sorted(index.iteritems()):
+        yield '\t'.join((cpv,) + eclasses)
+
+
+def read_index(path, stamp):
+    """Load an eclass index.
+
+    :param stamp: the cache's current stamp; the index is only returned if it
+        was written against the same stamp.
+    :return: :obj:`EclassIndex` instance, or None if missing or stale
+    """
+    return index_file.read(path, _MAGIC, _parse, (stamp,))
+
+
+def write_index(path, stamp, index, ensure_access=None):
+    """Store an eclass index along with the stamp it's valid for.
+
+    :param ensure_access: see :obj:`pkgcore.cache.index_file.write`
+    """
+    index_file.write(path, _MAGIC, index, _serialize, (stamp,), ensure_access)
@@ -8,6 +8,7 @@ per key file based backend
 __all__ = ("database",)
 
 import errno
+import hashlib
 import os
 import stat
 
@@ -129,7 +130,8 @@ class database(fs_template.FsBased):
                     raise KeyError(cpv, "failed accessing due to %s".format(e))
                 continue
             for l in os.listdir(d):
-                if l.endswith(".cpickle"):
+                # skip pending updates and the eclass index
+                if l.endswith(".cpickle") or l.startswith("."):
                     continue
                 p = pjoin(d, l)
                 try:
@@ -143,12 +145,61 @@ class database(fs_template.FsBased):
                     continue
                 yield p[len_base+1:]
 
+    @property
+    def eclass_index_location(self):
+        return pjoin(self.location, '.eclass-index')
+
+    @property
+    def revdep_index_location(self):
+        return pjoin(self.location, '.revdep-index')
+
+    @property
+    def tree_index_location(self):
+        return pjoin(self.location, '.tree-index')
+
+    def _eclass_index_stamp(self):
+        # entries are renamed into place, bumping their category dir's mtime
+        chf = hashlib.md5()
+        try:
+            names = sorted(os.listdir(self.location))
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                return None
+            names = ()
+        for name in names:
+            if name.startswith("."):
+                continue
+            try:
+                st = os.stat(pjoin(self.location, name))
+            except EnvironmentError:
+                return None
+            if stat.S_ISDIR(st.st_mode):
+                chf.update("%s %r\n" % (name, st.st_mtime))
+        return chf.hexdigest()
+
 
 class md5_cache(database):
 
     chf_type = 'md5'
     eclass_chf_types = ('md5',)
     chf_base = 16
+    # lives in the repo itself, thus syncing would clobber any indexes stored
+    # there; those worth persisting are kept under index_dir instead
+    index_dir = '/var/cache/edb/dep'
+    tree_index_location = None
+
+    def _index_location(self, suffix):
+        return pjoin(
+            self.index_dir,
+            self.location.lstrip(os.path.sep).rstrip(os.path.sep) + suffix)
+
+    @property
+    def eclass_index_location(self):
+        return self._index_location('.eclass-index')
+
+    @property
+    def revdep_index_location(self):
+        return self._index_location('.revdep-index')
 
     def __init__(self, location, **config):
         location = pjoin(location, 'metadata', 'md5-cache')
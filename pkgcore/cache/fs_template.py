@@ -11,7 +11,7 @@ import os
 
 from snakeoil.osutils import ensure_dirs, pjoin
 
-from pkgcore.cache import base
+from pkgcore.cache import base, eclass_index
 from pkgcore.os_data import portage_gid
 
 
@@ -20,8 +20,19 @@ class FsBased(base):
 
     Provides _ensure_access as a way to attempt to ensure files have
     the specified owners/perms.
+
+    :ivar eclass_index_location: path the eclass index is persisted to, None
+        to only keep it in memory.
+    :ivar revdep_index_location: path repos using this cache may persist
+        their reverse dependency index to, None if it shouldn't be persisted.
+    :ivar tree_index_location: path repos using this cache may persist
+        their directory listings to, None if they shouldn't be persisted.
     """
 
+    eclass_index_location = None
+    revdep_index_location = None
+    tree_index_location = None
+
     def __init__(self, location, label=None, **config):
         """
         throws InitializationError if needs args aren't specified
@@ -74,3 +85,31 @@ class FsBased(base):
         else:
             path = self.location
         return ensure_dirs(path, mode=0775, minimal=False)
+
+    def _eclass_index_stamp(self):
+        """Return a string that changes whenever the stored entries do.
+
+        None means the on disk state can't be identified, in which case the
+        eclass index is neither read nor written.
+        """
+        return None
+
+    def _read_eclass_index(self):
+        if self.eclass_index_location is None:
+            return None
+        stamp = self._eclass_index_stamp()
+        if stamp is None:
+            return None
+        return eclass_index.read_index(self.eclass_index_location, stamp)
+
+    def _write_eclass_index(self, index):
+        if self.eclass_index_location is None:
+            return
+        stamp = self._eclass_index_stamp()
+        if stamp is None:
+            return
+        if not ensure_dirs(os.path.dirname(self.eclass_index_location),
+                           gid=self._gid, mode=0775, minimal=True):
+            return
+        eclass_index.write_index(
+            self.eclass_index_location, stamp, index, self._ensure_access)
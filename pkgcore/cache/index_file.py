@@ -0,0 +1,78 @@
+# License: GPL2/BSD
+
+"""
+on disk format shared by the persisted indexes
+
+Indexes are stored as a line identifying their format, header lines that
+must match for the index to be used (the stamp or repo it's valid for, for
+example), then the index's own lines. Writes go to a temp file moved into
+place, thus readers never see partial indexes.
+"""
+
+__all__ = ("read", "write")
+
+import errno
+from itertools import chain
+import os
+
+from snakeoil.compatibility import raise_from
+
+from pkgcore.cache import errors
+
+
+def read(path, magic, parse, headers=()):
+    """Load the index stored at path.
+
+    :param magic: line identifying the index's format
+    :param parse: callable turning an iterable of the index's lines, stripped
+        of newlines, into the index; IndexError, ValueError, and
+        AttributeError raised by it mark the file as corrupt
+    :param headers: lines expected to follow magic
+    :return: what parse returned, or None if the file is missing or its
+        magic or headers don't match
+    :raise: :obj:`pkgcore.cache.errors.GeneralCacheCorruption` if the file
+        can't be read or parsed
+    """
+    try:
+        with open(path, 'r') as f:
+            for expected in chain((magic,), headers):
+                if f.readline().rstrip('\n') != expected:
+                    return None
+            return parse(line.rstrip('\n') for line in f)
+    except EnvironmentError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise_from(errors.GeneralCacheCorruption(e))
+    except (AttributeError, IndexError, ValueError) as e:
+        raise_from(errors.GeneralCacheCorruption(
+            "malformed index %r: %s" % (path, e)))
+
+
+def write(path, magic, index, serialize, headers=(), ensure_access=None):
+    """Atomically store index at path, clearing its modified flag.
+
+    :param magic: line identifying the index's format
+    :param serialize: callable returning an iterable of the index's lines,
+        without newlines
+    :param headers: lines to write following magic
+    :param ensure_access: if given, invoked with the temp file's path prior
+        to it being moved into place
+    :raise: :obj:`pkgcore.cache.errors.GeneralCacheCorruption` if writing
+        failed
+    """
+    base, name = os.path.split(path)
+    fp = os.path.join(base, ".update.%i.%s" % (os.getpid(), name))
+    try:
+        with open(fp, 'w') as f:
+            for line in chain((magic,), headers, serialize(index)):
+                f.write("%s\n" % (line,))
+        if ensure_access is not None:
+            ensure_access(fp)
+        os.rename(fp, path)
+    except EnvironmentError as e:
+        try:
+            os.remove(fp)
+        except EnvironmentError:
+            pass
+        raise_from(errors.GeneralCacheCorruption(e))
+    index.modified = False
@@ -0,0 +1,192 @@
+# License: GPL2/BSD
+
+"""
+single file backend, all entries packed behind a cpv to offset index
+"""
+
+__all__ = ("database", "md5_cache")
+
+import errno
+import mmap
+import os
+
+from snakeoil.compatibility import is_py3k, raise_from
+from snakeoil.osutils import ensure_dirs, pjoin
+
+from pkgcore.cache import bulk, errors, fs_template
+from pkgcore.config import ConfigHint
+
+if is_py3k:
+    def _encode(s):
+        return s.encode('utf8')
+
+    def _decode(s):
+        return s.decode('utf8')
+else:
+    _encode = _decode = lambda s: s
+
+_MAGIC = "pkgcore-packed-cache 1\n"
+
+
+class database(fs_template.FsBased, bulk):
+    """Stores every cache entry in a single file.
+
+    The file starts with a header and a sorted ``cpv offset length`` index,
+    followed by the entries themselves in the same key=value form
+    :obj:`pkgcore.cache.flat_hash.database` uses. The file is mmap'd on
+    first access and entries are only parsed when requested; updates are
+    queued and the whole file is atomically rewritten on commit.
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    # each commit rewrites the whole file, thus batch updates aggressively
+    default_sync_rate = 1000
+    eclass_chf_types = ('eclassdir', 'mtime')
+
+    def __init__(self, *args, **config):
+        super(database, self).__init__(*args, **config)
+        self._map = None
+
+    def _read_data(self):
+        self._map = None
+        try:
+            with open(self.location, 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    return {}
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except EnvironmentError as e:
+            if e.errno == errno.ENOENT:
+                return {}
+            raise_from(errors.GeneralCacheCorruption(e))
+
+        try:
+            header_end = data.find(b'\n', len(_MAGIC)) + 1
+            if not header_end or _decode(data[:len(_MAGIC)]) != _MAGIC:
+                raise ValueError("invalid header")
+            count, index_len = map(int, _decode(data[len(_MAGIC):header_end]).split())
+            data_start = header_end + index_len
+            index = {}
+            for line in _decode(data[header_end:data_start]).split('\n')[:-1]:
+                cpv, offset, length = line.split(' ')
+                offset = data_start + int(offset)
+                index[cpv] = (offset, offset + int(length))
+            if len(index) != count:
+                raise ValueError(
+                    "index holds %i entries, expected %i" % (len(index), count))
+        except ValueError as e:
+            raise_from(errors.GeneralCacheCorruption(
+                "%s: %s" % (self.location, e)))
+        self._map = data
+        return index
+
+    def _get_raw(self, val):
+        # unmodified entries are (start, end) offsets into the current
+        # mapping, anything updated since the last commit is already
+        # serialized.
+        if isinstance(val, tuple):
+            return self._map[val[0]:val[1]]
+        return val
+
+    def _getitem(self, cpv):
+        raw = self._get_raw(self.data[cpv])
+        d = self._cdict_kls()
+        known = self._known_keys
+        try:
+            for line in _decode(raw).split('\n')[:-1]:
+                k, v = line.split('=', 1)
+                if k in known:
+                    d[k] = v
+            d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        except (KeyError, ValueError) as e:
+            raise_from(errors.CacheCorruption(cpv, e))
+        return d
+
+    def _setitem(self, cpv, values):
+        known = self._known_keys
+        raw = _encode(''.join(
+            "%s=%s\n" % (k, v) for k, v in sorted(values.iteritems())
+            if k in known))
+        self.data[cpv] = raw
+        self._pending_updates.append((cpv, raw))
+
+    def iteritems(self):
+        for cpv in self.iterkeys():
+            yield cpv, self[cpv]
+
+    @property
+    def eclass_index_location(self):
+        return self.location + '.eclass-index'
+
+    @property
+    def revdep_index_location(self):
+        return self.location + '.revdep-index'
+
+    @property
+    def tree_index_location(self):
+        return self.location + '.tree-index'
+
+    def _eclass_index_stamp(self):
+        if self._pending_updates:
+            # the file doesn't reflect what's queued
+            return None
+        try:
+            st = os.stat(self.location)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                return None
+            return 'missing'
+        return '%i %i %r' % (st.st_ino, st.st_size, st.st_mtime)
+
+    def _write_data(self):
+        data = self.data
+        cpvs = sorted(data)
+        index = []
+        offset = 0
+        for cpv in cpvs:
+            val = data[cpv]
+            if isinstance(val, tuple):
+                length = val[1] - val[0]
+            else:
+                length = len(val)
+            index.append("%s %i %i\n" % (cpv, offset, length))
+            offset += length
+        index = _encode(''.join(index))
+        header = _encode("%s%i %i\n" % (_MAGIC, len(cpvs), len(index)))
+
+        base, name = os.path.split(self.location)
+        if not ensure_dirs(base, mode=0775, minimal=False):
+            raise errors.GeneralCacheCorruption(
+                "error creating directory for %r" % (self.location,))
+        fp = pjoin(base, ".update.%i.%s" % (os.getpid(), name))
+        try:
+            with open(fp, 'wb') as f:
+                f.write(header)
+                f.write(index)
+                for cpv in cpvs:
+                    f.write(self._get_raw(data[cpv]))
+            self._ensure_access(fp)
+            os.rename(fp, self.location)
+        except EnvironmentError as e:
+            try:
+                os.remove(fp)
+            except EnvironmentError:
+                pass
+            raise_from(errors.GeneralCacheCorruption(e))
+
+        # repoint the index at the new file; the old mapping stays valid
+        # until dropped since the rename left its inode alone.
+        data.clear()
+        data.update(self._read_data())
+
+
+class md5_cache(database):
+
+    chf_type = 'md5'
+    eclass_chf_types = ('md5',)
+    chf_base = 16
@@ -0,0 +1,105 @@
+# License: GPL2/BSD
+
+"""
+reverse dependency index, mapping cat/pkg keys to the pkgs depending on them
+"""
+
+__all__ = ("RevdepIndex", "read_index", "write_index")
+
+from pkgcore.cache import index_file
+
+_MAGIC = "pkgcore-revdep-index 1"
+
+
+class RevdepIndex(object):
+    """Tracks the keys each pkg's dependencies name, and the reverse.
+
+    Entries carry a stamp identifying the state of the pkg they were
+    generated from, None marking entries that need to be regenerated
+    regardless.
+
+    :ivar modified: whether the index changed since it was last persisted
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}
+        self._revdeps = {}
+        for cpv, stamp, keys in entries:
+            self.add(cpv, stamp, keys)
+        self.modified = False
+
+    def add(self, cpv, stamp, keys):
+        """Set the keys cpv depends on, replacing any prior entry."""
+        self.discard(cpv)
+        keys = tuple(sorted(set(keys)))
+        self._entries[cpv] = (stamp, keys)
+        for key in keys:
+            self._revdeps.setdefault(key, set()).add(cpv)
+        self.modified = True
+
+    def discard(self, cpv):
+        """Drop cpv from the index, if it's present."""
+        entry = self._entries.pop(cpv, None)
+        if entry is None:
+            return
+        for key in entry[1]:
+            revdeps = self._revdeps[key]
+            revdeps.discard(cpv)
+            if not revdeps:
+                del self._revdeps[key]
+        self.modified = True
+
+    def revdeps(self, keys):
+        """Return a frozenset of the cpvs depending on any of the given keys."""
+        if isinstance(keys, basestring):
+            keys = (keys,)
+        l = set()
+        for key in keys:
+            l.update(self._revdeps.get(key, ()))
+        return frozenset(l)
+
+    def get(self, cpv, default=None):
+        """Return the (stamp, keys) entry of cpv, or default if it isn't indexed."""
+        return self._entries.get(cpv, default)
+
+    def __contains__(self, cpv):
+        return cpv in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def iteritems(self):
+        return self._entries.iteritems()
+
+
+def _parse(lines):
+    entries = []
+    for line in lines:
+        l = line.split('\t')
+        entries.append((l[0], l[1] or None, l[2:]))
+    return RevdepIndex(entries)
+
+
+def _serialize(index):
+    for cpv, (stamp, keys) in sorted(index.iteritems()):
+        yield '\t'.join((cpv, stamp or '') + keys)
+
+
+def read_index(path):
+    """Load a revdep index.
+
+    :return: :obj:`RevdepIndex` instance, or None if missing or of an
+        unknown format
+    """
+    return index_file.read(path, _MAGIC, _parse)
+
+
+def write_index(path, index, ensure_access=None):
+    """Store a revdep index.
+
+    :param ensure_access: see :obj:`pkgcore.cache.index_file.write`
+    """
+    index_file.write(path, _MAGIC, index, _serialize, ensure_access=ensure_access)
@@ -0,0 +1,86 @@
+# License: GPL2/BSD
+
+"""
+tree index, persisting the directory listings of a repo's categories and packages
+"""
+
+__all__ = ("TreeIndex", "read_index", "write_index")
+
+from pkgcore.cache import index_file
+
+_MAGIC = "pkgcore-tree-index 1"
+
+
+class TreeIndex(object):
+    """Tracks the listings of a repo's directories.
+
+    Entries map a directory's path relative to the repo to the directory's
+    mtime and the names listed in it, None mtimes marking entries that need
+    to be rescanned regardless.
+
+    :ivar modified: whether the index changed since it was last persisted
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}
+        for path, mtime, names in entries:
+            self._entries[path] = (mtime, tuple(names))
+        self.modified = False
+
+    def add(self, path, mtime, names):
+        """Set the listing of path, replacing any prior entry."""
+        self._entries[path] = (mtime, tuple(names))
+        self.modified = True
+
+    def discard(self, path):
+        """Drop path from the index, if it's present."""
+        if self._entries.pop(path, None) is not None:
+            self.modified = True
+
+    def get(self, path, default=None):
+        """Return the (mtime, names) entry of path, or default if it isn't indexed."""
+        return self._entries.get(path, default)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def iteritems(self):
+        return self._entries.iteritems()
+
+
+def _parse(lines):
+    entries = []
+    for line in lines:
+        l = line.split('\t')
+        entries.append((l[0], long(l[1]) if l[1] else None, l[2:]))
+    return TreeIndex(entries)
+
+
+def _serialize(index):
+    for relpath, (mtime, names) in sorted(index.iteritems()):
+        yield '\t'.join((relpath, '' if mtime is None else str(mtime)) + names)
+
+
+def read_index(path, location):
+    """Load a tree index.
+
+    :param location: location of the repo the index is expected to be for
+    :return: :obj:`TreeIndex` instance, or None if missing, of an unknown
+        format, or for a different repo
+    """
+    return index_file.read(path, _MAGIC, _parse, (location,))
+
+
+def write_index(path, index, location, ensure_access=None):
+    """Store a tree index.
+
+    :param location: location of the repo the index is for
+    :param ensure_access: see :obj:`pkgcore.cache.index_file.write`
+    """
+    index_file.write(path, _MAGIC, index, _serialize, (location,), ensure_access)
@@ -24,6 +24,8 @@ class domain(object):
 
     fetcher = None
     tmpdir = None
+    # number of threads multiplexed repos are queried with
+    repo_parallelism = 1
     _triggers = ()
 
     def _mk_nonconfig_triggers(self):
@@ -38,17 +40,18 @@ class domain(object):
     @klass.jit_attr
     def source_repos(self):
         """Group of all repos."""
-        return RepositoryGroup(self.repos)
+        return RepositoryGroup(self.repos, parallelism=self.repo_parallelism)
 
     @klass.jit_attr
     def source_repos_raw(self):
         """Group of all repos without filtering."""
-        return RepositoryGroup(self.repos_raw.itervalues())
+        return RepositoryGroup(
+            self.repos_raw.itervalues(), parallelism=self.repo_parallelism)
 
     @klass.jit_attr
     def installed_repos(self):
         """Group of all installed repos (vdb)."""
-        return RepositoryGroup(self.vdb)
+        return RepositoryGroup(self.vdb, parallelism=self.repo_parallelism)
 
     # multiplexed repos
     all_repos = klass.alias_attr("source_repos.combined")
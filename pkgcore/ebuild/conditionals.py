@@ -12,6 +12,7 @@ __all__ = ("DepSet", "stringify_boolean")
 from snakeoil.compatibility import raise_from, IGNORED_EXCEPTIONS
 from snakeoil.iterables import expandable_chain
 from snakeoil.sequences import iflatten_instance
+from snakeoil.weakrefs import WeakValCache
 
 from pkgcore.ebuild.atom import atom, transitive_use_atom
 from pkgcore.ebuild.errors import ParseError
@@ -22,6 +23,9 @@ try:
 except ImportError:
     parse_depset = None
 
+# parsed DepSets, shared across pkgs with identical dep strings
+_parse_cache = WeakValCache()
+
 
 class DepSet(boolean.AndRestriction):
 
@@ -54,7 +58,7 @@ class DepSet(boolean.AndRestriction):
     def parse(cls, dep_str, element_class,
               operators=None,
               element_func=None, transitive_use_atoms=False,
-              allow_src_uri_file_renames=False):
+              allow_src_uri_file_renames=False, shared=True):
         """
         :param dep_str: string abiding by DepSet syntax
         :param operators: mapping of node -> callable for special operators
@@ -64,8 +68,34 @@ class DepSet(boolean.AndRestriction):
             Mainly useful for when you need to curry a few args for instance
             generation, since element_class _must_ be a class
         :param element_class: class of generated elements
+        :param shared: if True, identical dep strings parsed with identical
+            arguments share a single instance for as long as it's referenced.
+            Disable it if element_func isn't solely dependent on its args.
         """
+        if not shared:
+            return cls._parse(
+                dep_str, element_class, operators, element_func,
+                transitive_use_atoms, allow_src_uri_file_renames)
+        key = (cls, dep_str, element_class, element_func,
+               None if operators is None else tuple(sorted(operators.iteritems())),
+               transitive_use_atoms, allow_src_uri_file_renames)
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable args
+            return cls._parse(
+                dep_str, element_class, operators, element_func,
+                transitive_use_atoms, allow_src_uri_file_renames)
+        inst = _parse_cache.get(key)
+        if inst is None:
+            inst = _parse_cache[key] = cls._parse(
+                dep_str, element_class, operators, element_func,
+                transitive_use_atoms, allow_src_uri_file_renames)
+        return inst
 
+    @classmethod
+    def _parse(cls, dep_str, element_class, operators, element_func,
+               transitive_use_atoms, allow_src_uri_file_renames):
         if not isinstance(element_class, type):
             # yes, this blocks non new style classes.  touch cookies.
             raise ValueError("element_class must be a new style class")
@@ -25,6 +25,8 @@ metadata_keys = (
 )
 
 WORLD_FILE = '/var/lib/portage/world'
+# preprocessed eclass functions the ebd preloads, shared across runs
+ECLASS_FUNCTION_CACHE_PATH = '/var/cache/edb/ebd-eclasses'
 
 EBD_PATH = const._GET_CONST('EBD_PATH', '%(DATA_PATH)s/ebd')
 EBUILD_DAEMON_PATH = pjoin(EBD_PATH, "ebuild-daemon.bash")
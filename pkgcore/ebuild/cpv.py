@@ -70,7 +70,7 @@ class _native_CPV(object):
     """
 
     __slots__ = ("__weakref__", "cpvstr", "key", "category", "package",
-        "version", "revision", "fullver")
+        "version", "revision", "fullver", "_version_key")
 
     # if native is being used, forget trying to reuse strings.
     def __init__(self, *a, **kwds):
@@ -306,6 +306,78 @@ def native_ver_cmp(ver1, rev1, ver2, rev2):
     # The revision holds the final difference.
     return cmp(rev1, rev2)
 
+def _encode_int(digits):
+    """Encode a decimal string lacking leading zeros, ordering numerically."""
+    l = len(digits)
+    if l < 255:
+        return chr(l) + digits
+    return '\xff' + _encode_int(str(l)) + digits
+
+
+def _ver_key(ver):
+    """Generate the revision-less part of a version's key."""
+    parts = ver.split("_")
+    ver_parts = parts[0].split(".")
+    letter = '\x00'
+    if ver_parts[-1][-1].isalpha():
+        letter = ver_parts[-1][-1]
+        ver_parts[-1] = ver_parts[-1][:-1]
+
+    l = []
+    for v in ver_parts:
+        if v[0] == "0":
+            # compared as floats, so that 1.1 > 1.02
+            l.append('\x02%s\x00' % (v.rstrip("0"),))
+        else:
+            l.append('\x03' + _encode_int(v))
+    l.append('\x01')
+    l.append(letter)
+
+    for suffix in parts[1:]:
+        match = suffix_regexp.match(suffix)
+        l.append(chr(suffix_value[match.group(1)] + 5))
+        l.append(_encode_int(str(int("0" + match.group(2)))))
+    l.append('\x05')
+    return ''.join(l)
+
+
+def _rev_key(rev):
+    if rev is None:
+        return '\x00'
+    return '\x01' + _encode_int(str(rev))
+
+
+def ver_key(ver, rev):
+    """Generate a key for a version ordering the same as :obj:`ver_cmp`.
+
+    Keys are strings, thus compared bytewise; the keys of versions equal
+    but for their revisions share the prefix :obj:`ver_key` returns with a
+    rev of False.
+
+    :param ver: version string, assumed valid
+    :param rev: revision, None or an int; if False, the revision part of
+        the key is left out
+    """
+    if rev is False:
+        return _ver_key(ver)
+    return _ver_key(ver) + _rev_key(rev)
+
+
+def fullver_key(fullver):
+    """Generate the :obj:`ver_key` of a version with an optional -r revision.
+
+    :raise InvalidCPV: if fullver isn't a valid version
+    """
+    ver, sep, rev = fullver.rpartition("-")
+    if sep and isvalid_rev(rev):
+        rev = int(rev[1:]) or None
+    else:
+        ver, rev = fullver, None
+    if not isvalid_version_re.match(ver):
+        raise InvalidCPV("invalid version '%s'" % (fullver,))
+    return ver_key(ver, rev)
+
+
 fake_cat = "fake"
 fake_pkg = "pkg"
 def cpy_ver_cmp(ver1, rev1, ver2, rev2):
@@ -354,6 +426,22 @@ def mk_cpv_cls(base_cls):
         # manually.
         __hash__ = base_cls.__hash__
 
+        @property
+        def version_key(self):
+            """:obj:`ver_key` of the version, None if unversioned"""
+            try:
+                return self._version_key
+            except AttributeError:
+                key = None
+                if self.version is not None:
+                    key = ver_key(self.version, self.revision)
+                try:
+                    object.__setattr__(self, "_version_key", key)
+                except AttributeError:
+                    # the cpython CPV lacks the slot
+                    pass
+                return key
+
         @property
         def versioned_atom(self):
             return atom.atom("=%s" % self.cpvstr)
@@ -36,6 +36,7 @@ from pkgcore.ebuild.repo_objs import OverlayedLicenses
 from pkgcore.repository import visibility
 from pkgcore.restrictions import packages, values
 from pkgcore.restrictions.delegated import delegate
+from pkgcore.restrictions.util import CHEAP_COST, METADATA_COST, restriction_cost
 from pkgcore.util.parserestrict import parse_match
 
 demandload(
@@ -93,20 +94,23 @@ def make_mask_filter(masks, negate=False):
             atoms[m.key].append(m)
         else:
             globs.append(m)
-    return delegate(partial(apply_mask_filter, globs, atoms), negate=negate)
+    cost = max([CHEAP_COST] + [restriction_cost(m) for m in masks])
+    return delegate(partial(apply_mask_filter, globs, atoms), negate=negate, cost=cost)
 
 
 def generate_filter(masks, unmasks, *extra):
     # note that we ignore unmasking if masking isn't specified.
     # no point, mainly
-    masking = make_mask_filter(masks, negate=True)
     unmasking = make_mask_filter(unmasks, negate=False)
-    r = ()
-    if masking:
-        if unmasking:
-            r = (packages.OrRestriction(masking, unmasking, disable_inst_caching=True),)
-        else:
-            r = (masking,)
+    # masks not requiring metadata are split out from the rest, allowing
+    # them to be checked before any metadata is pulled; this relies on
+    # (!a && !b) || c being equivalent to (!a || c) && (!b || c)
+    costly, cheap = predicate_split(
+        lambda m: restriction_cost(m) < METADATA_COST, masks)
+    r = tuple(
+        packages.OrRestriction(
+            make_mask_filter(l, negate=True), unmasking, disable_inst_caching=True)
+        for l in (cheap, costly) if l)
     return packages.AndRestriction(disable_inst_caching=True, finalize=True, *(r + extra))
 
 
@@ -124,6 +128,7 @@ class domain(config_domain):
         'profile': 'ref:profile', 'fetcher': 'ref:fetcher',
         'repositories': 'lazy_refs:repo', 'vdb': 'lazy_refs:repo',
         'name': 'str', 'triggers': 'lazy_refs:trigger',
+        'repo_parallelism': 'int',
     }
     for _thing in list(const.incrementals) + ['bashrc']:
         _types[_thing] = 'list'
@@ -146,12 +151,13 @@ class domain(config_domain):
     def __init__(self, profile, repositories, vdb, name=None,
                  root='/', config_dir='/etc/portage', prefix='/',
                  incrementals=const.incrementals,
-                 triggers=(), **settings):
+                 triggers=(), repo_parallelism=1, **settings):
         # voodoo, unfortunately (so it goes)
         # break this up into chunks once it's stabilized (most of code
         # here has already, but still more to add)
         self._triggers = triggers
         self.name = name
+        self.repo_parallelism = repo_parallelism
 
         # prevent critical variables from being changed in make.conf
         for k in profile.profile_only_variables.intersection(settings.keys()):
@@ -586,29 +592,33 @@ class domain(config_domain):
     def ebuild_repos(self):
         """Group of all ebuild repos bound with configuration data."""
         return util.RepositoryGroup(
-            x for x in self.repos
-            if isinstance(x.raw_repo, ebuild_repo._ConfiguredTree))
+            (x for x in self.repos
+             if isinstance(x.raw_repo, ebuild_repo._ConfiguredTree)),
+            parallelism=self.repo_parallelism)
 
     @klass.jit_attr
     def ebuild_repos_raw(self):
         """Group of all ebuild repos without filtering."""
         return util.RepositoryGroup(
-            x for x in self.repos_configured.itervalues()
-            if isinstance(x.raw_repo, ebuild_repo._UnconfiguredTree))
+            (x for x in self.repos_configured.itervalues()
+             if isinstance(x.raw_repo, ebuild_repo._UnconfiguredTree)),
+            parallelism=self.repo_parallelism)
 
     @klass.jit_attr
     def binary_repos(self):
         """Group of all binary repos bound with configuration data."""
         return util.RepositoryGroup(
-            x for x in self.repos
-            if isinstance(x.raw_repo, binary_repo.ConfiguredBinpkgTree))
+            (x for x in self.repos
+             if isinstance(x.raw_repo, binary_repo.ConfiguredBinpkgTree)),
+            parallelism=self.repo_parallelism)
 
     @klass.jit_attr
     def binary_repos_raw(self):
         """Group of all binary repos without filtering."""
         return util.RepositoryGroup(
-            x for x in self.repos_configured.itervalues()
-            if isinstance(x.raw_repo, binary_repo.tree))
+            (x for x in self.repos_configured.itervalues()
+             if isinstance(x.raw_repo, binary_repo.tree)),
+            parallelism=self.repo_parallelism)
 
     # multiplexed repos
     all_ebuild_repos = klass.alias_attr("ebuild_repos.combined")
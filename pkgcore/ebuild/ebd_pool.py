@@ -0,0 +1,337 @@
+# License: GPL2/BSD
+
+"""
+pool of ebuild processors shared across pkgcore invocations
+
+A long running server (``pmaint ebd-pool``) keeps a set of
+:obj:`pkgcore.ebuild.processor.EbuildProcessor` daemons alive and leases them
+out over a UNIX socket. Clients opt in by pointing the environment variable
+named by :obj:`POOL_ENV_VAR` at the socket; :obj:`request_ebuild_processor`
+then leases from the pool, falling back to spawning its own processor if the
+pool can't be reached.
+
+Pooled daemons keep the server's stdio, environment, and credentials, thus
+only processors requested for metadata generation are leased; build phases
+always get a processor of their own.
+
+Each lease is a connection: the server sends the processor's state along with
+its pipes (via fd passing), and takes it back once the client sends the
+updated state or disconnects. A processor returned in an unknown state is
+shutdown rather than reused.
+
+Since leased daemons run code on the client's behalf, clients only use pools
+run by root or their own user, as reported by the kernel for the server's
+end of the socket. Messages are JSON encoded, thus reading them can't run
+code either.
+"""
+
+__all__ = ("POOL_ENV_VAR", "PoolServer", "PooledEbuildProcessor", "lease_processor")
+
+import errno
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+
+from snakeoil.demandload import demandload
+
+from pkgcore.ebuild import const as e_const
+from pkgcore.ebuild.processor import EbuildProcessor
+
+demandload(
+    'multiprocessing.reduction:recv_handle,send_handle',
+    'pkgcore.ebuild:processor',
+    'pkgcore.log:logger',
+)
+
+POOL_ENV_VAR = "PKGCORE_EBD_POOL"
+
+# seconds to wait on the other end before giving up on a lease
+_timeout = 60
+
+_header = struct.Struct(">I")
+
+_peercred = struct.Struct("3i")
+# not exposed by the socket module under py2
+SO_PEERCRED = getattr(
+    socket, 'SO_PEERCRED', 17 if sys.platform.startswith('linux') else None)
+
+
+def _recv_exact(sock, length):
+    l = []
+    while length:
+        data = sock.recv(length)
+        if not data:
+            raise EOFError()
+        l.append(data)
+        length -= len(data)
+    return b''.join(l)
+
+
+def _decode(obj):
+    """Convert the unicode json hands back into native strings."""
+    if isinstance(obj, unicode):
+        return obj.encode('utf8')
+    elif isinstance(obj, list):
+        return [_decode(x) for x in obj]
+    elif isinstance(obj, dict):
+        return dict((_decode(k), _decode(v)) for k, v in obj.iteritems())
+    return obj
+
+
+def _tuple_or_none(paths):
+    # json only has lists, while metadata paths are compared against tuples
+    if paths is None:
+        return None
+    return tuple(paths)
+
+
+def _send_msg(sock, obj):
+    data = json.dumps(obj)
+    sock.sendall(_header.pack(len(data)) + data)
+
+
+def _recv_msg(sock):
+    """Read a message.
+
+    :raise ValueError: if the message isn't valid JSON
+    """
+    length, = _header.unpack(_recv_exact(sock, _header.size))
+    return _decode(json.loads(_recv_exact(sock, length)))
+
+
+def _peer_uid(sock):
+    """Return the uid of the process on the other end of a UNIX socket.
+
+    :return: the uid, or None if it can't be determined on this platform
+    """
+    if SO_PEERCRED is None:
+        return None
+    data = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, _peercred.size)
+    return _peercred.unpack(data)[1]
+
+
+class PooledEbuildProcessor(EbuildProcessor):
+    """Processor leased from a :obj:`PoolServer`.
+
+    Shutting it down returns it to the pool instead of killing the daemon.
+    """
+
+    pooled = True
+
+    def __init__(self, sock, state, read_fd, write_fd):
+        self.lock()
+        self._sock = sock
+        self._eclass_caching = False
+        self._outstanding_expects = []
+        self._import_state(state)
+        self._metadata_paths = _tuple_or_none(self._metadata_paths)
+        self.ebd_read = os.fdopen(read_fd, "r")
+        self.ebd_write = os.fdopen(write_fd, "w")
+        self.unlock()
+
+    def shutdown_processor(self, ignore_keyboard_interrupt=False):
+        """Return the processor to the pool, marking this instance as dead."""
+        sock, self._sock = self._sock, None
+        if sock is None:
+            return
+        state = None
+        try:
+            # only hand back processors known to be idle
+            if not self.locked and not self._outstanding_expects and self.is_alive:
+                state = {
+                    'preloaded_eclasses': self._preloaded_eclasses,
+                    'metadata_paths': self._metadata_paths,
+                }
+        except (EnvironmentError, ValueError):
+            pass
+        except KeyboardInterrupt:
+            if not ignore_keyboard_interrupt:
+                raise
+        try:
+            _send_msg(sock, state)
+        except EnvironmentError:
+            pass
+        finally:
+            sock.close()
+            for f in (self.ebd_read, self.ebd_write):
+                try:
+                    f.close()
+                except EnvironmentError:
+                    pass
+            self.pid = None
+
+
+def lease_processor(path, userpriv, sandbox):
+    """Lease a processor from the pool listening on path.
+
+    :return: :obj:`PooledEbuildProcessor` instance, or None if the pool
+        couldn't provide a usable processor
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(_timeout)
+    try:
+        sock.connect(path)
+        uid = _peer_uid(sock)
+        if uid not in (0, os.getuid()):
+            # another user's daemons would run their code on our behalf
+            logger.warning(
+                "ignoring ebd pool %r, it's run by uid %s rather than root or "
+                "the current user", path, uid)
+            sock.close()
+            return None
+        _send_msg(sock, (userpriv, sandbox))
+        state = _recv_msg(sock)
+        if state is None:
+            sock.close()
+            return None
+        # fd passing requires a blocking socket
+        sock.settimeout(None)
+        read_fd = recv_handle(sock)
+        write_fd = recv_handle(sock)
+    except (EnvironmentError, EOFError, ValueError) as e:
+        logger.debug("failed leasing an ebuild processor from %r: %s", path, e)
+        sock.close()
+        return None
+
+    ebp = PooledEbuildProcessor(sock, state, read_fd, write_fd)
+    if state['ebd'] != e_const.EBUILD_DAEMON_PATH:
+        # pool runs a different pkgcore install; hand it back untouched
+        logger.debug("ignoring ebd pool %r using %r", path, state['ebd'])
+        ebp.shutdown_processor()
+        return None
+    return ebp
+
+
+class PoolServer(object):
+    """Lease out ebuild processors over a UNIX socket.
+
+    :ivar path: location of the socket
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._leases = {}
+
+    def serve_forever(self):
+        """Serve leases until interrupted, then shutdown all processors."""
+        # the processors we hand out must be our own
+        os.environ.pop(POOL_ENV_VAR, None)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.unlink(self.path)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        # processors run with the server's privileges, only allow our user
+        old_umask = os.umask(0077)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(16)
+
+        # cleanup on termination as well
+        old_handler = signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            while True:
+                try:
+                    ready = select.select([listener] + list(self._leases), [], [])[0]
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                for sock in ready:
+                    if sock is listener:
+                        self._lease(listener.accept()[0])
+                    else:
+                        self._return(sock)
+        finally:
+            listener.close()
+            try:
+                os.unlink(self.path)
+            except EnvironmentError:
+                pass
+            for sock in list(self._leases):
+                self._return(sock, reuse=False)
+            processor.shutdown_all_processors()
+            signal.signal(signal.SIGTERM, old_handler)
+
+    def _lease(self, sock):
+        sock.settimeout(_timeout)
+        try:
+            userpriv, sandbox = _recv_msg(sock)
+            if not isinstance(userpriv, bool) or not isinstance(sandbox, bool):
+                raise ValueError("malformed request")
+        except (EnvironmentError, EOFError, TypeError, ValueError) as e:
+            logger.warning("dropping client, failed reading its request: %s", e)
+            sock.close()
+            return
+        sock.settimeout(None)
+
+        ebp = None
+        try:
+            ebp = processor.request_ebuild_processor(
+                userpriv=userpriv, sandbox=sandbox)
+            self._expire_preloaded_eclasses(ebp)
+            lease_start = time.time()
+            _send_msg(sock, ebp._export_state())
+            send_handle(sock, ebp.ebd_read.fileno(), None)
+            send_handle(sock, ebp.ebd_write.fileno(), None)
+        except Exception as e:
+            logger.error("failed leasing an ebuild processor: %s", e)
+            if ebp is not None:
+                self._discard(ebp)
+            else:
+                try:
+                    _send_msg(sock, None)
+                except EnvironmentError:
+                    pass
+            sock.close()
+            return
+
+        ebp._pool_lease_start = lease_start
+        self._leases[sock] = ebp
+
+    def _return(self, sock, reuse=True):
+        ebp = self._leases.pop(sock)
+        state = None
+        if reuse:
+            try:
+                state = _recv_msg(sock)
+            except (EnvironmentError, EOFError, ValueError):
+                pass
+        sock.close()
+        if state is None:
+            # client died or didn't know what state the daemon was left in
+            self._discard(ebp)
+            return
+        ebp._preloaded_eclasses = dict(state['preloaded_eclasses'])
+        ebp._metadata_paths = _tuple_or_none(state['metadata_paths'])
+        processor.release_ebuild_processor(ebp)
+
+    def _discard(self, ebp):
+        processor.release_ebuild_processor(ebp)
+        try:
+            ebp.shutdown_processor(ignore_keyboard_interrupt=True)
+        except EnvironmentError:
+            pass
+
+    @staticmethod
+    def _expire_preloaded_eclasses(ebp):
+        """Drop preloaded eclasses if any were modified since being preloaded."""
+        lease_start = getattr(ebp, '_pool_lease_start', None)
+        if lease_start is None or not ebp._preloaded_eclasses:
+            return
+        for path in ebp._preloaded_eclasses.itervalues():
+            try:
+                if os.stat(path).st_mtime < lease_start:
+                    continue
+            except EnvironmentError:
+                pass
+            ebp.clear_preloaded_eclasses()
+            return
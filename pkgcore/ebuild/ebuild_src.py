@@ -95,7 +95,8 @@ def generate_fetchables(self, allow_missing_checksums=False,
     d = conditionals.DepSet.parse(
         self.data.pop("SRC_URI", ""), fetchable, operators={},
         element_func=func,
-        allow_src_uri_file_renames=self.eapi.options.src_uri_renames)
+        allow_src_uri_file_renames=self.eapi.options.src_uri_renames,
+        shared=False)
     for v in common.itervalues():
         v.uri.finalize()
     return d
@@ -308,7 +309,7 @@ class package(base):
         return data_source.data_source(data, mutable=False)
 
     def _get_ebuild_environment(self, ebp=None):
-        with processor.reuse_or_request(ebp) as ebp:
+        with processor.reuse_or_request(ebp, metadata=True) as ebp:
             return ebp.get_ebuild_environment(self, self.repo.eclass_cache)
 
 
@@ -343,11 +344,17 @@ class package_factory(metadata.factory):
         return os.stat(self._get_ebuild_path(pkg)).st_mtime
 
     def _get_metadata(self, pkg, ebp=None, force_regen=False):
-        caches = self._cache
-        if force_regen:
-            caches = ()
+        if not force_regen:
+            data = self._get_cached_metadata(pkg)
+            if data is not None:
+                return data
+        # no cache entries, regen
+        return self._update_metadata(pkg, ebp=ebp)
+
+    def _get_cached_metadata(self, pkg):
+        """Return the first valid cache entry for pkg, or None if there isn't one."""
         ebuild_hash = chksum.LazilyHashedPath(pkg.path)
-        for cache in caches:
+        for cache in self._cache:
             if cache is not None:
                 try:
                     data = cache[pkg.cpvstr]
@@ -361,18 +368,20 @@ class package_factory(metadata.factory):
                     logger.warning("caught cache error: %s" % e)
                     del e
                     continue
-
-        # no cache entries, regen
-        return self._update_metadata(pkg, ebp=ebp)
+        return None
 
     def _update_metadata(self, pkg, ebp=None):
         parsed_eapi = pkg.eapi
         if not parsed_eapi.is_supported:
             return {'EAPI': str(parsed_eapi)}
 
-        with processor.reuse_or_request(ebp) as my_proc:
+        with processor.reuse_or_request(ebp, metadata=True) as my_proc:
             mydata = my_proc.get_keys(pkg, self._ecache)
+        return self._store_metadata(pkg, mydata)
 
+    def _store_metadata(self, pkg, mydata):
+        """Finalize freshly generated metadata, updating the caches with it."""
+        parsed_eapi = pkg.eapi
         inherited = mydata.pop("INHERITED", None)
         # Rewrite defined_phases as needed, since we now know the EAPI.
         eapi = get_eapi(mydata["EAPI"])
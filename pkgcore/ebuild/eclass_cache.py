@@ -33,6 +33,7 @@ class base(object):
 
     def __init__(self, location=None, eclassdir=None):
         self._eclass_data_inst_cache = WeakValCache()
+        self._valid_entries = {}
         # generate this.
         # self.eclasses = {} # {"Name": ("location", "_mtime_")}
         self.location = location
@@ -62,25 +63,47 @@ class base(object):
 
     eclasses = jit_attr_ext_method("_load_eclasses", "_eclasses")
 
-    def rebuild_cache_entry(self, entry_eclasses):
-        """Check if eclass data is still valid.
+    def get_valid_entries(self, chf_types):
+        """Return the current (eclass, chksums) tuples for the given chfs.
 
-        Given a dict as returned by get_eclass_data, walk it comparing
-        it to internal eclass view.
+        Computed once per chf combination, thus each eclass is hashed (or
+        stat'd) a single time regardless of how many entries get validated.
 
-        :return: a boolean representing whether that eclass data is still
-            up to date, or not
+        :param chf_types: sequence of chf names, in the order cache entries
+            store them.
+        :return: frozenset of ``(eclass, ((chf, val), ...))`` tuples
         """
-        ec = self.eclasses
-        d = {}
+        chf_types = tuple(chf_types)
+        valid = self._valid_entries.get(chf_types)
+        if valid is None:
+            l = []
+            for eclass, data in self.eclasses.iteritems():
+                try:
+                    chksums = tuple((chf, getattr(data, chf)) for chf in chf_types)
+                except (AttributeError, EnvironmentError):
+                    # unreadable eclass; nothing can validate against it.
+                    continue
+                l.append((eclass, chksums))
+            valid = self._valid_entries[chf_types] = frozenset(l)
+        return valid
+
+    def rebuild_cache_entry(self, entry_eclasses):
+        """Check if eclass data is still valid.
 
-        for eclass, chksums in entry_eclasses:
-            data = ec.get(eclass)
-            if any(val != getattr(data, chf, None) for chf, val in chksums):
-                return None
-            d[eclass] = data
+        Given a sequence of (eclass, chksums) pairs as stored by the cache,
+        check them against the internal eclass view.
 
-        return d
+        :return: the entry's eclass data as returned by get_eclass_data if
+            still up to date, else None
+        """
+        entry_eclasses = tuple(entry_eclasses)
+        if entry_eclasses:
+            valid = self.get_valid_entries(
+                chf for chf, _val in entry_eclasses[0][1])
+            for eclass, chksums in entry_eclasses:
+                if (eclass, tuple(chksums)) not in valid:
+                    return None
+        return self.get_eclass_data(eclass for eclass, _chksums in entry_eclasses)
 
 
 class cache(base):
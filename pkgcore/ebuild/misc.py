@@ -18,11 +18,12 @@ from functools import partial
 from itertools import chain
 
 from snakeoil import compatibility, mappings
-from snakeoil.klass import generic_equality, alias_method
+from snakeoil.klass import generic_equality, alias_method, jit_attr
 from snakeoil.sequences import namedtuple, iflatten_instance, stable_unique
 
 from pkgcore.ebuild import atom
 from pkgcore.restrictions import packages, restriction, boolean
+from pkgcore.restrictions.compiler import compile_selector
 from pkgcore.util.parserestrict import parse_match
 
 restrict_payload = namedtuple("restrict_data", ["restrict", "data"])
@@ -229,16 +230,28 @@ class collapsed_restrict_to_data(object):
         self.defaults_finalized = set(x for x in self.defaults if not x.startswith("-"))
         self.freeform = tuple(x for x in (repo, cat, pkg, multi) if x)
         self.atoms = atom_d
+        self._atom_selectors = {}
+
+    @jit_attr
+    def _freeform_selector(self):
+        return compile_selector(chain.from_iterable(self.freeform))
+
+    def _select(self, pkg):
+        """Return the data of the restrictions matching pkg."""
+        l = self._freeform_selector(pkg)
+        key = pkg.key
+        select = self._atom_selectors.get(key)
+        if select is None:
+            atoms = self.atoms.get(key)
+            if not atoms:
+                return l
+            # compiled lazily; few of the keys are ever looked up
+            select = self._atom_selectors[key] = compile_selector(atoms)
+        l.extend(select(pkg))
+        return l
 
     def pull_data(self, pkg, force_copy=False, pre_defaults=()):
-        l = []
-        for specific in self.freeform:
-            for restrict, data in specific:
-                if restrict.match(pkg):
-                    l.append(data)
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                l.append(data)
+        l = self._select(pkg)
 
         if pre_defaults:
             s = set(pre_defaults)
@@ -255,28 +268,15 @@ class collapsed_restrict_to_data(object):
             yield item
         for item in self.defaults:
             yield item
-        for specific in self.freeform:
-            for restrict, data in specific:
-                if restrict.match(pkg):
-                    for item in data:
-                        yield item
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                for item in data:
-                    yield item
+        for data in self._select(pkg):
+            for item in data:
+                yield item
 
 
 class non_incremental_collapsed_restrict_to_data(collapsed_restrict_to_data):
 
     def pull_data(self, pkg, force_copy=False):
-        l = []
-        for specific in self.freeform:
-            for restrict, data in specific:
-                if restrict.match(pkg):
-                    l.append(data)
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                l.append(data)
+        l = self._select(pkg)
         if not l:
             if force_copy:
                 return set(self.defaults)
@@ -287,11 +287,7 @@ class non_incremental_collapsed_restrict_to_data(collapsed_restrict_to_data):
 
     def iter_pull_data(self, pkg):
         l = [self.defaults]
-        for specific in self.freeform:
-            l.extend(data for restrict, data in specific if restrict.match(pkg))
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                l.append(data)
+        l.extend(self._select(pkg))
         if len(l) == 1:
             return iter(self.defaults)
         return iflatten_instance(l)
@@ -229,11 +229,21 @@ def add_fetcher(config, make_conf):
     config["fetcher"] = basics.AutoConfigSection(fetcher_dict)
 
 
-def make_cache(cache_format, repo_path):
+def make_cache(cache_format, repo_path, packed=False):
     # Use md5 cache if it exists or the option is selected, otherwise default
     # to the old flat hash format in /var/cache/edb/dep/*.
-    if (os.path.exists(pjoin(repo_path, 'metadata', 'md5-cache')) or
-            cache_format == 'md5-dict'):
+    md5 = (os.path.exists(pjoin(repo_path, 'metadata', 'md5-cache')) or
+           cache_format == 'md5-dict')
+    if packed:
+        # single file cache stored outside the repo so syncing doesn't
+        # clobber it; validated the same way as the repo's own cache.
+        if md5:
+            kls = 'pkgcore.cache.packed.md5_cache'
+        else:
+            kls = 'pkgcore.cache.packed.database'
+        repo_path = pjoin('/var/cache/edb/dep', repo_path.lstrip('/').rstrip('/') + '.packed')
+        cache_parent_dir = os.path.dirname(repo_path)
+    elif md5:
         kls = 'pkgcore.cache.flat_hash.md5_cache'
         cache_parent_dir = pjoin(repo_path, 'metadata', 'md5-cache')
     else:
@@ -482,6 +492,13 @@ def config_from_make_conf(location=None, profile_override=None, **kwargs):
             cache_name = 'cache:' + repo_name
             config[cache_name] = make_cache(repo_config.cache_format, repo_path)
             repo['cache'] = cache_name
+            if repo_opts.get('packed-cache', 'false').lower() in ('true', 'yes'):
+                # the packed cache is consulted first, falling back to the
+                # regular cache for entries it doesn't have yet
+                packed_name = cache_name + '-packed'
+                config[packed_name] = make_cache(
+                    repo_config.cache_format, repo_path, packed=True)
+                repo['cache'] = '%s %s' % (packed_name, cache_name)
 
         if repo_path == default_repo_path:
             repo_conf['default'] = True
@@ -37,30 +37,37 @@ except ImportError:
 
 inactive_ebp_list = []
 active_ebp_list = []
+_forgotten_ebp_list = []
 
+from collections import deque
 import contextlib
 import errno
 from functools import partial
 import os
 import signal
+import stat
 
 import pkgcore
 from pkgcore import const, os_data
 from pkgcore.ebuild import const as e_const
 
 from snakeoil import klass
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
 from snakeoil.currying import pretty_docs
 from snakeoil.demandload import demandload
-from snakeoil.osutils import abspath, normpath, pjoin
+from snakeoil.osutils import abspath, ensure_dirs, normpath, pjoin
 from snakeoil.weakrefs import WeakRefFinalizer
 
 demandload(
+    'hashlib:md5',
     'logging',
-    'itertools:chain',
+    'itertools:chain,islice',
     'traceback',
     'snakeoil:fileutils',
+    'snakeoil.chksum:get_handler',
     'snakeoil:process',
     'snakeoil.process:spawn',
+    'pkgcore.ebuild:ebd_pool',
     'pkgcore.log:logger',
 )
 
@@ -79,6 +86,13 @@ def _single_thread_allowed(functor):
 
 @_single_thread_allowed
 def forget_all_processors():
+    """Drop all known processors without shutting them down.
+
+    Intended for forked children; the processors belong to the parent, thus
+    references are kept so their finalizers never run in the child.
+    """
+    _forgotten_ebp_list.extend(active_ebp_list)
+    _forgotten_ebp_list.extend(inactive_ebp_list)
     active_ebp_list[:] = []
     inactive_ebp_list[:] = []
 
@@ -109,13 +123,17 @@ spawn.atexit_register(shutdown_all_processors)
 
 
 @_single_thread_allowed
-def request_ebuild_processor(userpriv=False, sandbox=None):
+def request_ebuild_processor(userpriv=False, sandbox=None, metadata=False):
     """Request an ebuild_processor instance, creating a new one if needed.
 
     :return: :obj:`EbuildProcessor`
     :param userpriv: should the processor be deprived to
         :obj:`pkgcore.os_data.portage_gid` and :obj:`pkgcore.os_data.portage_uid`?
     :param sandbox: should the processor be sandboxed?
+    :param metadata: is the processor only used for sourcing ebuilds, i.e.
+        metadata generation?  Only such processors are leased from an ebd
+        pool, since pooled daemons keep the pool server's stdio, environment,
+        and credentials.
     """
 
     if sandbox is None:
@@ -123,6 +141,8 @@ def request_ebuild_processor(userpriv=False, sandbox=None):
 
     for x in inactive_ebp_list:
         if x.userprived() == userpriv and (x.sandboxed() or not sandbox):
+            if x.pooled and not metadata:
+                continue
             if not x.is_alive:
                 inactive_ebp_list.remove(x)
                 continue
@@ -130,7 +150,12 @@ def request_ebuild_processor(userpriv=False, sandbox=None):
             active_ebp_list.append(x)
             return x
 
-    e = EbuildProcessor(userpriv, sandbox)
+    e = None
+    pool = os.environ.get(ebd_pool.POOL_ENV_VAR)
+    if pool and metadata:
+        e = ebd_pool.lease_processor(pool, userpriv, sandbox)
+    if e is None:
+        e = EbuildProcessor(userpriv, sandbox)
     active_ebp_list.append(e)
     return e
 
@@ -243,6 +268,81 @@ class InitializationError(Exception):
     pass
 
 
+class EclassFunctionCache(object):
+    """Disk cache of the preprocessed functions eclasses get preloaded as.
+
+    Entries are the ebd's ``declare -f`` dump of a preloaded eclass, keyed by
+    the eclass' directory and md5; they're thus already validated and
+    stripped of comments, and modified eclasses never match stale entries.
+
+    Since entries are eval'd by later daemons, possibly running as root, only
+    root may store entries, and entries (or a cache directory) writable by
+    anyone but root or the running user are ignored.
+    """
+
+    def __init__(self, location):
+        self.location = location
+
+    @staticmethod
+    def _trusted(st):
+        return st.st_uid in (0, os.getuid()) and not st.st_mode & 0022
+
+    def _path(self, eclass, data):
+        try:
+            chksum = get_handler('md5').long2str(data.md5)
+        except (AttributeError, EnvironmentError):
+            return None
+        # the same eclass may differ across repos, thus entries are kept
+        # per eclass dir
+        eclassdir = md5(os.path.dirname(data.path)).hexdigest()[:12]
+        return pjoin(self.location, '%s-%s-%s' % (eclass, eclassdir, chksum))
+
+    def get(self, eclass, data):
+        """Return the function definition for eclass, or None if not cached."""
+        path = self._path(eclass, data)
+        if path is None:
+            return None
+        try:
+            if not self._trusted(os.lstat(self.location)):
+                return None
+            with open(path, 'r') as f:
+                st = os.fstat(f.fileno())
+                if not stat.S_ISREG(st.st_mode) or not self._trusted(st):
+                    logger.warning(
+                        "ignoring eclass function cache entry %r due to its "
+                        "ownership or permissions", path)
+                    return None
+                return f.read()
+        except EnvironmentError:
+            return None
+
+    def get_store_paths(self, eclass, data):
+        """Return where the function for eclass should be dumped to.
+
+        Entries for prior versions of the eclass from the same eclass dir are
+        removed.
+
+        :return: tuple of the temp path to write to and the path to move it
+            to, or None if the entry exists or can't be stored
+        """
+        if os.getuid() != 0:
+            return None
+        path = self._path(eclass, data)
+        if path is None or os.path.exists(path):
+            return None
+        if not ensure_dirs(self.location, uid=0, gid=0, mode=0755, minimal=False):
+            return None
+        prefix = os.path.basename(path).rsplit('-', 1)[0]
+        try:
+            for x in os.listdir(self.location):
+                if x.rsplit('-', 1)[0] == prefix:
+                    os.unlink(pjoin(self.location, x))
+        except EnvironmentError:
+            return None
+        name = os.path.basename(path)
+        return pjoin(self.location, '.update.%i.%s' % (os.getpid(), name)), path
+
+
 class EbuildProcessor(object):
     """Abstraction of a running ebd instance.
 
@@ -251,6 +351,15 @@ class EbuildProcessor(object):
 
     __metaclass__ = WeakRefFinalizer
 
+    eclass_function_cache = EclassFunctionCache(e_const.ECLASS_FUNCTION_CACHE_PATH)
+    # leased from an ebd pool
+    pooled = False
+    # protocols to request from the ebd in order of preference; the line
+    # based text protocol is always the fallback.
+    protocols = ('framed',)
+    # default number of outstanding requests for iter_keys
+    pipeline_depth = 4
+
     def __init__(self, userpriv, sandbox):
         """
         :param sandbox: enables a sandboxed processor
@@ -282,6 +391,7 @@ class EbuildProcessor(object):
         cread, cwrite = os.pipe()
         dread, dwrite = os.pipe()
         self.__sandbox = False
+        self.__sandbox_log = None
 
         # since it's questionable which spawn method we'll use (if
         # sandbox fex), we ensure the bashrc is invalid.
@@ -356,9 +466,44 @@ class EbuildProcessor(object):
         else:
             self.write("no_sandbox")
         self.dont_export_vars = self.read().split()
+
+        self.protocol = 'text'
+        if self.protocols:
+            self.write("negotiate_protocol %s" % ' '.join(self.protocols))
+            reply = self.read().split()
+            if len(reply) != 2 or reply[0] != 'protocol':
+                raise InitializationError(
+                    "expected protocol negotiation reply from ebd, got %r" % (reply,))
+            self.protocol = reply[1]
         # locking isn't used much, but w/ threading this will matter
         self.unlock()
 
+    def _export_state(self):
+        """Return the python side state needed to drive this daemon."""
+        return {
+            'ebd': self.ebd,
+            'pid': self.pid,
+            'userpriv': self.__userpriv,
+            'sandbox': self.__sandbox,
+            'sandbox_log': self.__sandbox_log,
+            'dont_export_vars': self.dont_export_vars,
+            'preloaded_eclasses': dict(self._preloaded_eclasses),
+            'metadata_paths': self._metadata_paths,
+            'protocol': self.protocol,
+        }
+
+    def _import_state(self, state):
+        """Inverse of :obj:`_export_state`."""
+        self.ebd = state['ebd']
+        self.pid = state['pid']
+        self.__userpriv = state['userpriv']
+        self.__sandbox = state['sandbox']
+        self.__sandbox_log = state['sandbox_log']
+        self.dont_export_vars = state['dont_export_vars']
+        self._preloaded_eclasses = dict(state['preloaded_eclasses'])
+        self._metadata_paths = state['metadata_paths']
+        self.protocol = state['protocol']
+
     def run_phase(self, phase, env, tmpdir, logging=None,
                   additional_commands=None, sandbox=True):
         """Utility function, to initialize the processor for a phase.
@@ -519,7 +664,7 @@ class EbuildProcessor(object):
     def clear_preloaded_eclasses(self):
         if self.is_alive:
             self.write("clear_preloaded_eclasses")
-            if not self.expect("clear_preload_eclasses succeeded", flush=True):
+            if not self.expect("clear_preloaded_eclasses succeeded", flush=True):
                 self.shutdown_processor()
                 return False
         self._preloaded_eclasses.clear()
@@ -544,12 +689,62 @@ class EbuildProcessor(object):
             if data.path != self._preloaded_eclasses.get(eclass):
                 if self._preload_eclass(data.path, async=True):
                     self._preloaded_eclasses[eclass] = data.path
+                    self._dump_preloaded_eclass(eclass, data)
         if not async:
             return self._consume_async_expects()
         return True
 
-    def allow_eclass_caching(self):
+    def preload_cached_eclasses(self, cache):
+        """Preload all eclasses stored in the eclass function cache.
+
+        Done as a single transfer, rather than an ebd side read and syntax
+        check of each eclass.
+
+        :param cache: :obj:`pkgcore.ebuild.eclass_cache.base` instance
+        :return: boolean, True for success
+        """
+        bodies = []
+        loaded = []
+        for eclass, data in cache.eclasses.iteritems():
+            if data.path == self._preloaded_eclasses.get(eclass):
+                continue
+            body = self.eclass_function_cache.get(eclass, data)
+            if body is None:
+                continue
+            bodies.append(body)
+            bodies.append(
+                "\nPKGCORE_PRELOADED_ECLASSES[%s]=__preloaded_eclass_%s\n"
+                % (eclass, eclass))
+            loaded.append((eclass, data.path))
+        if not bodies:
+            return True
+        data = ''.join(bodies)
+        self.write("preload_eclass_bodies %i\n%s" % (len(data), data),
+                   append_newline=False)
+        if not self.expect("preload_eclass_bodies succeeded", flush=True):
+            return False
+        self._preloaded_eclasses.update(loaded)
+        return True
+
+    def _dump_preloaded_eclass(self, eclass, data):
+        """Have the ebd store a preloaded eclass in the eclass function cache."""
+        if self.__userpriv:
+            # entries get eval'd by root daemons; only they may write them
+            return
+        paths = self.eclass_function_cache.get_store_paths(eclass, data)
+        if paths is not None:
+            self.write("dump_preloaded_eclass %s %s %s" % ((eclass,) + paths))
+            self.expect("dump_preloaded_eclass done", async=True, flush=True)
+
+    def allow_eclass_caching(self, eclass_cache=None):
+        """Enable preloading eclasses once they've been inherited.
+
+        :param eclass_cache: if given, eclasses stored in the eclass function
+            cache are preloaded up front.
+        """
         self._eclass_caching = True
+        if eclass_cache is not None:
+            self.preload_cached_eclasses(eclass_cache)
 
     def disable_eclass_caching(self):
         self.clear_preloaded_eclasses()
@@ -725,14 +920,37 @@ class EbuildProcessor(object):
         if self.expect("metadata_path_received", flush=True):
             self._metadata_paths = paths
 
-    def _run_depend_like_phase(self, command, package_inst, eclass_cache,
-                               extra_commands={}):
-        self._ensure_metadata_paths(const.HOST_NONROOT_PATHS)
+    def set_eclass_paths(self, eclass_cache=None):
+        """Have the daemon resolve inherits itself rather than asking us.
 
+        Required for pipelining requests, since python can't answer an
+        inherit request while further requests are queued up.
+
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to
+            pull eclass paths from, None to revert to requesting inherits
+        :return: boolean, True for success; False if eclass_cache has eclasses
+            that aren't available as files
+        """
+        data = []
+        if eclass_cache is not None:
+            for eclass, ec in eclass_cache.eclasses.iteritems():
+                if ec.path is None:
+                    return False
+                data.append("%s %s\n" % (eclass, ec.path))
+        data = ''.join(data)
+        self.write("set_eclass_paths %i\n%s" % (len(data), data), append_newline=False)
+        return self.expect("eclass_paths_received", flush=True)
+
+    def _send_depend_like_phase(self, command, package_inst):
         env = expected_ebuild_env(package_inst, depends=True)
         data = self._generate_env_str(env)
         self.write("%s %i\n%s" % (command, len(data), data), append_newline=False)
 
+    def _run_depend_like_phase(self, command, package_inst, eclass_cache,
+                               extra_commands={}):
+        self._ensure_metadata_paths(const.HOST_NONROOT_PATHS)
+        self._send_depend_like_phase(command, package_inst)
+
         updates = None
         if self._eclass_caching:
             updates = set()
@@ -790,18 +1008,101 @@ class EbuildProcessor(object):
         :return: dict when successful, None when failed
         """
         metadata_keys = {}
+        self._run_depend_like_phase('gen_metadata', package_inst, eclass_cache,
+                                    _metadata_handlers(metadata_keys))
+        return metadata_keys
 
-        def receive_key(self, line):
-            line = line.split("=", 1)
-            if len(line) != 2:
-                raise FinishedProcessing(True)
-            metadata_keys[line[0]] = line[1]
+    def iter_keys(self, pkgs, eclass_cache, depth=None):
+        """Pipelined :obj:`get_keys` for multiple packages.
 
-        self._run_depend_like_phase('gen_metadata', package_inst, eclass_cache,
-                                    {"key": receive_key})
+        Up to depth requests are kept queued with the daemon, so it can
+        start sourcing the next ebuild while the results of the prior one
+        are being processed.
+
+        :param pkgs: iterable of :obj:`pkgcore.ebuild.ebuild_src.package`
+            instances to regenerate
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to use
+            for eclass access
+        :param depth: maximum number of outstanding requests, defaults to
+            :obj:`pipeline_depth`
+        :return: iterator of (pkg, metadata) pairs in the order of pkgs,
+            metadata being None if the ebd failed to generate it
+        """
+        if depth is None:
+            depth = self.pipeline_depth
+        if depth <= 1 or not self.set_eclass_paths(eclass_cache):
+            for pkg in pkgs:
+                yield pkg, self._get_keys_or_none(pkg, eclass_cache)
+            return
+
+        self._ensure_metadata_paths(const.HOST_NONROOT_PATHS)
+        self.lock()
+        # requests and async expects, in the order they were sent
+        outstanding = deque()
+        pkgs = iter(pkgs)
 
+        def send(pkg):
+            self._send_depend_like_phase('gen_metadata', pkg)
+            outstanding.append((pkg, None))
+
+        try:
+            try:
+                for pkg in islice(pkgs, depth):
+                    send(pkg)
+                while outstanding:
+                    pkg, expects = outstanding.popleft()
+                    if expects is not None:
+                        self._outstanding_expects = expects
+                        if not self._consume_async_expects():
+                            raise UnhandledCommand("expects out of alignment")
+                        continue
+                    metadata_keys = self._receive_keys(pkg)
+                    for pkg2 in islice(pkgs, 1):
+                        send(pkg2)
+                    if metadata_keys is not None and self._eclass_caching:
+                        inherited = metadata_keys.get("INHERITED", "").split()
+                        if inherited:
+                            # queue any new eclass preloads with the requests
+                            self.preload_eclasses(
+                                eclass_cache, limited_to=inherited, async=True)
+                            if self._outstanding_expects:
+                                outstanding.append((None, self._outstanding_expects))
+                                self._outstanding_expects = []
+                    yield pkg, metadata_keys
+            except GeneratorExit:
+                # consumer stopped early; collect what's still queued
+                while outstanding:
+                    pkg, expects = outstanding.popleft()
+                    if expects is not None:
+                        self._outstanding_expects = expects
+                        self._consume_async_expects()
+                    else:
+                        self._receive_keys(pkg)
+            self.set_eclass_paths()
+        except:
+            # the daemon's state is unknown at this point
+            self.shutdown_processor(ignore_keyboard_interrupt=True)
+            raise
+        finally:
+            self.unlock()
+
+    def _receive_keys(self, pkg):
+        metadata_keys = {}
+        val = self.generic_handler(additional_commands=_metadata_handlers(metadata_keys))
+        if not val:
+            logger.error("returned val from gen_metadata for %s was '%s'", pkg, str(val))
+            return None
         return metadata_keys
 
+    def _get_keys_or_none(self, pkg, eclass_cache):
+        try:
+            return self.get_keys(pkg, eclass_cache)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            logger.error("failed generating metadata for %s: %s", pkg, e)
+            return None
+
     # this basically handles all hijacks from the daemon, whether
     # confcache or portageq.
     def generic_handler(self, additional_commands=None):
@@ -869,6 +1170,24 @@ class EbuildProcessor(object):
             self.unlock()
             return v
 
+def _metadata_handlers(metadata_keys):
+    """Return the handlers filling metadata_keys from a gen_metadata run."""
+
+    def receive_key(self, line):
+        line = line.split("=", 1)
+        if len(line) != 2:
+            raise FinishedProcessing(True)
+        metadata_keys[line[0]] = line[1]
+
+    def receive_metadata(self, line):
+        # framed protocol; a single block of key=val lines
+        data = self.ebd_read.read(int(line))
+        for x in data.split("\n")[:-1]:
+            receive_key(self, x)
+
+    return {"key": receive_key, "metadata": receive_metadata}
+
+
 def inherit_handler(ecache, ebp, line, updates=None):
     """Callback for implementing inherit digging into eclass_cache.
 
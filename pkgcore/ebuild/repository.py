@@ -11,15 +11,17 @@ from functools import partial
 from itertools import imap, ifilterfalse
 import os
 import stat
+import weakref
 
 from snakeoil import klass
 from snakeoil.bash import iter_read_bash, read_dict
-from snakeoil.compatibility import intern, raise_from
+from snakeoil.compatibility import IGNORED_EXCEPTIONS, intern, raise_from
 from snakeoil.containers import InvertedContains
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import readlines
 from snakeoil.obj import make_kls
-from snakeoil.osutils import listdir_files, listdir_dirs, pjoin
+from snakeoil.osutils import (
+    ensure_dirs, listdir_files, listdir_dirs, pjoin, stat_mtime_long)
 from snakeoil.weakrefs import WeakValCache
 
 from pkgcore.config import ConfigHint, configurable
@@ -33,12 +35,16 @@ demandload(
     'locale',
     'operator:attrgetter',
     'random:shuffle',
-    'snakeoil.chksum:get_chksums',
+    'time',
+    'snakeoil.chksum:LazilyHashedPath,get_chksums',
     'snakeoil.data_source:local_source',
+    'snakeoil.process.spawn:atexit_register',
     'snakeoil.sequences:iflatten_instance',
     'pkgcore:fetch',
+    'pkgcore.cache:columns,errors@cache_errors,revdep_index,tree_index',
     'pkgcore.ebuild:cpv,digest,ebd,repo_objs,atom,restricts,profiles,processor',
     'pkgcore.ebuild:errors@ebuild_errors',
+    'pkgcore.ebuild.const:metadata_keys',
     'pkgcore.fs.livefs:sorted_scan',
     'pkgcore.log:logger',
     'pkgcore.package:errors@pkg_errors',
@@ -47,8 +53,61 @@ demandload(
 )
 
 
+def _flush_tree_index(repo_ref):
+    repo = repo_ref()
+    if repo is not None:
+        repo.flush_tree_index()
+
+
 class repo_operations(_repo_ops.operations):
 
+    def _get_regen_targets(self, changed_paths):
+        repo = self.repo
+        location = os.path.realpath(repo.location)
+        extension = repo.extension
+        ebuilds = set()
+        eclasses = set()
+
+        for path in changed_paths:
+            path = path.strip()
+            if not path:
+                continue
+            if path.endswith('.eclass'):
+                # eclasses may come from masters, match them by name
+                eclasses.add(os.path.basename(path)[:-len('.eclass')])
+                continue
+            if os.path.isabs(path):
+                path = os.path.relpath(os.path.realpath(path), location)
+            parts = os.path.normpath(path).split(os.path.sep)
+            if len(parts) != 3 or not parts[2].endswith(extension):
+                # nothing else influences generated metadata
+                continue
+            category, package, filename = parts
+            if filename.startswith(package + '-'):
+                ebuilds.add((category, package,
+                             filename[len(package) + 1:-len(extension)]))
+
+        if eclasses:
+            ebuilds.update(self._get_eclass_consumers(eclasses))
+
+        pkgs = []
+        removed = set()
+        for category, package, version in sorted(ebuilds):
+            if version in repo.versions.get((category, package), ()):
+                pkgs.append(repo.package_class(category, package, version))
+            else:
+                removed.add('%s/%s-%s' % (category, package, version))
+        return pkgs, removed
+
+    def _get_eclass_consumers(self, eclasses):
+        """Yield (category, package, version) for cache entries inheriting any of eclasses."""
+        cpvs = set()
+        for cache in self._get_caches():
+            cpvs.update(cache.eclass_index.consumers(eclasses))
+        for cpvstr in cpvs:
+            pkg = cpv.versioned_CPV(cpvstr)
+            yield pkg.category, pkg.package, pkg.fullver
+
     def _cmd_implementation_digests(self, domain, matches, observer,
                                     mirrors=False, force=False):
         manifest_config = self.repo.config.manifests
@@ -396,15 +455,85 @@ class _UnconfiguredTree(prototype.tree):
         try:
             return tuple(imap(intern, ifilterfalse(
                 self.false_categories.__contains__,
-                (x for x in listdir_dirs(self.base) if x[0:1] != "."))))
+                (x for x in self._indexed_listing('', listdir_dirs) if x[0:1] != "."))))
         except EnvironmentError as e:
             raise_from(KeyError("failed fetching categories: %s" % str(e)))
 
+    @klass.jit_attr
+    def _tree_index_cache(self):
+        for cache in self.cache:
+            if not cache.readonly and getattr(cache, 'tree_index_location', None):
+                return cache
+        return None
+
+    @klass.jit_attr
+    def tree_index(self):
+        """:obj:`pkgcore.cache.tree_index.TreeIndex` of the repo's directory listings
+
+        Loaded from the first writable cache able to persist it, None if
+        there isn't one.  Changes are written out by :obj:`flush_tree_index`,
+        invoked at exit.
+        """
+        cache = self._tree_index_cache
+        if cache is None:
+            return None
+        index = None
+        try:
+            index = tree_index.read_index(cache.tree_index_location, self.location)
+        except cache_errors.CacheError as e:
+            logger.debug("ignoring tree index: %s", e)
+        if index is None:
+            index = tree_index.TreeIndex()
+        self._tree_index_flush_registered = False
+        return index
+
+    def flush_tree_index(self):
+        """Persist the tree index if it was modified."""
+        index = getattr(self, '_tree_index', None)
+        if not isinstance(index, tree_index.TreeIndex) or not index.modified:
+            return
+        cache = self._tree_index_cache
+        ensure_dirs(os.path.dirname(cache.tree_index_location), mode=0775)
+        try:
+            tree_index.write_index(
+                cache.tree_index_location, index, self.location, cache._ensure_access)
+        except cache_errors.CacheError as e:
+            logger.debug("failed writing tree index: %s", e)
+
+    def _indexed_listing(self, relpath, scan):
+        """Return the listing of a directory, from the tree index if it's current.
+
+        :param relpath: path of the directory relative to the repo
+        :param scan: callable taking the directory's path, returning its listing
+        """
+        path = pjoin(self.base, relpath)
+        index = self.tree_index
+        if index is None:
+            return tuple(scan(path))
+        mtime = stat_mtime_long(path)
+        entry = index.get(relpath)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        names = tuple(scan(path))
+        if entry is not None:
+            # drop the listings of subdirectories that are gone
+            for name in set(entry[1]).difference(names):
+                index.discard(pjoin(relpath, name))
+        if time.time() - mtime < 2:
+            # modifications within the mtime's resolution would go unnoticed
+            mtime = None
+        index.add(relpath, mtime, names)
+        if not self._tree_index_flush_registered:
+            atexit_register(_flush_tree_index, weakref.ref(self))
+            self._tree_index_flush_registered = True
+        return names
+
     def _get_packages(self, category):
-        cpath = pjoin(self.base, category.lstrip(os.path.sep))
+        category = category.lstrip(os.path.sep)
         try:
             return tuple(ifilterfalse(
-                self.false_packages.__contains__, listdir_dirs(cpath)))
+                self.false_packages.__contains__,
+                self._indexed_listing(category, listdir_dirs)))
         except EnvironmentError as e:
             if e.errno == errno.ENOENT:
                 if category in self.categories:
@@ -412,17 +541,20 @@ class _UnconfiguredTree(prototype.tree):
                     return ()
             raise_from(KeyError(
                 "failed fetching packages for category %s: %s" %
-                (pjoin(self.base, category.lstrip(os.path.sep)), str(e))))
+                (pjoin(self.base, category), str(e))))
 
     def _get_versions(self, catpkg):
-        cppath = pjoin(self.base, catpkg[0], catpkg[1])
         pkg = catpkg[-1] + "-"
         lp = len(pkg)
         extension = self.extension
         ext_len = -len(extension)
+
+        def scan(path):
+            return (x[lp:ext_len] for x in listdir_files(path)
+                    if x[ext_len:] == extension and x[:lp] == pkg)
+
         try:
-            ret = tuple(x[lp:ext_len] for x in listdir_files(cppath)
-                        if x[ext_len:] == extension and x[:lp] == pkg)
+            ret = self._indexed_listing(pjoin(catpkg[0], catpkg[1]), scan)
             if any(('scm' in x or '-try' in x) for x in ret):
                 if not self.ignore_paludis_versioning:
                     for x in ret:
@@ -489,6 +621,170 @@ class _UnconfiguredTree(prototype.tree):
                 return allow_missing, {}
             raise
 
+    def metadata_columns(self, keys=None):
+        """Load the metadata of every pkg into columns for bulk queries.
+
+        Values come straight from the first cache holding a valid entry for
+        a pkg; pkg objects are only created for those lacking one, their
+        metadata being regenerated.
+
+        :param keys: metadata keys to load, defaults to all keys cache
+            entries hold
+        :return: :obj:`pkgcore.cache.columns.MetadataColumns` instance
+        """
+        if keys is None:
+            # cache entries carry INHERITED as _eclasses_
+            keys = [x for x in metadata_keys if x != 'INHERITED']
+        store = columns.MetadataColumns(keys)
+        caches = [x for x in self.cache if x is not None]
+        for (cat, pkg), vers in self.versions.iteritems():
+            for ver in vers:
+                cpvstr = "%s/%s-%s" % (cat, pkg, ver)
+                ebuild_hash = LazilyHashedPath(
+                    pjoin(self.base, cat, pkg, "%s-%s%s" % (pkg, ver, self.extension)))
+                for cache in caches:
+                    try:
+                        data = cache[cpvstr]
+                    except KeyError:
+                        continue
+                    except cache_errors.CacheError as e:
+                        logger.warning("caught cache error: %s", e)
+                        continue
+                    if cache.validate_entry(data, ebuild_hash, self.eclass_cache):
+                        break
+                else:
+                    try:
+                        data = self.package_class._get_metadata(
+                            self.package_class(cat, pkg, ver))
+                    except IGNORED_EXCEPTIONS:
+                        raise
+                    except Exception as e:
+                        store.failures[cpvstr] = e
+                        continue
+                store.append(cpvstr, data)
+        return store
+
+    # pkg attributes the revdep index covers
+    _revdep_attrs = ('depends', 'rdepends', 'post_rdepends')
+
+    @klass.jit_attr
+    def _revdep_index_cache(self):
+        for cache in self.cache:
+            if not cache.readonly and getattr(cache, 'revdep_index_location', None):
+                return cache
+        return None
+
+    @klass.jit_attr
+    def revdep_index(self):
+        """:obj:`pkgcore.cache.revdep_index.RevdepIndex` of the repo's pkgs
+
+        Loaded from the first writable cache able to persist it, if any;
+        entries of pkgs whose ebuild or inherited eclasses were modified
+        since are regenerated and the result persisted.
+        """
+        cache = self._revdep_index_cache
+        index = None
+        if cache is not None:
+            try:
+                index = revdep_index.read_index(cache.revdep_index_location)
+            except cache_errors.CacheError as e:
+                logger.debug("ignoring revdep index: %s", e)
+        if index is None:
+            index = revdep_index.RevdepIndex()
+
+        existing = set()
+        now = time.time()
+        for (cat, pkg), vers in self.versions.iteritems():
+            for ver in vers:
+                cpv = "%s/%s-%s" % (cat, pkg, ver)
+                path = pjoin(self.base, cat, pkg, "%s-%s%s" % (pkg, ver, self.extension))
+                try:
+                    mtime = stat_mtime_long(path)
+                except EnvironmentError:
+                    continue
+                existing.add(cpv)
+                entry = index.get(cpv)
+                if entry is not None and entry[0] is not None:
+                    eclasses = (x.rsplit(':', 1)[0] for x in entry[0].split(' ')[1:])
+                    if entry[0] == self._revdep_stamp(mtime, eclasses):
+                        continue
+                self._index_revdeps(index, (cat, pkg, ver), mtime, now)
+        for cpv in [x for x in index if x not in existing]:
+            index.discard(cpv)
+
+        if cache is not None and index.modified:
+            ensure_dirs(os.path.dirname(cache.revdep_index_location), mode=0775)
+            try:
+                revdep_index.write_index(
+                    cache.revdep_index_location, index, cache._ensure_access)
+            except cache_errors.CacheError as e:
+                logger.debug("failed writing revdep index: %s", e)
+        return index
+
+    def _revdep_stamp(self, mtime, eclasses):
+        """Return a string identifying the state of a pkg's dependencies.
+
+        :param mtime: mtime of the pkg's ebuild
+        :param eclasses: eclasses the pkg inherits
+        :return: the stamp, or None if an eclass is missing
+        """
+        l = [str(mtime)]
+        known = self.eclass_cache.eclasses
+        for eclass in eclasses:
+            data = known.get(eclass)
+            if data is None:
+                return None
+            l.append("%s:%i" % (eclass, data.mtime))
+        return ' '.join(l)
+
+    def _index_revdeps(self, index, cpv, mtime, now):
+        cpvstr = "%s/%s-%s" % cpv
+        try:
+            pkg = self.package_class(*cpv)
+            keys = [x.key for attr in self._revdep_attrs
+                    for x in iflatten_instance(getattr(pkg, attr), atom.atom)]
+            if now - mtime < 2:
+                # modifications within the mtime's resolution would go unnoticed
+                stamp = None
+            else:
+                stamp = self._revdep_stamp(mtime, pkg.inherited)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            # pkgs failing to load can't match; retry them next time
+            logger.debug("failed indexing dependencies of %s: %s", cpvstr, e)
+            keys = ()
+            stamp = None
+        index.add(cpvstr, stamp, keys)
+
+    def find_revdeps(self, restrict):
+        """Find the pkgs a dependency restriction may match using the revdep index.
+
+        :param restrict: a :obj:`pkgcore.restrictions.packages.PackageRestriction`
+            matching a dependency attribute against a
+            :obj:`pkgcore.ebuild.restricts.DependencyMatch`, as generated by
+            ``pquery --restrict-revdep`` and ``--restrict-revdep-pkgs``
+        :return: frozenset of cpv strings of pkgs depending on the keys
+            the restriction may match, or None if restrict can't be resolved
+            via the index
+        """
+        if (not isinstance(restrict, packages.PackageRestriction) or
+                restrict.negate or restrict.attr not in self._revdep_attrs):
+            return None
+        child = restrict.restriction
+        if not isinstance(child, restricts.DependencyMatch) or child.negate:
+            return None
+        return self.revdep_index.revdeps(child.keys)
+
+    def _identify_candidates(self, restrict, sorter):
+        # dependency restrictions are resolved via the revdep index rather
+        # than loading every pkg's metadata
+        candidates = self._identify_indexed_candidates(
+            restrict, self._revdep_attrs, self.find_revdeps)
+        if candidates is None:
+            return prototype.tree._identify_candidates(self, restrict, sorter)
+        return candidates
+
     def __repr__(self):
         return "<ebuild %s location=%r @%#8x>" % (
             self.__class__.__name__, self.base, id(self))
@@ -532,13 +828,52 @@ class _RegenOpHelper(object):
     def __init__(self, repo, force=False, eclass_caching=True):
         self.force = force
         self.eclass_caching = eclass_caching
-        self.ebp = processor.request_ebuild_processor()
+        self.eclass_cache = repo.eclass_cache
+        self.ebp = processor.request_ebuild_processor(metadata=True)
         if eclass_caching:
-            self.ebp.allow_eclass_caching()
+            self.ebp.allow_eclass_caching(repo.eclass_cache)
 
     def __call__(self, pkg):
         return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
 
+    def iter_regen(self, pkgs):
+        """Regenerate pkgs, keeping multiple requests queued with the processor.
+
+        :return: iterator of (pkg, exception) pairs for packages that failed
+        """
+        failures = []
+
+        def stale_pkgs():
+            for pkg in pkgs:
+                try:
+                    if not self.force and pkg._parent._get_cached_metadata(pkg) is not None:
+                        continue
+                    if not pkg.eapi.is_supported:
+                        continue
+                except IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    failures.append((pkg, e))
+                    continue
+                yield pkg
+
+        for pkg, mydata in self.ebp.iter_keys(stale_pkgs(), self.eclass_cache):
+            for x in failures:
+                yield x
+            del failures[:]
+            if mydata is None:
+                yield pkg, pkg_errors.MetadataException(
+                    pkg, 'metadata', 'failed generating metadata')
+                continue
+            try:
+                pkg._parent._store_metadata(pkg, mydata)
+            except IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                yield pkg, e
+        for x in failures:
+            yield x
+
     def finish(self):
         if self.eclass_caching:
             self.ebp.disable_eclass_caching()
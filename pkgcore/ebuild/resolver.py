@@ -103,6 +103,7 @@ class empty_tree_merge_plan(plan.merge_plan):
         plan.merge_plan.__init__(self, dbs, *args, **kwds)
         # XXX *cough*, hack.
         self.default_dbs = multiplex.tree(
+            parallelism=self.repo_parallelism,
             *[x for x in self.all_raw_dbs if not x.livefs])
 
 
@@ -8,13 +8,16 @@
 atom version restrict
 """
 
-__all__ = ("VersionMatch",)
+__all__ = ("VersionMatch", "DependencyMatch")
 
+from snakeoil.demandload import demandload
 from snakeoil.klass import generic_equality
 
 from pkgcore.ebuild import cpv, errors
 from pkgcore.restrictions import packages, restriction, values
 
+demandload('pkgcore.ebuild:atom@atom_mod')
+
 
 # TODO: change values.EqualityMatch so it supports le, lt, gt, ge, eq,
 # ne ops, and convert this to it.
@@ -130,6 +133,27 @@ class VersionMatch(restriction.base):
         return hash((self.droprev, self.ver, self.rev, self.negate, self.vals))
 
 
+class DependencyMatch(values.FlatteningRestriction):
+    """Match depsets holding an atom the nested restriction matches.
+
+    :ivar keys: frozenset of the cat/pkg keys of the atoms the nested
+        restriction is able to match; repos with a reverse dependency index
+        use them to skip pkgs not depending on any of them
+    """
+
+    __slots__ = ('keys',)
+    __attr_comparison__ = values.FlatteningRestriction.__attr_comparison__ + ('keys',)
+
+    def __init__(self, keys, childrestriction, negate=False):
+        """
+        :param keys: cat/pkg keys of the atoms childrestriction can match
+        :param childrestriction: restriction applied to each atom
+        """
+        values.FlatteningRestriction.__init__(
+            self, atom_mod.atom, values.AnyMatch(childrestriction), negate=negate)
+        object.__setattr__(self, 'keys', frozenset(keys))
+
+
 class SlotDep(packages.PackageRestriction):
 
     __slots__ = ()
@@ -454,14 +454,23 @@ class ProtectOwned(FileCollision):
         self.vdb = vdb
 
     def collision(self, colliding):
-        real_pkgs = (pkg for repo in self.vdb for pkg in repo if pkg.package_is_real)
         collisions = {}
-
-        # TODO: worth parallelizing this vdb scanning?
-        for pkg in real_pkgs:
-            pkg_file_collisions = pkg.contents.intersection(colliding)
-            if pkg_file_collisions:
-                collisions[pkg.cpvstr] = pkg_file_collisions
+        locations = None
+
+        for repo in self.vdb:
+            index = getattr(repo, 'owners_index', None)
+            if index is None:
+                # no owners index available, scan the repo
+                for pkg in repo:
+                    if pkg.package_is_real:
+                        pkg_file_collisions = pkg.contents.intersection(colliding)
+                        if pkg_file_collisions:
+                            collisions[pkg.cpvstr] = pkg_file_collisions
+                continue
+            if locations is None:
+                locations = {x.location: x for x in colliding}
+            for cpv, paths in index.owners(locations).iteritems():
+                collisions[cpv] = [locations[x] for x in paths]
 
         if collisions:
             pkg_collisions = [
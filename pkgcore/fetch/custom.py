@@ -8,7 +8,10 @@ fetcher class that pulls files via executing another program to do the fetching
 __all__ = ("MalformedCommand", "fetcher",)
 
 import os
+import shutil
 import sys
+import tempfile
+import threading
 
 from snakeoil.osutils import ensure_dirs, pjoin
 from snakeoil.compatibility import raise_from
@@ -33,6 +36,11 @@ class fetcher(base.fetcher):
          'distdir': 'str', 'command': 'str', 'resume_command': 'str'},
         allow_unknowns=True)
 
+    # held by whichever fetch command is writing to the terminal; concurrent
+    # fetches capture their output instead, replaying it once they're done so
+    # it isn't interleaved
+    _terminal_lock = threading.Lock()
+
     def __init__(self, distdir, command, resume_command=None,
                  required_chksums=None, userpriv=True, attempts=10,
                  readonly=False, **extra_env):
@@ -150,7 +158,7 @@ class fetcher(base.fetcher):
                     # verify portion of the loop handles this. iow,
                     # don't trust their exit code. trust our chksums
                     # instead.
-                    spawn_bash(command % {"URI": u, "FILE": filename}, **extra)
+                    self._spawn(command % {"URI": u, "FILE": filename}, extra)
                 attempts -= 1
             assert last_exc is not None
             raise last_exc[0], last_exc[1], last_exc[2]
@@ -159,6 +167,23 @@ class fetcher(base.fetcher):
             # ran out of uris
             raise errors.FetchFailed(fp, "Ran out of urls to fetch from")
 
+    def _spawn(self, command, extra):
+        """Run a fetch command, without interleaving its output with others."""
+        if self._terminal_lock.acquire(False):
+            try:
+                spawn_bash(command, **extra)
+            finally:
+                self._terminal_lock.release()
+            return
+        with tempfile.TemporaryFile() as log:
+            spawn_bash(command, fd_pipes={0: 0, 1: log.fileno(), 2: log.fileno()},
+                       **extra)
+            log.seek(0)
+            with self._terminal_lock:
+                sys.stdout.flush()
+                shutil.copyfileobj(log, sys.stdout)
+                sys.stdout.flush()
+
     def get_path(self, fetchable):
         fp = pjoin(self.distdir, fetchable.filename)
         if self._verify(fp, fetchable) is None:
@@ -0,0 +1,131 @@
+# License: GPL2/BSD
+
+"""
+background fetching of the distfiles of upcoming pkgs
+
+While one pkg builds, the distfiles of the pkgs following it in the plan
+are fetched on worker threads, so that by the time a pkg's turn comes its
+files are usually already verified.  Pkgs sharing a distfile are never
+fetched concurrently.
+"""
+
+__all__ = ("prefetcher",)
+
+import threading
+
+from snakeoil.sequences import iflatten_instance
+
+from pkgcore.fetch import fetchable
+
+
+class prefetcher(object):
+    """Fetch the distfiles of a sequence of pkgs ahead of their use.
+
+    Pkgs are fetched in the order given, at most ``lookahead`` of them past
+    the furthest one waited on so far.
+    """
+
+    def __init__(self, pkgs, fetch, jobs=1, lookahead=None):
+        """
+        :param pkgs: sequence of pkgs, in the order they'll be waited on
+        :param fetch: callable invoked on a worker thread with a pkg to fetch
+            its distfiles; what it returns is handed back by :obj:`wait`
+        :param jobs: max number of pkgs fetched concurrently
+        :param lookahead: max number of pkgs fetched past the furthest one
+            waited on; if None, all pkgs are fetched as soon as possible
+        """
+        self.pkgs = tuple(pkgs)
+        self._fetch = fetch
+        self.jobs = max(jobs, 1)
+        self.lookahead = lookahead
+        self._indexes = {}
+        for idx, pkg in enumerate(self.pkgs):
+            self._indexes.setdefault(pkg, idx)
+        self._files = [
+            frozenset(x.filename for x in
+                      iflatten_instance(getattr(pkg, 'fetchables', ()), fetchable))
+            for pkg in self.pkgs]
+        self._cond = threading.Condition()
+        self._pending = range(len(self.pkgs))
+        self._active = set()
+        self._results = {}
+        self._position = 0
+        self._closed = False
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads."""
+        for x in xrange(min(self.jobs, len(self.pkgs))):
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def shutdown(self):
+        """Stop the workers once they're done with the pkgs they're fetching."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _next(self):
+        """Return the index of the next pkg that can be fetched, or None."""
+        limit = len(self.pkgs)
+        if self.lookahead is not None:
+            limit = self._position + self.lookahead + 1
+        for idx in self._pending:
+            if idx >= limit:
+                break
+            if self._files[idx].isdisjoint(self._active):
+                return idx
+        return None
+
+    def _worker(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while True:
+                    if self._closed or not self._pending:
+                        return
+                    idx = self._next()
+                    if idx is not None:
+                        break
+                    cond.wait()
+                self._pending.remove(idx)
+                self._active.update(self._files[idx])
+            try:
+                result = (True, self._fetch(self.pkgs[idx]))
+            except Exception as e:
+                result = (False, e)
+            with cond:
+                self._active.difference_update(self._files[idx])
+                self._results[idx] = result
+                cond.notify_all()
+
+    def wait(self, pkg):
+        """Block until pkg is fetched.
+
+        If the workers were never started or were shut down prior to
+        reaching pkg, it's fetched in the calling thread.
+
+        :return: what the fetch callable returned for pkg; an exception it
+            raised is reraised instead
+        """
+        idx = self._indexes[pkg]
+        cond = self._cond
+        with cond:
+            if idx > self._position:
+                self._position = idx
+                cond.notify_all()
+            # waiting w/out a timeout blocks signals, thus KeyboardInterrupt
+            while idx not in self._results:
+                if (idx in self._pending and (self._closed or not self._threads)
+                        and self._files[idx].isdisjoint(self._active)):
+                    self._pending.remove(idx)
+                    break
+                cond.wait(0.1)
+            else:
+                success, result = self._results.pop(idx)
+                if not success:
+                    raise result
+                return result
+        return self._fetch(pkg)
@@ -2,7 +2,7 @@
 # License: GPL2/BSD
 
 __all__ = (
-    "null_output", "formatter_output", "file_handle_output",
+    "null_output", "formatter_output", "threadsafe_output", "file_handle_output",
     "phase_observer", "build_observer", "repo_observer",
     "decorate_build_method",
 )
@@ -76,6 +76,42 @@ class formatter_output(null_output):
         self._out.write(_convert("debug: " + msg, args, kwds))
 
 
+class threadsafe_output(null_output):
+    """Serialize access to an output, optionally prefixing each message.
+
+    :param output: output to wrap
+    :param lock: lock to hold while writing, shared amongst outputs writing
+        to the same destination
+    :param prefix: string to prepend to messages, identifying their source
+    """
+
+    def __init__(self, output, lock=None, prefix=''):
+        self._output = output
+        if lock is None:
+            lock = threading.Lock()
+        self._lock = lock
+        self._prefix = prefix.replace('%', '%%')
+
+    def _invoke(self, attr, msg, args, kwds):
+        with self._lock:
+            getattr(self._output, attr)(self._prefix + msg, *args, **kwds)
+
+    def error(self, msg, *args, **kwds):
+        self._invoke('error', msg, args, kwds)
+
+    def info(self, msg, *args, **kwds):
+        self._invoke('info', msg, args, kwds)
+
+    def warn(self, msg, *args, **kwds):
+        self._invoke('warn', msg, args, kwds)
+
+    def write(self, msg, *args, **kwds):
+        self._invoke('write', msg, args, kwds)
+
+    def debug(self, msg, *args, **kwds):
+        self._invoke('debug', msg, args, kwds)
+
+
 class file_handle_output(null_output):
 
     def __init__(self, out):
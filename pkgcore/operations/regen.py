@@ -5,11 +5,25 @@ from snakeoil import compatibility
 from snakeoil.demandload import demandload
 
 demandload(
+    'multiprocessing',
+    'pkgcore.ebuild:processor',
     'pkgcore.util.thread_pool:map_async',
 )
 
 
 def regen_iter(iterable, regen_func, observer, is_thread=False):
+    iter_regen = getattr(regen_func, 'iter_regen', None)
+    if iter_regen is not None:
+        # helper handles the packages itself, reporting back failures
+        try:
+            for x, e in iter_regen(iterable):
+                observer.error("caught exception %s while processing %s", e, x)
+        except compatibility.IGNORED_EXCEPTIONS as e:
+            if isinstance(e, KeyboardInterrupt):
+                return
+            raise
+        return
+
     for x in iterable:
         try:
             regen_func(x)
@@ -21,8 +35,62 @@ def regen_iter(iterable, regen_func, observer, is_thread=False):
             observer.error("caught exception %s while processing %s", e, x)
 
 
-def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
+def _regen_process(repo, queue, get_helper, observer):
+    # any ebuild processors known at this point are the parent's
+    processor.forget_all_processors()
+    helper = get_helper()
+    try:
+        regen_iter(
+            (repo.package_class(*cpv) for cpv in iter(queue.get, None)),
+            helper, observer)
+    finally:
+        f = getattr(helper, 'finish', None)
+        if f is not None:
+            f()
+        processor.shutdown_all_processors()
+
+
+def regen_processes(repo, pkgs, get_helper, observer, processes):
+    """Regenerate packages using a pool of forked worker processes.
+
+    Each worker gets its own helper (and thus its own ebuild processors),
+    and writes its results directly to the repo's caches.
+    """
+    queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_regen_process, args=(repo, queue, get_helper, observer))
+        for x in xrange(processes)]
+    try:
+        for x in workers:
+            x.start()
+        for pkg in pkgs:
+            queue.put((pkg.category, pkg.package, pkg.fullver))
+        for x in workers:
+            queue.put(None)
+        for x in workers:
+            x.join()
+    except compatibility.IGNORED_EXCEPTIONS:
+        for x in workers:
+            if x.is_alive():
+                x.terminate()
+        raise
+
+    for x in workers:
+        if x.exitcode:
+            observer.error(
+                "regen worker %s exited with status %s", x.pid, x.exitcode)
+
+
+def regen_repository(repo, observer, threads=1, pkg_attr='keywords',
+                     jobs_mode='thread', pkgs=None, **options):
+    """Regenerate metadata for a repo.
+
+    :param pkgs: if not None, the subset of the repo's packages to regen
+    """
     helpers = []
+    if pkgs is None:
+        pkgs = repo
 
     def _get_repo_helper():
         if not hasattr(repo, '_regen_operation_helper'):
@@ -32,12 +100,26 @@ def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
         helpers.append(helper)
         return helper
 
+    if threads > 1 and jobs_mode == 'process':
+        # workers write directly to the caches, something only caches that
+        # don't queue up updates in memory can handle
+        caches = getattr(repo, 'cache', ())
+        if hasattr(caches, 'commit'):
+            caches = [caches]
+        if any(not (x.readonly or x.autocommits) for x in caches):
+            observer.warn(
+                "repo %s has caches that don't autocommit, "
+                "falling back to thread based regen", repo)
+            jobs_mode = 'thread'
+
     if threads == 1:
-        regen_iter(iter(repo), _get_repo_helper(), observer)
+        regen_iter(iter(pkgs), _get_repo_helper(), observer)
+    elif jobs_mode == 'process':
+        regen_processes(repo, pkgs, _get_repo_helper, observer, threads)
     else:
         def get_args():
             return (_get_repo_helper(), observer, True)
-        map_async(repo, regen_iter, per_thread_args=get_args)
+        map_async(pkgs, regen_iter, threads=threads, per_thread_args=get_args)
 
     for helper in helpers:
         f = getattr(helper, 'finish', None)
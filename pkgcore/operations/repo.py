@@ -222,36 +222,69 @@ class operations(sync_operations):
         return self._cmd_implementation_configure(
             self.repository, pkg, self._get_observer(observer))
 
-    def _cmd_implementation_clean_cache(self):
-        """ Clean stale cache entries up """
+    def _cmd_implementation_clean_cache(self, removed=None):
+        """ Clean stale cache entries up
+
+        :param removed: if not None, the cpvs known to be gone, otherwise
+            the caches are compared against the whole repo
+        """
         caches = [x for x in self._get_caches() if not x.readonly]
         if not caches:
             return
+        if removed is not None:
+            for cache in caches:
+                for p in removed:
+                    if p in cache:
+                        del cache[p]
+            return
         pkgs = frozenset(x.cpvstr for x in self.repo)
         for cache in caches:
             cache_pkgs = frozenset(cache)
             for p in cache_pkgs - pkgs:
                 del cache[p]
 
+    def _get_regen_targets(self, changed_paths):
+        """Map changed paths to the packages needing regen.
+
+        Repos that are able to determine which packages a set of changed
+        files affects override this.
+
+        :return: tuple of the packages to regen and the cpvs to drop from the
+            caches; (None, None) forces a full regen.
+        """
+        return None, None
+
     @_operations_mod.is_standalone
-    def _cmd_api_regen_cache(self, observer=None, threads=1, **options):
+    def _cmd_api_regen_cache(self, observer=None, threads=1,
+                             changed_paths=None, **options):
         if getattr(self, '_regen_disable_threads', False):
             threads = 1
         cache = getattr(self.repo, 'cache', None)
         if not cache and not options.get('force', False):
             return
-        sync_rate = getattr(cache, 'sync_rate', None)
+        sync_rates = [(x, x.sync_rate) for x in self._get_caches()
+                      if getattr(x, 'sync_rate', None) is not None]
+        if threads == 1 or options.get('jobs_mode') != 'process':
+            # keep an already valid eclass index current rather than having
+            # the regen invalidate it.
+            for x in self._get_caches():
+                if not x.readonly:
+                    x.load_eclass_index(rebuild=False)
         try:
-            if sync_rate is not None:
-                cache.set_sync_rate(1000000)
+            for x, _sync_rate in sync_rates:
+                x.set_sync_rate(1000000)
+            pkgs = removed = None
+            if changed_paths is not None:
+                pkgs, removed = self._get_regen_targets(changed_paths)
             ret = regen.regen_repository(
                 self.repo,
-                self._get_observer(observer), threads=threads, **options)
-            self._cmd_implementation_clean_cache()
+                self._get_observer(observer), threads=threads, pkgs=pkgs,
+                **options)
+            self._cmd_implementation_clean_cache(removed)
             return ret
         finally:
-            if sync_rate is not None:
-                cache.set_sync_rate(sync_rate)
+            for x, sync_rate in sync_rates:
+                x.set_sync_rate(sync_rate)
             self.repo.operations.run_if_supported("flush_cache")
 
     def _get_caches(self):
@@ -28,12 +28,32 @@ class EclassConsumerSet(VersionedInstalled):
         self.eclasses = frozenset(eclasses)
 
     def __iter__(self):
+        consumers = set()
+        unindexed = []
+        for repo in self.repos:
+            caches = getattr(repo, 'cache', ())
+            if hasattr(caches, 'commit'):
+                caches = (caches,)
+            # only use indexes already persisted, building one means scanning
+            # the entire cache which is slower than checking installed pkgs.
+            indexes = [x.eclass_index for x in caches
+                       if hasattr(x, 'load_eclass_index') and
+                       x.load_eclass_index(rebuild=False)]
+            if not indexes:
+                unindexed.append(repo)
+            for index in indexes:
+                consumers.update(index.consumers(self.eclasses))
+
         for atom in VersionedInstalled.__iter__(self):
+            if not unindexed and atom.cpvstr not in consumers:
+                continue
             pkgs = self.repos.match(atom)
             if not pkgs:
                 # pkg is installed but no longer in any repo, just ignore it.
                 continue
             assert len(pkgs) == 1, 'I do not know what I am doing: %r' % (pkgs,)
             pkg = pkgs[0]
-            if self.eclasses.isdisjoint(pkg.data.get('_eclasses_', ())):
+            if pkg.cpvstr in consumers or (
+                    pkg.repo in unindexed and
+                    not self.eclasses.isdisjoint(getattr(pkg, 'inherited', ()))):
                 yield atom
@@ -3,6 +3,8 @@
 
 __all__ = ("nodeps_repo", "caching_repo")
 
+from collections import OrderedDict
+
 from snakeoil.iterables import caching_iter, iter_sort
 from snakeoil.klass import GetAttrProxy
 
@@ -63,29 +65,77 @@ class caching_repo(object):
     in memory till the cache is cleared.  General use, not usually what
     you want- if you're making a lot of random queries that are duplicates
     (resolver does this for example), caching helps.
+
+    To bound that cost, a limit on the number of cached queries and/or on
+    the number of pkg instances they hold can be set; least recently used
+    queries are evicted once either is exceeded.
     """
 
     operations_kls = operations_proxy
 
-    def __init__(self, db, strategy):
+    def __init__(self, db, strategy, max_entries=None, max_pkgs=None):
         """
         :param db: an instance supporting the repository protocol to cache
           queries from.
         :param strategy: forced sorting strategy for results.  If you don't
           need sorting, pass in iter.
+        :param max_entries: if given, max number of queries to cache
+        :param max_pkgs: if given, max number of pkg instances cached queries
+          may hold; this is the cache's memory budget
         """
         self.__db__ = db
         self.__strategy__ = strategy
-        self.__cache__ = {}
+        self.__max_entries__ = max_entries
+        self.__max_pkgs__ = max_pkgs
+        # least recently used first
+        self.__cache__ = OrderedDict()
+        # pkg count of each query as of its last use, and their sum
+        self.__costs__ = {}
+        self.__total_cost__ = 0
+        self.__last__ = None
+        self.__stats__ = dict.fromkeys(('hits', 'misses', 'evictions'), 0)
+
+    def _update_cost(self, restrict):
+        # results are loaded on demand, thus a query's cost grows after
+        # it's handed out; track it as of its last use
+        cost = len(self.__cache__[restrict].cached_list)
+        self.__total_cost__ += cost - self.__costs__.get(restrict, 0)
+        self.__costs__[restrict] = cost
 
     def match(self, restrict):
-        v = self.__cache__.get(restrict)
-        if v is None:
-            v = self.__cache__[restrict] = \
-                caching_iter(
-                    self.__db__.itermatch(restrict, sorter=self.__strategy__))
+        cache = self.__cache__
+        last = self.__last__
+        if last is not None and last in cache:
+            self._update_cost(last)
+        self.__last__ = restrict
+
+        v = cache.pop(restrict, None)
+        if v is not None:
+            self.__stats__['hits'] += 1
+            cache[restrict] = v
+            self._update_cost(restrict)
+            self._evict()
+            return v
+        self.__stats__['misses'] += 1
+        v = cache[restrict] = \
+            caching_iter(
+                self.__db__.itermatch(restrict, sorter=self.__strategy__))
+        self.__costs__[restrict] = 0
+        self._evict()
         return v
 
+    def _evict(self):
+        cache = self.__cache__
+        max_entries, max_pkgs = self.__max_entries__, self.__max_pkgs__
+        # the newest entry is never evicted
+        while len(cache) > 1 and (
+                (max_entries is not None and len(cache) > max_entries) or
+                (max_pkgs is not None and self.__total_cost__ > max_pkgs)):
+            restrict = next(iter(cache))
+            del cache[restrict]
+            self.__total_cost__ -= self.__costs__.pop(restrict)
+            self.__stats__['evictions'] += 1
+
     def itermatch(self, restrict):
         return iter(self.match(restrict))
 
@@ -93,6 +143,16 @@ class caching_repo(object):
 
     def clear(self):
         self.__cache__.clear()
+        self.__costs__.clear()
+        self.__total_cost__ = 0
+        self.__last__ = None
+
+    def cache_stats(self):
+        """Return a dict of the cache's hits, misses, evictions, entries and pkgs."""
+        d = dict(self.__stats__)
+        d['entries'] = len(self.__cache__)
+        d['pkgs'] = self.__total_cost__
+        return d
 
 
 class multiplex_sorting_repo(object):
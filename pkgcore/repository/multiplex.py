@@ -21,7 +21,10 @@ from pkgcore.config import configurable
 from pkgcore.operations import repo as repo_interface
 from pkgcore.repository import prototype, errors
 
-demandload('os')
+demandload(
+    'os',
+    'pkgcore.util:thread_pool',
+)
 
 
 class operations(repo_interface.operations_proxy):
@@ -63,9 +66,9 @@ class operations(repo_interface.operations_proxy):
         return ret
 
 
-@configurable({'repositories': 'refs:repo'}, typename='repo')
-def config_tree(repositories):
-    return tree(*repositories)
+@configurable({'repositories': 'refs:repo', 'parallelism': 'int'}, typename='repo')
+def config_tree(repositories, parallelism=1):
+    return tree(parallelism=parallelism, *repositories)
 
 
 class tree(prototype.tree):
@@ -73,6 +76,11 @@ class tree(prototype.tree):
 
     Args:
         trees (list): :obj:`pkgcore.repository.prototype.tree` instances
+        parallelism (int): number of threads to query trees with concurrently,
+            the default of 1 querying them sequentially. Note that when
+            enabled, each tree's matches are fully materialized before
+            being returned, thus :meth:`itermatch` is no longer lazy; callers
+            relying on stopping early gain nothing from it.
 
     Attributes:
         frozen_settable (bool): controls whether frozen is able to be set
@@ -80,18 +88,23 @@ class tree(prototype.tree):
         operations_kls: callable to generate a repo operations instance
 
         trees (list): :obj:`pkgcore.repository.prototype.tree` instances
+        parallelism (int): number of threads trees are queried with
     """
 
     frozen_settable = False
     operations_kls = operations
 
-    def __init__(self, *trees):
+    def __init__(self, *trees, **kwds):
+        parallelism = kwds.pop('parallelism', 1)
+        if kwds:
+            raise TypeError("unknown keywords: %s" % ', '.join(sorted(kwds)))
         super(tree, self).__init__()
         for x in trees:
             if not hasattr(x, 'itermatch'):
                 raise errors.InitializationError(
                     "%s is not a repository tree derivative" % (x,))
         self.trees = trees
+        self.parallelism = parallelism
 
     def _get_categories(self, *optional_category):
         d = set()
@@ -186,9 +199,16 @@ class tree(prototype.tree):
 
     def itermatch(self, restrict, **kwds):
         sorter = kwds.get("sorter", iter)
+        if self.parallelism > 1 and len(self.trees) > 1:
+            # each tree's matches are collected by a worker thread, then
+            # merged in tree order
+            matches = thread_pool.imap_ordered(
+                lambda repo: list(repo.itermatch(restrict, **kwds)),
+                self.trees, threads=self.parallelism)
+        else:
+            matches = (repo.itermatch(restrict, **kwds) for repo in self.trees)
         if sorter is iter:
-            return (match for repo in self.trees
-                    for match in repo.itermatch(restrict, **kwds))
+            return (match for repo_matches in matches for match in repo_matches)
 
         # ugly, and a bit slow, but works.
         def f(x, y):
@@ -197,8 +217,7 @@ class tree(prototype.tree):
                 return 1
             return -1
         f = post_curry(sorted_cmp, f, key=itemgetter(0))
-        return iter_sort(
-            f, *[repo.itermatch(restrict, **kwds) for repo in self.trees])
+        return iter_sort(f, *matches)
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
@@ -9,6 +9,7 @@ __all__ = (
     "CategoryIterValLazyDict", "PackageMapping", "VersionMapping", "tree"
 )
 
+from bisect import bisect_left, bisect_right
 import os
 
 from snakeoil.compatibility import is_py3k
@@ -16,9 +17,11 @@ from snakeoil.mappings import LazyValDict, DictMixin
 from snakeoil.sequences import iflatten_instance
 
 from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import fullver_key, ver_key, versioned_CPV
+from pkgcore.ebuild.errors import InvalidCPV
 from pkgcore.operations import repo
 from pkgcore.restrictions import values, boolean, restriction, packages
-from pkgcore.restrictions.util import collect_package_restrictions
+from pkgcore.restrictions.util import collect_package_restrictions, order_by_cost
 
 
 class IterValLazyDict(LazyValDict):
@@ -91,9 +94,18 @@ class PackageMapping(DictMixin):
 
 
 class VersionMapping(DictMixin):
+    """Mapping of (category, package) to the package's versions.
+
+    Versions are sorted from lowest to highest by their
+    :obj:`pkgcore.ebuild.cpv.ver_key`, thus the highest is last; invalid
+    versions precede them, in the order they were pulled.
+    """
+
+    _bisectable = frozenset(('=', '~', '<', '<=', '>', '>='))
 
     def __init__(self, parent_mapping, pull_vals):
         self._cache = {}
+        self._keys = {}
         self._parent = parent_mapping
         self._pull_vals = pull_vals
 
@@ -103,10 +115,52 @@ class VersionMapping(DictMixin):
             return o
         if not key[1] in self._parent.get(key[0], ()):
             raise KeyError(key)
-        val = self._pull_vals(key)
-        self._cache[key] = val
+        val = self._cache[key] = self._sort(key, self._pull_vals(key))
         return val
 
+    def _sort(self, key, vals):
+        invalid = []
+        l = []
+        for ver in vals:
+            try:
+                l.append((fullver_key(ver), ver))
+            except InvalidCPV:
+                invalid.append(ver)
+        l.sort()
+        self._keys[key] = (len(invalid), [x[0] for x in l])
+        return tuple(invalid) + tuple(x[1] for x in l)
+
+    def select(self, key, restrict):
+        """Return the versions of key that restrict may match.
+
+        For version range atoms, the range is found by bisecting the sorted
+        versions; otherwise all versions are returned.
+        """
+        vers = self.get(key, ())
+        op = getattr(restrict, 'op', None)
+        if (op not in self._bisectable or not isinstance(restrict, atom)
+                or restrict.negate_vers or not vers):
+            return vers
+        offset, keys = self._keys[key]
+        if op == '~':
+            start = ver_key(restrict.version, False)
+            lo = bisect_left(keys, start)
+            hi = bisect_left(keys, start + '\x02', lo)
+        else:
+            k = ver_key(restrict.version, restrict.revision)
+            if op == '=':
+                lo = bisect_left(keys, k)
+                hi = bisect_right(keys, k, lo)
+            elif op == '<':
+                lo, hi = 0, bisect_left(keys, k)
+            elif op == '<=':
+                lo, hi = 0, bisect_right(keys, k)
+            elif op == '>':
+                lo, hi = bisect_right(keys, k), len(keys)
+            else:
+                lo, hi = bisect_left(keys, k), len(keys)
+        return vers[:offset] + vers[offset + lo:offset + hi]
+
     def iterkeys(self):
         for cat, pkgs in self._parent.iteritems():
             for pkg in pkgs:
@@ -114,9 +168,10 @@ class VersionMapping(DictMixin):
 
     def force_regen(self, key, val):
         if val:
-            self._cache[key] = val
+            self._cache[key] = self._sort(key, val)
         else:
             self._cache.pop(key, None)
+            self._keys.pop(key, None)
 
 
 class tree(object):
@@ -254,31 +309,58 @@ class tree(object):
         if sorter is None:
             sorter = iter
 
-        if isinstance(restrict, atom):
-            candidates = [(restrict.category, restrict.package)]
+        version_restrict = None
+        query_atom = self._find_atom(restrict)
+        if query_atom is not None:
+            candidates = [(query_atom.category, query_atom.package)]
+            if force is not False:
+                version_restrict = query_atom
         else:
             candidates = self._identify_candidates(restrict, sorter)
 
+        # candidates are identified above from the restriction as given,
+        # matching evaluates the checks not requiring metadata first
         if force is None:
-            match = restrict.match
+            match = order_by_cost(restrict).match
         elif force:
-            match = restrict.force_True
+            match = order_by_cost(restrict, forcing=True).force_True
         else:
             match = restrict.force_False
         return self._internal_match(
             candidates, match, sorter, pkg_klass_override,
-            yield_none=yield_none)
+            yield_none=yield_none, restrict=version_restrict)
+
+    @staticmethod
+    def _find_atom(restrict):
+        """Return the atom every match of a restriction has to match, if any.
 
-    def _internal_gen_candidates(self, candidates, sorter):
+        Filtering repos combine their own restrictions with the queried atom,
+        this digs it back out so its package and versions can still be used
+        to narrow down the candidates.
+        """
+        if isinstance(restrict, atom):
+            return restrict
+        if isinstance(restrict, boolean.AndRestriction) and not restrict.negate:
+            for x in restrict.restrictions:
+                if isinstance(x, atom):
+                    return x
+        return None
+
+    def _internal_gen_candidates(self, candidates, sorter, restrict=None):
+        """
+        :param restrict: if given, versions the restriction can't match
+            may be skipped
+        """
         pkls = self.package_class
         for cp in sorter(candidates):
             for pkg in sorter(pkls(cp[0], cp[1], ver)
-                              for ver in self.versions.get(cp, ())):
+                              for ver in self.versions.select(cp, restrict)):
                 yield pkg
 
     def _internal_match(self, candidates, match_func, sorter,
-                        pkg_klass_override, yield_none=False):
-        for pkg in self._internal_gen_candidates(candidates, sorter):
+                        pkg_klass_override, yield_none=False, restrict=None):
+        for pkg in self._internal_gen_candidates(
+                candidates, sorter, restrict=restrict):
             if pkg_klass_override is not None:
                 pkg = pkg_klass_override(pkg)
 
@@ -342,6 +424,37 @@ class tree(object):
 
         return self._fast_identify_candidates(restrict, sorter)
 
+    def _identify_indexed_candidates(self, restrict, attrs, find):
+        """Identify candidates via an index of pkg attributes.
+
+        :param attrs: pkg attributes the index covers
+        :param find: callable taking a restriction, returning the cpv strings
+            of the pkgs it may match according to the index, or None if the
+            index can't resolve it
+        :return: set of (category, package) candidates, or None if some dnf
+            solution of restrict lacks a restriction the index resolves
+        """
+        if isinstance(restrict, boolean.base):
+            if not any(True for x in collect_package_restrictions(restrict, attrs)):
+                return None
+            solutions = restrict.iter_dnf_solutions(True)
+        else:
+            solutions = ([restrict],)
+        cpvs = set()
+        for solution in solutions:
+            for r in solution:
+                found = find(r)
+                if found is not None:
+                    cpvs.update(found)
+                    break
+            else:
+                return None
+        candidates = set()
+        for cpv in cpvs:
+            cpv = versioned_CPV(cpv)
+            candidates.add((cpv.category, cpv.package))
+        return candidates
+
     def _fast_identify_candidates(self, restrict, sorter):
         pkg_restrict = set()
         cat_restrict = set()
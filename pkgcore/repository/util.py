@@ -69,15 +69,17 @@ class RepositoryGroup(object):
     Args:
         repos (list): repo instances
         combined: combined repo, if None a multiplex repo is created
+        parallelism (int): number of threads the created multiplex repo
+            queries repos with, see :obj:`pkgcore.repository.multiplex.tree`
     """
 
-    def __init__(self, repos, combined=None):
+    def __init__(self, repos, combined=None, parallelism=1):
         self.repos = tuple(repos)
         if combined is None:
             if len(self.repos) == 1:
                 combined = self.repos[0]
             else:
-                combined = multiplex.tree(*self.repos)
+                combined = multiplex.tree(parallelism=parallelism, *self.repos)
         self.combined = combined
 
     itermatch = klass.alias_attr("combined.itermatch")
@@ -28,12 +28,12 @@ class tree(prototype.tree):
     def _expand_vers(self, cp, ver):
         raise NotImplementedError(self, "_expand_vers")
 
-    def _internal_gen_candidates(self, candidates, sorter):
+    def _internal_gen_candidates(self, candidates, sorter, restrict=None):
         pkls = self.package_class
         for cp in candidates:
             for pkg in sorter(
                     pkls(provider, cp[0], cp[1], ver)
-                    for ver in self.versions.get(cp, ())
+                    for ver in self.versions.select(cp, restrict)
                     for provider in self._expand_vers(cp, ver)):
                 yield pkg
 
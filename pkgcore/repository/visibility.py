@@ -14,7 +14,10 @@ from snakeoil.klass import GetAttrProxy
 
 from pkgcore.operations.repo import operations_proxy
 from pkgcore.repository import prototype, errors
+from pkgcore.restrictions import packages
+from pkgcore.restrictions.compiler import compile_restriction
 from pkgcore.restrictions.restriction import base
+from pkgcore.restrictions.util import split_by_cost
 
 # these tricks are to keep 2to3 from screwing up.
 if compatibility.is_py3k:
@@ -40,17 +43,27 @@ class filterTree(prototype.tree):
         self.raw_repo = repo
         if sentinel_val:
             self._filterfunc = ifilter
+            # the parts of the filter not requiring metadata are handed to
+            # the repo along with the query
+            self._prefilter, self._postfilter = split_by_cost(restriction)
         else:
             self._filterfunc = filterfalse
+            self._prefilter, self._postfilter = None, restriction
+        if self._postfilter is not None:
+            self._postmatch = compile_restriction(self._postfilter)
 
     def itermatch(self, restrict, **kwds):
-        # note that this lets the repo do the initial filtering.
-        # better design would to analyze the restrictions, and inspect
-        # the repo, determine what can be done without cost
-        # (determined by repo's attributes) versus what does cost
-        # (metadata pull for example).
-        return self._filterfunc(
-            self.restriction.match, self.raw_repo.itermatch(restrict, **kwds))
+        # the repo evaluates the cheap parts of the filter ahead of the
+        # query's metadata checks, so pkgs filtered out by version or the
+        # like don't get their metadata pulled; the rest is applied after.
+        # A queried atom is still picked out of the combination to narrow
+        # down the candidate pkgs and versions.
+        if self._prefilter is not None:
+            restrict = packages.AndRestriction(self._prefilter, restrict)
+        pkgs = self.raw_repo.itermatch(restrict, **kwds)
+        if self._postfilter is None:
+            return pkgs
+        return self._filterfunc(self._postmatch, pkgs)
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
@@ -0,0 +1,290 @@
+# License: GPL2/BSD
+
+"""
+conflict driven clause learning SAT solver
+
+A small solver for the formulas the SAT resolver generates.  Variables are
+positive ints, literals are variables or their negation.  Decisions follow
+variable creation order, each variable taking its preferred phase; thus the
+caller controls which models are found first.  Solving supports assumptions
+and a conflict budget, the latter bounding the work any one call does.
+"""
+
+__all__ = ("solver", "at_most_one")
+
+
+class solver(object):
+    """Incremental CDCL solver.
+
+    Clauses may be added between calls to :obj:`solve`; learnt clauses are
+    kept across calls.
+
+    :ivar ok: False once the clauses are known to be unsatisfiable
+        regardless of assumptions
+    :ivar conflicts: total number of conflicts hit across all solves
+    """
+
+    def __init__(self):
+        self.ok = True
+        self.conflicts = 0
+        # indexed by var; slot 0 is unused
+        self._values = [None]
+        self._levels = [0]
+        self._reasons = [None]
+        self._phases = [False]
+        self._watches = {}
+        self._trail = []
+        self._trail_lim = []
+        self._qhead = 0
+        # next var to consider for a decision
+        self._next = 1
+        self._model = None
+
+    def new_var(self, phase=False):
+        """Allocate a variable.
+
+        :param phase: value the var is given when decided on
+        :return: the var
+        """
+        self._values.append(None)
+        self._levels.append(0)
+        self._reasons.append(None)
+        self._phases.append(bool(phase))
+        var = len(self._values) - 1
+        self._watches[var] = []
+        self._watches[-var] = []
+        return var
+
+    def __len__(self):
+        return len(self._values) - 1
+
+    def _value(self, lit):
+        val = self._values[abs(lit)]
+        if val is None or lit > 0:
+            return val
+        return not val
+
+    def _enqueue(self, lit, reason):
+        var = abs(lit)
+        self._values[var] = lit > 0
+        self._levels[var] = len(self._trail_lim)
+        self._reasons[var] = reason
+        self._trail.append(lit)
+
+    def add_clause(self, lits):
+        """Add a clause, given as an iterable of literals.
+
+        :return: False if the clauses became unsatisfiable, else True
+        """
+        if not self.ok:
+            return False
+        value = self._value
+        clause = []
+        for lit in lits:
+            val = value(lit)
+            if val is True or -lit in clause:
+                # satisfied at the top level, or a tautology
+                return True
+            if val is None and lit not in clause:
+                clause.append(lit)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self._enqueue(clause[0], None)
+            self.ok = self._propagate() is None
+        else:
+            self._watches[clause[0]].append(clause)
+            self._watches[clause[1]].append(clause)
+        return self.ok
+
+    def _propagate(self):
+        """Propagate the trail, returning a conflicting clause or None."""
+        trail = self._trail
+        watches = self._watches
+        value = self._value
+        while self._qhead < len(trail):
+            false_lit = -trail[self._qhead]
+            self._qhead += 1
+            ws = watches[false_lit]
+            watches[false_lit] = kept = []
+            i = 0
+            while i < len(ws):
+                clause = ws[i]
+                i += 1
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], false_lit
+                first = clause[0]
+                if value(first) is True:
+                    kept.append(clause)
+                    continue
+                for k in xrange(2, len(clause)):
+                    if value(clause[k]) is not False:
+                        clause[1], clause[k] = clause[k], false_lit
+                        watches[clause[1]].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if value(first) is False:
+                        kept.extend(ws[i:])
+                        self._qhead = len(trail)
+                        return clause
+                    self._enqueue(first, clause)
+        return None
+
+    def _analyze(self, conflict):
+        """Derive the first UIP clause of a conflict.
+
+        :return: tuple of the learnt clause, asserting literal first, and
+            the level to backjump to
+        """
+        levels = self._levels
+        level = len(self._trail_lim)
+        trail = self._trail
+        seen = set()
+        learnt = [None]
+        pending = 0
+        lit = None
+        idx = len(trail) - 1
+        clause = conflict
+        while True:
+            for q in clause:
+                if q == lit:
+                    continue
+                var = abs(q)
+                if var not in seen and levels[var] > 0:
+                    seen.add(var)
+                    if levels[var] == level:
+                        pending += 1
+                    else:
+                        learnt.append(q)
+            while abs(trail[idx]) not in seen:
+                idx -= 1
+            lit = trail[idx]
+            idx -= 1
+            pending -= 1
+            if not pending:
+                break
+            clause = self._reasons[abs(lit)]
+        learnt[0] = -lit
+        if len(learnt) == 1:
+            return learnt, 0
+        # watch the literal of the highest level other than the asserting one
+        best = max(xrange(1, len(learnt)), key=lambda i: levels[abs(learnt[i])])
+        learnt[1], learnt[best] = learnt[best], learnt[1]
+        return learnt, levels[abs(learnt[1])]
+
+    def _backtrack(self, level):
+        if len(self._trail_lim) <= level:
+            return
+        pos = self._trail_lim[level]
+        values = self._values
+        phases = self._phases
+        nxt = self._next
+        for lit in self._trail[pos:]:
+            var = abs(lit)
+            values[var] = None
+            self._reasons[var] = None
+            if var < nxt:
+                nxt = var
+        self._next = nxt
+        del self._trail[pos:]
+        del self._trail_lim[level:]
+        self._qhead = pos
+
+    def _decide(self):
+        """Return the next decision literal, None if all vars are assigned."""
+        values = self._values
+        var = self._next
+        while var < len(values) and values[var] is not None:
+            var += 1
+        self._next = var
+        if var == len(values):
+            return None
+        return var if self._phases[var] else -var
+
+    def solve(self, assumptions=(), max_conflicts=None):
+        """Search for a model in which all assumptions hold.
+
+        :param assumptions: sequence of literals
+        :param max_conflicts: if given, give up after this many conflicts
+        :return: True if satisfiable, False if not, None if the conflict
+            budget ran out first
+        """
+        if not self.ok:
+            return False
+        assumptions = list(assumptions)
+        conflicts = 0
+        try:
+            while True:
+                conflict = self._propagate()
+                if conflict is not None:
+                    if not self._trail_lim:
+                        self.ok = False
+                        return False
+                    self.conflicts += 1
+                    conflicts += 1
+                    learnt, level = self._analyze(conflict)
+                    self._backtrack(level)
+                    if len(learnt) == 1:
+                        self._enqueue(learnt[0], None)
+                    else:
+                        self._watches[learnt[0]].append(learnt)
+                        self._watches[learnt[1]].append(learnt)
+                        self._enqueue(learnt[0], learnt)
+                    if max_conflicts is not None and conflicts >= max_conflicts:
+                        return None
+                    continue
+
+                level = len(self._trail_lim)
+                if level < len(assumptions):
+                    lit = assumptions[level]
+                    val = self._value(lit)
+                    if val is False:
+                        return False
+                    self._trail_lim.append(len(self._trail))
+                    if val is None:
+                        self._enqueue(lit, None)
+                    continue
+
+                lit = self._decide()
+                if lit is None:
+                    self._model = self._values[:]
+                    return True
+                self._trail_lim.append(len(self._trail))
+                self._enqueue(lit, None)
+        finally:
+            self._backtrack(0)
+
+    def fixed(self, lit):
+        """Return the value of a literal implied by the clauses alone, or None."""
+        return self._value(lit)
+
+    def value(self, lit):
+        """Return the value of a literal in the last model found.
+
+        Solves that fail or run out of budget leave the last model as is.
+        """
+        if self._model is None:
+            raise ValueError("no model available")
+        val = self._model[abs(lit)]
+        return val if lit > 0 else not val
+
+
+def at_most_one(s, lits):
+    """Add clauses to solver s allowing at most one of lits to be true."""
+    lits = list(lits)
+    if len(lits) <= 5:
+        for i, x in enumerate(lits):
+            for y in lits[i + 1:]:
+                s.add_clause((-x, -y))
+        return
+    # sequential counter; prev is true if any lit so far is
+    prev = None
+    for x in lits[:-1]:
+        cur = s.new_var()
+        s.add_clause((-x, cur))
+        if prev is not None:
+            s.add_clause((-prev, cur))
+            s.add_clause((-x, -prev))
+        prev = cur
+    s.add_clause((-lits[-1], -prev))
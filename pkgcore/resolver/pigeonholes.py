@@ -12,11 +12,14 @@ class PigeonHoledSlots(object):
     """class for tracking slotting to a specific atom/obj key
     no atoms present, just prevents conflicts of obj.key; atom present, assumes
     it's a blocker and ensures no obj matches the atom for that key
+
+    :ivar reads: if not None, set the keys of all lookups are added to
     """
 
     def __init__(self):
         self.slot_dict = {}
         self.limiters = {}
+        self.reads = None
 
     def fill_slotting(self, obj, force=False):
         """Try to insert obj in.
@@ -35,6 +38,8 @@ class PigeonHoledSlots(object):
         return l
 
     def get_conflicting_slot(self, pkg):
+        if self.reads is not None:
+            self.reads.add(pkg.key)
         for x in self.slot_dict.get(pkg.key, ()):
             if pkg.slot == x.slot:
                 return x
@@ -43,6 +48,8 @@ class PigeonHoledSlots(object):
     def find_atom_matches(self, atom, key=None):
         if key is None:
             key = atom.key
+        if self.reads is not None:
+            self.reads.add(key)
         return filter(atom.match, self.slot_dict.get(key, ()))
 
     def add_limiter(self, atom, key=None):
@@ -54,12 +61,16 @@ class PigeonHoledSlots(object):
 
         if key is None:
             key = atom.key
+        if self.reads is not None:
+            self.reads.add(key)
         self.limiters.setdefault(key, []).append(atom)
         return self.find_atom_matches(atom, key=key)
 
     def check_limiters(self, obj):
         """return any limiters conflicting w/ the passed in obj"""
         key = obj.key
+        if self.reads is not None:
+            self.reads.add(key)
         return [x for x in self.limiters.get(key, ()) if x.match(obj)]
 
     def remove_slotting(self, obj):
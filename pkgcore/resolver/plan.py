@@ -9,7 +9,6 @@ import operator
 from itertools import chain, islice, ifilterfalse as filterfalse
 import sys
 
-from snakeoil.compatibility import cmp, sort_cmp
 from snakeoil.iterables import caching_iter
 
 # XXX: hack; see insert_blockers
@@ -37,6 +36,12 @@ pkg_sort_lowest = sorted
 pkg_grabber = operator.itemgetter(0)
 
 
+def _pkg_sort_key(pkg, livefs):
+    """Key ordering pkgs as cmp does, ties going by whether they're livefs."""
+    return (pkg.category, pkg.package, pkg.version_key,
+            bool(pkg.repo.livefs) == livefs)
+
+
 def highest_iter_sort(l, pkg_grabber=pkg_grabber):
     """Sort a list of packages from highest to lowest and prefer livefs.
 
@@ -44,18 +49,7 @@ def highest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return 1
-        elif y.repo.livefs:
-            return -1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber, reverse=True)
+    l.sort(key=lambda x: _pkg_sort_key(pkg_grabber(x), True), reverse=True)
     return l
 
 
@@ -66,18 +60,7 @@ def lowest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return -1
-        elif y.repo.livefs:
-            return 1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber)
+    l.sort(key=lambda x: _pkg_sort_key(pkg_grabber(x), False))
     return l
 
 
@@ -95,7 +78,7 @@ class resolver_frame(object):
 
     __slots__ = ("parent", "atom", "choices", "mode", "start_point", "dbs",
         "depth", "drop_cycles", "__weakref__", "ignored", "vdb_limited",
-        "events", "succeeded")
+        "events", "succeeded", "conflicts", "culprits")
 
     def __init__(self, parent, mode, atom, choices, dbs, start_point, depth,
                  drop_cycles, ignored=False, vdb_limited=False):
@@ -112,6 +95,10 @@ class resolver_frame(object):
         self.vdb_limited = vdb_limited
         self.events = []
         self.succeeded = None
+        # plan positions the failures of its choices depended on, None if
+        # unknown; see merge_plan._rec_add_atom
+        self.conflicts = set()
+        self.culprits = []
 
     def reduce_solutions(self, nodes):
         if isinstance(nodes, (list, tuple)):
@@ -231,7 +218,9 @@ class merge_plan(object):
                  global_strategy=None,
                  depset_reorder_strategy=None,
                  process_built_depends=False,
-                 drop_cycles=False, debug=False, debug_handle=None):
+                 drop_cycles=False, debug=False, debug_handle=None,
+                 cache_max_entries=None, cache_max_pkgs=None,
+                 learn_nogoods=True, repo_parallelism=1):
 
         if debug_handle is None:
             debug_handle = sys.stdout
@@ -252,17 +241,29 @@ class merge_plan(object):
         self.depset_reorder = depset_reorder_strategy
         self.per_repo_strategy = per_repo_strategy
         self.total_ordering_strategy = global_strategy
-        self.all_raw_dbs = [misc.caching_repo(x, self.per_repo_strategy) for x in dbs]
+        self.all_raw_dbs = [
+            misc.caching_repo(
+                x, self.per_repo_strategy, max_entries=cache_max_entries,
+                max_pkgs=cache_max_pkgs)
+            for x in dbs]
         self.all_dbs = global_strategy(self.all_raw_dbs)
         self.default_dbs = self.all_dbs
 
         self.state = state.plan_state()
         vdb_state_filter_restrict = MutableContainmentRestriction(self.state.vdb_filter)
+        self.repo_parallelism = repo_parallelism
         self.livefs_dbs = multiplex.tree(
+            parallelism=repo_parallelism,
             *[visibility.filterTree(x, vdb_state_filter_restrict)
                 for x in self.all_raw_dbs if x.livefs])
 
         self.insoluble = set()
+        # (atom, dbs, mode, drop_cycles, root dbs) -> list of the states
+        # it failed in; see _rec_add_atom
+        self.nogoods = {} if learn_nogoods else None
+        self.nogood_hits = 0
+        # conflict of the last failed _rec_add_atom call
+        self._conflict = None
         self.vdb_preloaded = False
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_nonpreloaded
@@ -387,17 +388,221 @@ class merge_plan(object):
             self._debugging_drop_cycles = False
         return ret
 
+    # max number of nogoods kept per atom
+    max_atom_nogoods = 8
+
     def _rec_add_atom(self, atom, stack, dbs, mode="none", drop_cycles=False):
-        """Add an atom.
+        """Add an atom, skipping resolution if it's known to fail.
+
+        Failures are recorded as nogoods: the atom along with the parts of
+        the plan state its resolution looked at, namely the slotting and
+        blockers of the keys it queried, and the slots of the stack frames
+        checked for cycles.  Resolution only depends on those, thus if the
+        atom is added again while they're unchanged it fails the same way;
+        the failure is returned without redoing it, and the caller prunes
+        the choices requiring the atom as usual.
+
+        Failures also record their conflict in self._conflict: the plan
+        positions they depended on (None if unknown), and the culprits, the
+        atoms known to fail as long as the positions their own failure
+        depended on stay in place.  Choice points use them to backjump: when
+        a choice fails due to a culprit failing regardless of anything added
+        since the choice point started, the remaining alternatives requiring
+        that atom are skipped rather than tried in turn, thus unwinding
+        straight to a choice point the conflict depends on.  Alternatives not
+        requiring a culprit are still tried, as they may avoid the conflict.
 
         :return: False on no issues (inserted succesfully),
             else a list of the stack that screwed it up.
         """
+        if self.nogoods is None:
+            return self._resolve_atom(atom, stack, dbs, mode, drop_cycles)
+        nogood_key = (atom, dbs, mode, drop_cycles, stack[0].dbs if stack else dbs)
+        try:
+            nogoods = self.nogoods.get(nogood_key)
+        except TypeError:
+            # unhashable restriction
+            return self._resolve_atom(atom, stack, dbs, mode, drop_cycles)
+
+        slots = self.state.state
+        if nogoods:
+            failure = self._match_nogoods(nogoods, stack)
+            if failure is not None:
+                failure, entries = failure
+                points = None
+                if entries is not None:
+                    points = self._conflict_points(entries)
+                culprits = ()
+                if points is not None:
+                    culprits = ((points, atom, dbs, drop_cycles),)
+                self._conflict = (points, culprits)
+                self.nogood_hits += 1
+                stack.add_frame(mode, atom, choice_point(atom, ()), dbs,
+                    self.state.current_state, drop_cycles,
+                    vdb_limited=dbs == self.livefs_dbs)
+                self.notify_viable(stack, atom, False, "learned nogood")
+                stack.pop_frame(False)
+                return list(failure)
+
+        outer_reads = slots.reads
+        reads = slots.reads = set()
+        try:
+            ret = self._resolve_atom(atom, stack, dbs, mode, drop_cycles)
+        finally:
+            slots.reads = outer_reads
+            if outer_reads is not None:
+                outer_reads.update(reads)
+        if ret:
+            self._learn_nogood(nogood_key, reads, stack, ret)
+        return ret
+
+    @staticmethod
+    def _stack_slots(stack):
+        """Return the (key, slot) pairs of the frames cycles are checked against."""
+        l = set()
+        for frame in stack:
+            pkg = frame.choices.matches_cur
+            if not frame.ignored and pkg is not None:
+                l.add((pkg.key, pkg.slot))
+        return l
+
+    def _learn_nogood(self, nogood_key, reads, stack, failure):
+        keys = set()
+        cycle_slots = set()
+        for x in reads:
+            if isinstance(x, tuple):
+                cycle_slots.add(x)
+            else:
+                keys.add(x)
+        if not cycle_slots.isdisjoint(self._stack_slots(stack)):
+            # the failure may be due to a cycle with the current stack
+            return
+        # conflicts are kept as the state entries, since the positions of
+        # their ops may differ wherever the nogood is matched
+        entries = None
+        points = self._conflict[0]
+        if points is not None:
+            entries = self._conflict_entries(points)
+        l = self.nogoods.setdefault(nogood_key, [])
+        l.append((frozenset(keys), self.state.snapshot(keys),
+                  frozenset(cycle_slots), tuple(failure), entries))
+        if len(l) > self.max_atom_nogoods:
+            del l[0]
+
+    def _match_nogoods(self, nogoods, stack):
+        """Return the failure and conflicting state entries of the first
+        nogood holding, None if none do."""
+        stack_slots = None
+        for keys, snapshot, cycle_slots, failure, entries in reversed(nogoods):
+            if not self.state.matches_snapshot(snapshot):
+                continue
+            if cycle_slots:
+                if stack_slots is None:
+                    stack_slots = self._stack_slots(stack)
+                if not cycle_slots.isdisjoint(stack_slots):
+                    continue
+            reads = self.state.state.reads
+            if reads is not None:
+                # whatever's being resolved depends on this failure
+                reads.update(keys)
+                reads.update(cycle_slots)
+            return failure, entries
+        return None
+
+    def _conflict_points(self, entries):
+        """Return the plan positions of the ops adding the given state entries.
+
+        :param entries: pkgs and blockers in the state
+        :return: frozenset of positions, None if an entry's op isn't known
+        """
+        plan = self.state.plan
+        points = set()
+        for entry in entries:
+            if isinstance(entry, restriction.base):
+                # blockers are in place from their first reference on
+                l = [i for i, op in enumerate(plan)
+                     if isinstance(op, state.blocker_base_op) and op.blocker is entry]
+                if not l or any(isinstance(plan[i], state.decref_forward_block_op)
+                                for i in l):
+                    return None
+                points.add(l[0])
+                continue
+            for i in xrange(len(plan) - 1, -1, -1):
+                op = plan[i]
+                if op.desc in ('add', 'replace') and op.pkg is entry:
+                    points.add(i)
+                    break
+            else:
+                return None
+        return frozenset(points)
+
+    def _conflict_entries(self, points):
+        """Inverse of :obj:`_conflict_points`."""
+        plan = self.state.plan
+        return tuple(
+            plan[i].blocker if isinstance(plan[i], state.blocker_base_op)
+            else plan[i].pkg for i in points)
+
+    @staticmethod
+    def _blame(frame, conflict):
+        """Add the conflict of a failed choice to its frame."""
+        points, culprits = conflict
+        if points is None:
+            frame.conflicts = None
+        elif frame.conflicts is not None:
+            frame.conflicts.update(points)
+        frame.culprits.extend(culprits)
+
+    def _frame_conflict(self, frame):
+        """Set the conflict of a frame that ran out of choices.
+
+        Positions from the frame's own choices were backtracked, thus only
+        the ones preceding it are kept, along with the culprits depending
+        only on those; the frame's atom is one itself.
+        """
+        start = frame.start_point
+        culprits = [c for c in frame.culprits if not c[0] or max(c[0]) < start]
+        points = frame.conflicts
+        if points is not None:
+            points = frozenset(x for x in points if x < start)
+            culprits.append((points, frame.atom, frame.dbs, frame.drop_cycles))
+        self._conflict = (points, tuple(culprits))
+
+    def _required_culprits(self, atom, frame, culprits):
+        """Return the culprits resolving atom from frame would require.
+
+        :return: list of the culprits every pkg atom may resolve to requires
+            one of, None if that's not known to be the case
+        """
+        culprits = [c for c in culprits
+                    if c[2] == frame.dbs and c[3] == frame.drop_cycles]
+        if not culprits or atom in self.insoluble or self.state.match_atom(atom):
+            return None
+        required = []
+        for pkg in frame.dbs.itermatch(atom):
+            depsets = [pkg.rdepends, pkg.post_rdepends]
+            if not pkg.built or self.process_built_depends:
+                depsets.append(pkg.depends)
+            for depset in depsets:
+                culprit = next((c for reqs in depset.cnf_solutions()
+                                if len(reqs) == 1 for c in culprits
+                                if reqs[0] == c[1]), None)
+                if culprit is not None:
+                    required.append(culprit)
+                    break
+            else:
+                return None
+        return required or None
+
+    def _resolve_atom(self, atom, stack, dbs, mode, drop_cycles):
         assert hasattr(dbs, 'itermatch')
         limit_to_vdb = dbs == self.livefs_dbs
 
         matches = self._viable(stack, mode, atom, dbs, drop_cycles, limit_to_vdb)
         if matches is None:
+            # not viable regardless of the plan
+            self._conflict = (frozenset(),
+                              ((frozenset(), atom, dbs, drop_cycles),))
             stack.pop_frame(False)
             return [atom]
         elif matches is True:
@@ -419,6 +624,8 @@ class merge_plan(object):
 
         ret = self.check_for_cycles(stack, stack.current_frame)
         if ret is not True:
+            if ret:
+                self._conflict = (None, ())
             stack.pop_frame(ret is None)
             return ret
 
@@ -466,6 +673,8 @@ class merge_plan(object):
                 # failure.
                 self.notify_choice_failed(stack, atom, choices,
                     "failed inserting: %s", l)
+                self._blame(stack.current_frame,
+                            (self._conflict_points(l), ()))
                 self.state.backtrack(stack.current_frame.start_point)
                 choices.force_next_pkg()
                 continue
@@ -483,6 +692,7 @@ class merge_plan(object):
         self._dprint("no solution  %s%s", (depth*2*" ", atom))
         stack.add_event(("debug", "ran out of choices",))
         self.state.backtrack(stack.current_frame.start_point)
+        self._frame_conflict(stack.current_frame)
         # saving roll.  if we're allowed to drop cycles, try it again.
         # this needs to be *far* more fine grained also. it'll try
         # regardless of if it's a cycle issue
@@ -497,6 +707,7 @@ class merge_plan(object):
             if not l:
                 stack.pop_frame(True)
                 return None
+            self._conflict = (None, ())
         stack.pop_frame(False)
         return [atom] + failures
 
@@ -565,6 +776,10 @@ class merge_plan(object):
             value to return after collapsing the calling frame
         """
         force_vdb = False
+        reads = self.state.state.reads
+        if reads is not None:
+            pkg = cur_frame.current_pkg
+            reads.add((pkg.key, pkg.slot))
         for frame in stack.slot_cycles(cur_frame, reverse=True):
             if not any(f.mode == 'post_rdepends' for f in
                 islice(stack, stack.index(frame), stack.index(cur_frame))):
@@ -613,6 +828,7 @@ class merge_plan(object):
         depset = self.depset_reorder(getattr(choices, attr), attr)
         l = self.process_dependencies(stack, choices, attr, depset, atom)
         if len(l) == 1:
+            self._blame(stack.current_frame, self._conflict)
             self._dprint("resetting for %s%s because of %s: %s",
                    (depth*2*" ", atom, attr, l[0]))
             self.state.backtrack(stack.current_frame.start_point)
@@ -628,8 +844,22 @@ class merge_plan(object):
         self.notify_starting_mode(mode, stack)
         for potentials in depset:
             failure = []
+            # conflicts of the alternatives that failed
+            points, culprits = set(), []
             for or_node in potentials:
-                if or_node.blocks:
+                required = None
+                if culprits and not or_node.blocks:
+                    required = self._required_culprits(
+                        or_node, cur_frame, culprits)
+                if required is not None:
+                    # backjump over it, it'd fail the same way
+                    self.notify_viable(stack, or_node, False,
+                        "requires failed %s" % (required[0][1],))
+                    failure = [or_node]
+                    self._conflict = (
+                        frozenset(chain.from_iterable(c[0] for c in required)),
+                        tuple(required))
+                elif or_node.blocks:
                     failure = self.process_blocker(stack, choices, or_node, mode, atom)
                     if not failure:
                         blocks.append(or_node)
@@ -652,7 +882,22 @@ class merge_plan(object):
                         failure = None
                         break
 
-                if cur_frame.reduce_solutions(or_node):
+                conflict_points, conflict_culprits = self._conflict
+                if points is not None:
+                    if conflict_points is None:
+                        points = None
+                    else:
+                        points.update(conflict_points)
+                culprits.extend(conflict_culprits)
+                self._conflict = (points, tuple(culprits))
+                # culprits not depending on this frame fail for all its choices
+                nodes = [or_node]
+                nodes.extend(c[1] for c in conflict_culprits
+                             if (not c[0] or max(c[0]) < cur_frame.start_point)
+                             and c[2] == cur_frame.dbs
+                             and c[3] == cur_frame.drop_cycles
+                             and c[1] != or_node)
+                if cur_frame.reduce_solutions(nodes):
                     # pkg changed.
                     return [failure]
                 continue
@@ -666,6 +911,12 @@ class merge_plan(object):
         ret = self.insert_blockers(stack, choices, [blocker])
         if ret is None:
             return []
+        points = self._conflict_points(ret[1])
+        if blocker.weak_blocker and points is not None:
+            # resolving past it failed too
+            past = self._conflict[0]
+            points = None if past is None else points.union(past)
+        self._conflict = (points, ())
         self.notify_choice_failed(stack, atom, choices,
             "%s blocker: %s conflicts w/ %s", (mode, ret[0], ret[1]))
         return [ret[0]]
@@ -784,6 +1035,7 @@ class merge_plan(object):
                         if not result:
                             # ignore the blocker, we resolved past it.
                             continue
+                        self._conflict = (None, ())
                 return x, l
         return None
 
@@ -791,6 +1043,14 @@ class merge_plan(object):
         for repo in self.all_raw_dbs:
             repo.clear()
 
+    def cache_stats(self):
+        """Return the query cache statistics summed across all dbs."""
+        d = {}
+        for repo in self.all_raw_dbs:
+            for k, v in repo.cache_stats().iteritems():
+                d[k] = d.get(k, 0) + v
+        return d
+
     # selection strategies for atom matches
 
     def default_depset_reorder_strategy(self, depset, mode):
@@ -0,0 +1,433 @@
+# License: GPL2/BSD
+
+"""
+SAT based resolver
+
+Rather than resolving atoms one by one, backtracking on failure, the pkgs
+reachable from the targets are encoded as a boolean formula that's solved as
+a whole.  Each candidate pkg gets a var, true if it's part of the plan:
+
+- pkgs require one of the candidates of each of their deps, || groups
+  requiring one of their alternatives
+- at most one pkg is chosen per slot
+- chosen pkgs exclude the pkgs matching their blockers; installed pkgs that
+  match must be replaced by a pkg in their slot that doesn't
+
+Of the solutions, the one picked is what :obj:`pkgcore.resolver.plan`
+would pick were it to never need backtracking: deps are walked breadth
+first from the targets, each getting the most preferred candidate (as
+ordered by the resolver strategy, thus preferring installed or highest
+versions) and || alternative that a solution still exists with.  Pkgs
+the walk didn't require are then dropped where possible.  The work done is
+bounded by a conflict budget, making worst case resolution time
+predictable.
+"""
+
+__all__ = ("sat_plan",)
+
+from collections import deque
+
+from pkgcore.resolver import plan, state
+from pkgcore.resolver.cdcl import solver, at_most_one
+from pkgcore.resolver.choice_point import choice_point
+
+
+def _ident(pkg):
+    # pkgs compare by cpv alone, while the same version may be both
+    # installed and available
+    return pkg.cpvstr, pkg.repo
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+class _formula(object):
+    """Encoding of the pkgs reachable from a set of targets."""
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.solver = solver()
+        # pkgs in the order they were found, and the vars of their idents
+        self.pkgs = []
+        self.vars = {}
+        self.keys = {}
+        # restrict -> tuple of its candidates, most preferred first
+        self.candidates = {}
+        # ident -> list of (mode, or group, alternative vars) tuples, the
+        # vars being None for groups of one
+        self.deps = {}
+        # (pkg, blocker, var or None, mangled blocker) tuples
+        self.blockers = []
+        self._queue = deque()
+
+    def add_target(self, restrict):
+        """Return a var which, if true, requires restrict to be satisfied."""
+        var = self.solver.new_var(True)
+        self.solver.add_clause(
+            [-var] + [self.var(x) for x in self.match(restrict)])
+        self._expand()
+        return var
+
+    def match(self, restrict):
+        l = self.candidates.get(restrict)
+        if l is None:
+            l = self.candidates[restrict] = tuple(
+                self.resolver.default_dbs.itermatch(restrict))
+            # decisions default to false in creation order; thus the
+            # preferred pkg is the one left if one is required
+            for pkg in reversed(l):
+                self.add_pkg(pkg)
+        return l
+
+    def var(self, pkg):
+        return self.vars[_ident(pkg)]
+
+    def add_pkg(self, pkg):
+        ident = _ident(pkg)
+        if ident not in self.vars:
+            self.vars[ident] = self.solver.new_var()
+            self.pkgs.append(pkg)
+            self.keys.setdefault(pkg.key, []).append(pkg)
+            self._queue.append(pkg)
+
+    def _expand(self):
+        resolver = self.resolver
+        while self._queue:
+            pkg = self._queue.popleft()
+            deps = self.deps[_ident(pkg)] = []
+            for mode in ('depends', 'rdepends', 'post_rdepends'):
+                if (mode == 'depends' and pkg.built and
+                        not resolver.process_built_depends):
+                    continue
+                depset = getattr(pkg, mode).cnf_solutions()
+                for group in resolver.depset_reorder(depset, mode):
+                    deps.append((mode, group, self._add_group(pkg, group)))
+
+    def _add_group(self, pkg, group):
+        s = self.solver
+        var = self.var(pkg)
+        if len(group) == 1:
+            x = group[0]
+            if x.blocks:
+                self._add_blocker(pkg, x)
+            else:
+                s.add_clause([-var] + [self.var(y) for y in self.match(x)])
+            return None
+        alternatives = [s.new_var() for x in group]
+        alternatives.reverse()
+        s.add_clause([-var] + alternatives)
+        for x, alt in zip(group, alternatives):
+            if x.blocks:
+                self._add_blocker(pkg, x, alt)
+            else:
+                s.add_clause([-alt] + [self.var(y) for y in self.match(x)])
+        return alternatives
+
+    def _add_blocker(self, pkg, blocker, var=None):
+        restrict = self.resolver.generate_mangled_blocker(
+            choice_point(blocker, [pkg]), blocker)
+        self.blockers.append((pkg, blocker, var, restrict))
+        # installed pkgs that are blocked need to be replaceable
+        for x in self.resolver.livefs_dbs.itermatch(restrict):
+            self.match(x.slotted_atom)
+
+    def finalize(self, installed=()):
+        """Add the slotting and blocker constraints of the pkgs found.
+
+        :param installed: pkgs that stay unless replaced
+        """
+        s = self.solver
+        for pkg in installed:
+            self.add_pkg(pkg)
+        self._expand()
+
+        slots = {}
+        for pkg in self.pkgs:
+            slots.setdefault((pkg.key, pkg.slot), []).append(self.var(pkg))
+        for l in slots.itervalues():
+            if len(l) > 1:
+                at_most_one(s, l)
+        for pkg in installed:
+            s.add_clause(slots[(pkg.key, pkg.slot)])
+
+        for pkg, blocker, var, restrict in self.blockers:
+            cond = -self.var(pkg) if var is None else -var
+            for x in self.keys.get(blocker.key, ()):
+                if restrict.match(x):
+                    s.add_clause((cond, -self.var(x)))
+            for x in self._blocked(restrict):
+                s.add_clause([cond] + map(self.var, self._replacements(x, restrict)))
+
+    def _blocked(self, restrict):
+        return self.resolver.livefs_dbs.itermatch(restrict)
+
+    def _replacements(self, pkg, restrict):
+        """Return the candidates replacing a blocked pkg, most preferred first."""
+        return [x for x in self.candidates[pkg.slotted_atom]
+                if not restrict.match(x)]
+
+    def _slotted(self, pkg):
+        """Return pkg followed by the other pkgs in its slot."""
+        return [pkg] + [x for x in self.keys[pkg.key]
+                        if x.slot == pkg.slot and _ident(x) != _ident(pkg)]
+
+    def optimize(self, targets, installed, max_conflicts):
+        """Pick the preferred solution.
+
+        Choices are committed to as they're made, each being the first of
+        its alternatives that a solution exists with.
+
+        :return: False if the conflict budget ran out, True otherwise
+        """
+        s = self.solver
+
+        def prefer(lits):
+            for lit in lits:
+                if s.fixed(lit):
+                    return lit
+            for lit in lits:
+                if s.fixed(lit) is False:
+                    continue
+                if not s.value(lit):
+                    ret = s.solve((lit,), max_conflicts - s.conflicts)
+                    if ret is None:
+                        raise _OutOfBudget()
+                    elif not ret:
+                        s.add_clause((-lit,))
+                        continue
+                s.add_clause((lit,))
+                return lit
+            raise AssertionError("internal error: no viable choice in %r" % (lits,))
+
+        def choose(pkgs):
+            lit = prefer(map(self.var, pkgs))
+            pkg = pkgs[map(self.var, pkgs).index(lit)]
+            if _ident(pkg) not in seen:
+                seen.add(_ident(pkg))
+                queue.append(pkg)
+
+        blockers = {}
+        for x in self.blockers:
+            blockers.setdefault(_ident(x[0]), []).append(x)
+        seen = set()
+        queue = deque()
+        try:
+            for restrict in targets:
+                choose(self.candidates[restrict])
+            for pkg in installed:
+                choose(self._slotted(pkg))
+            while queue:
+                pkg = queue.popleft()
+                for mode, group, alternatives in self.deps[_ident(pkg)]:
+                    if alternatives is not None:
+                        group = [group[alternatives.index(prefer(alternatives))]]
+                    x = group[0]
+                    if not x.blocks:
+                        choose(self.candidates[x])
+                for owner, blocker, var, restrict in blockers.get(_ident(pkg), ()):
+                    if var is not None and not s.fixed(var):
+                        continue
+                    for x in self._blocked(restrict):
+                        choose(self._replacements(x, restrict))
+
+            # drop whatever wasn't required
+            for pkg in self.pkgs:
+                var = self.var(pkg)
+                if s.value(var) and not s.fixed(var):
+                    prefer((-var, var))
+        except _OutOfBudget:
+            return False
+        return True
+
+    def chosen(self):
+        """Return the pkgs true in the solver's model."""
+        value = self.solver.value
+        return [x for x in self.pkgs if value(self.var(x))]
+
+    def order(self, pkgs, targets):
+        """Order pkgs so deps come before what requires them.
+
+        Cycles are broken where found.
+        """
+        chosen = set(map(_ident, pkgs))
+
+        def satisfiers(pkg, modes):
+            for mode, group, alternatives in self.deps.get(_ident(pkg), ()):
+                if mode not in modes:
+                    continue
+                for x in group:
+                    if x.blocks:
+                        # whatever replaces blocked pkgs goes first
+                        for y in self.keys.get(x.key, ()):
+                            if _ident(y) in chosen and not x.match(y):
+                                yield y
+                        continue
+                    l = [y for y in self.candidates[x] if _ident(y) in chosen]
+                    if l:
+                        yield l[0]
+                        break
+
+        roots = []
+        for restrict in targets:
+            roots.extend(
+                x for x in self.candidates[restrict] if _ident(x) in chosen)
+        roots.extend(pkgs)
+
+        pre = ('depends', 'rdepends')
+        seen = set()
+        ordered = []
+        for root in roots:
+            if _ident(root) in seen:
+                continue
+            seen.add(_ident(root))
+            stack = [(root, satisfiers(root, pre))]
+            while stack:
+                pkg, deps = stack[-1]
+                for x in deps:
+                    if _ident(x) not in seen:
+                        seen.add(_ident(x))
+                        stack.append((x, satisfiers(x, pre)))
+                        break
+                else:
+                    stack.pop()
+                    ordered.append(pkg)
+                    for x in satisfiers(pkg, ('post_rdepends',)):
+                        if _ident(x) not in seen:
+                            seen.add(_ident(x))
+                            stack.append((x, satisfiers(x, pre)))
+        return ordered
+
+
+class sat_plan(plan.merge_plan):
+    """Resolver solving all targets at once via a SAT solver.
+
+    Usable wherever :obj:`pkgcore.resolver.plan.merge_plan` is, with the same
+    strategies determining pkg preferences.  Each :obj:`add_atoms` call
+    resolves the targets of all prior calls along with the new ones, and
+    rebuilds the plan from scratch; on failure the plan is left empty.
+
+    Dep cycles aren't constraints, they're broken when ordering the plan;
+    thus ``drop_cycles`` has no effect.
+
+    :ivar conflicts: number of conflicts the solver hit during the last
+        resolution
+    """
+
+    def __init__(self, dbs, *args, **kwds):
+        """
+        :param max_conflicts: bound on the conflicts the solver hits per
+            :obj:`add_atoms` call; if hit prior to finding a solution,
+            resolution fails, otherwise the best solution found is used
+        :param args: see :obj:`pkgcore.resolver.plan.merge_plan.__init__`
+            for valid args
+        :param kwds: see :obj:`pkgcore.resolver.plan.merge_plan.__init__`
+            for valid args
+        """
+        self.max_conflicts = kwds.pop('max_conflicts', 100000)
+        plan.merge_plan.__init__(self, dbs, *args, **kwds)
+        self.targets = []
+        self.conflicts = 0
+
+    def load_vdb_state(self):
+        self.vdb_preloaded = True
+        self._ensure_livefs_is_loaded = \
+            self._ensure_livefs_is_loaded_preloaded
+        if self._resolve(self.targets):
+            raise Exception("couldn't load vdb state")
+
+    def add_atoms(self, restricts, finalize=False):
+        if restricts:
+            targets = self.targets + list(restricts)
+            ret = self._resolve(targets)
+            if ret:
+                return ret
+            self.targets = targets
+        if finalize:
+            self.process_finalize()
+        return ()
+
+    def reset(self, point=0):
+        if point:
+            raise ValueError(
+                "%s plans can only be reset entirely" % self.__class__.__name__)
+        self.state.backtrack(0)
+        self.targets = []
+
+    def _resolve(self, targets):
+        self.state.backtrack(0)
+        f = _formula(self)
+        s = f.solver
+        selectors = [f.add_target(x) for x in targets]
+        installed = ()
+        if self.vdb_preloaded:
+            installed = list(self.livefs_dbs)
+        f.finalize(installed)
+
+        ret = s.solve(selectors, self.max_conflicts)
+        if not ret:
+            # find the first target that can't be added
+            failed = targets[-1] if targets else None
+            for idx in xrange(len(selectors) - 1):
+                if ret is None:
+                    break
+                ret = s.solve(selectors[:idx + 1],
+                              self.max_conflicts - s.conflicts)
+                if ret is not True:
+                    failed = targets[idx]
+                    break
+            self.conflicts = s.conflicts
+            if ret is None:
+                msg = "resolution exceeded %i conflicts" % (self.max_conflicts,)
+            else:
+                msg = "no solution satisfying the deps, slots, and blockers"
+            return self._failure(failed, f.candidates.get(failed, ()), msg)
+
+        for x in selectors:
+            s.add_clause((x,))
+        f.optimize(targets, installed, self.max_conflicts)
+        self.conflicts = s.conflicts
+
+        choices = {}
+        for restrict in targets:
+            state.add_hardref_op(restrict).apply(self.state)
+        for pkg in f.order(f.chosen(), targets):
+            c = choices[_ident(pkg)] = choice_point(pkg.versioned_atom, [pkg])
+            self._insert_pkg(c, pkg)
+        for pkg, blocker, var, restrict in f.blockers:
+            c = choices.get(_ident(pkg))
+            if c is None or (var is not None and not s.value(var)):
+                continue
+            self._ensure_livefs_is_loaded_nonpreloaded(blocker)
+            l = self.state.add_blocker(c, restrict, key=blocker.key)
+            if l:
+                raise AssertionError(
+                    "internal error: blocker %s from %s conflicts w/ %s" %
+                    (blocker, pkg, l))
+        return ()
+
+    def _insert_pkg(self, choices, pkg):
+        # vdb pkgs are inserted regardless of preloading so that pkgs
+        # replacing them are shown as such
+        if not pkg.repo.livefs:
+            self._ensure_livefs_is_loaded_nonpreloaded(pkg.slotted_atom)
+        conflicts = state.add_op(choices, pkg).apply(self.state)
+        if conflicts:
+            if not any(not self.vdb_restrict.match(x) for x in conflicts):
+                conflicts = state.replace_op(choices, pkg).apply(self.state)
+            if conflicts:
+                raise AssertionError(
+                    "internal error: inserting %s conflicts w/ %s" %
+                    (pkg, conflicts))
+
+    def _failure(self, restrict, candidates, msg):
+        stack = plan.resolver_stack()
+        stack.add_frame("none", restrict, choice_point(restrict, candidates),
+            self.default_dbs, self.state.current_state, False)
+        if not candidates:
+            self.notify_viable(stack, restrict, False, "no matches")
+        for pkg in candidates:
+            stack.add_event(('inspecting', pkg))
+            stack.add_event(("choice", str(pkg), False, msg))
+        stack.pop_frame(False)
+        return [restrict], stack.events[-1]
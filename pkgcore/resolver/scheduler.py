@@ -0,0 +1,210 @@
+# License: GPL2/BSD
+
+"""
+parallel execution of a resolved plan's ops
+
+The plan orders ops such that each comes after what it requires.  Build
+order edges are derived from that: an op may be built once the earlier ops
+satisfying its build deps are merged, and merged once it's built and the
+earlier ops satisfying its runtime deps are merged.  Blockers work the
+other way around: an op waits on the ops replacing the pkgs its blockers
+match.  Builds run on worker threads while merges happen one at a time in
+the calling thread.
+"""
+
+__all__ = ("build_graph", "scheduler")
+
+import threading
+import Queue
+
+from snakeoil.sequences import iflatten_instance
+
+from pkgcore.ebuild.atom import atom
+
+
+def _dep_ops(pkg, attr, idx, ops_by_key, replaced_by_key):
+    """Return the indexes of ops that pkg's deps of attr need.
+
+    Those are the prior ops merging pkgs its deps match, and the ops
+    replacing pkgs its blockers match; the latter are returned separately
+    when they come after idx.
+
+    :return: tuple of the set of prior ops' indexes, and the set of later
+        ops' indexes
+    """
+    deps, later = set(), set()
+    for dep in iflatten_instance(getattr(pkg, attr, ()), atom):
+        if not dep.blocks:
+            deps.update(
+                x for x, other in ops_by_key.get(dep.key, ())
+                if x < idx and dep.match(other))
+            continue
+        for x, other in replaced_by_key.get(dep.key, ()):
+            if x != idx and dep.match(other):
+                (deps if x < idx else later).add(x)
+    return deps, later
+
+
+def _reachable(graphs, start, target):
+    """Return whether target is among the ops start waits on, directly or not."""
+    seen = set()
+    stack = [start]
+    while stack:
+        idx = stack.pop()
+        if idx == target:
+            return True
+        if idx in seen:
+            continue
+        seen.add(idx)
+        for graph in graphs:
+            stack.extend(graph[idx])
+    return False
+
+
+def build_graph(ops):
+    """Derive the ordering constraints of a plan's ops.
+
+    Removals act as barriers: they follow every prior op, and every later
+    op follows them.  Ops with blockers matching pkgs replaced later in the
+    plan are made to wait on those replacements unless that would introduce
+    a cycle, in which case the plan's order is kept.
+
+    :param ops: sequence of ops, in the order the plan would execute them
+    :return: tuple of two lists, holding for each op the set of indexes of
+        ops that must be merged before it's built, and before it's merged
+    """
+    ops_by_key, replaced_by_key = {}, {}
+    for idx, op in enumerate(ops):
+        if op.desc != 'remove':
+            ops_by_key.setdefault(op.pkg.key, []).append((idx, op.pkg))
+        if op.desc == 'replace':
+            replaced_by_key.setdefault(op.old_pkg.key, []).append((idx, op.old_pkg))
+
+    build_deps, merge_deps = [], []
+    # (graph, op index, later op index it should wait on)
+    forward = []
+    barrier = None
+    for idx, op in enumerate(ops):
+        if op.desc == 'remove':
+            build = set(xrange(idx))
+            merge = set()
+            barrier = idx
+        else:
+            build, later = _dep_ops(
+                op.pkg, 'depends', idx, ops_by_key, replaced_by_key)
+            forward.extend((build_deps, idx, x) for x in sorted(later))
+            merge, later = _dep_ops(
+                op.pkg, 'rdepends', idx, ops_by_key, replaced_by_key)
+            forward.extend((merge_deps, idx, x) for x in sorted(later))
+            if barrier is not None:
+                build.add(barrier)
+        build_deps.append(build)
+        merge_deps.append(merge)
+
+    graphs = (build_deps, merge_deps)
+    for graph, idx, x in forward:
+        if not _reachable(graphs, x, idx):
+            graph[idx].add(x)
+    return build_deps, merge_deps
+
+
+class scheduler(object):
+    """Run the builds of a plan's ops concurrently, merging them serially.
+
+    :ivar failed: list of (op, exception) tuples for the ops that failed to
+        build or merge, exception being None unless one was raised by build
+    """
+
+    def __init__(self, ops, build, merge, jobs, keep_going=False):
+        """
+        :param ops: sequence of ops, in the order the plan would execute them
+        :param build: callable invoked on a worker thread with an op, returning
+            what's passed on to merge, or False on failure; it isn't invoked
+            for removals
+        :param merge: callable invoked with an op and the result of its build,
+            returning False on failure
+        :param jobs: max number of concurrent builds
+        :param keep_going: if False, no more builds are started after a
+            failure; running ones are allowed to finish
+        """
+        self.ops = tuple(ops)
+        self._build = build
+        self._merge = merge
+        self.jobs = max(jobs, 1)
+        self.keep_going = keep_going
+        self.build_deps, self.merge_deps = build_graph(self.ops)
+        self.failed = []
+
+    def _worker(self, idx, results):
+        try:
+            result = self._build(self.ops[idx])
+        except Exception as e:
+            result = e
+        results.put((idx, result))
+
+    def run(self):
+        """Execute the ops.
+
+        :return: True if all ops succeeded, False otherwise
+        """
+        ops = self.ops
+        # ops done with, failed or not
+        merged = set()
+        started = set()
+        built = {}
+        results = Queue.Queue()
+        running = 0
+        stop = False
+
+        while len(merged) < len(ops):
+            # start whatever builds are unblocked, lowest index first
+            for idx, op in enumerate(ops):
+                if stop or running >= self.jobs:
+                    break
+                if idx in started or not self.build_deps[idx].issubset(merged):
+                    continue
+                started.add(idx)
+                if op.desc == 'remove':
+                    built[idx] = None
+                    continue
+                t = threading.Thread(target=self._worker, args=(idx, results))
+                t.daemon = True
+                t.start()
+                running += 1
+
+            # merge whatever's ready, in plan order
+            progress = False
+            for idx in sorted(built):
+                if not self.merge_deps[idx].issubset(merged):
+                    continue
+                if self._merge(ops[idx], built.pop(idx)) is False:
+                    self._fail(idx)
+                    stop = not self.keep_going
+                merged.add(idx)
+                progress = True
+            if progress:
+                continue
+
+            if not running:
+                # nothing left that can make progress
+                break
+
+            # waiting w/out a timeout blocks signals, thus KeyboardInterrupt
+            while True:
+                try:
+                    idx, result = results.get(True, 0.1)
+                    break
+                except Queue.Empty:
+                    continue
+            running -= 1
+            if result is False or isinstance(result, Exception):
+                self._fail(idx, result or None)
+                merged.add(idx)
+                stop = not self.keep_going
+            else:
+                built[idx] = result
+
+        return not self.failed and len(merged) == len(ops)
+
+    def _fail(self, idx, error=None):
+        self.failed.append((self.ops[idx], error))
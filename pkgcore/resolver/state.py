@@ -63,6 +63,34 @@ class plan_state(object):
             if reversion_count:
                 self.plan = self.plan[:-reversion_count]
 
+    def snapshot(self, keys):
+        """Capture the slotting, limiters, and vdb filtering of keys.
+
+        :return: opaque object for :obj:`matches_snapshot`
+        """
+        slots = self.state.slot_dict
+        limiters = self.state.limiters
+        keys = frozenset(keys)
+        vdb = tuple(x for x in self.vdb_filter if x.key in keys)
+        return (keys, vdb, tuple(
+            (k, tuple(slots.get(k, ())), tuple(limiters.get(k, ())))
+            for k in keys))
+
+    def matches_snapshot(self, snapshot):
+        """Whether the keys of a snapshot are still in the captured state.
+
+        Entries are compared by identity.
+        """
+        keys, vdb, entries = snapshot
+        slots = self.state.slot_dict
+        limiters = self.state.limiters
+        for k, slotted, limits in entries:
+            if not (_same(slots.get(k, ()), slotted) and
+                    _same(limiters.get(k, ()), limits)):
+                return False
+        return (set(map(id, vdb)) ==
+                set(id(x) for x in self.vdb_filter if x.key in keys))
+
     def iter_ops(self, return_livefs=False):
         iterable = (x for x in self.plan if not x.internal)
         if return_livefs:
@@ -84,6 +112,10 @@ class plan_state(object):
         return len(self.plan)
 
 
+def _same(seq1, seq2):
+    return len(seq1) == len(seq2) and all(x is y for x, y in zip(seq1, seq2))
+
+
 class ops_sequence(object):
 
     def __init__(self, sequence, is_livefs=True):
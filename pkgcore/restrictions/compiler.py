@@ -0,0 +1,227 @@
+# License: GPL2/BSD
+
+"""
+compile package restrictions into flat python functions
+
+Matching a restriction walks its tree per pkg, each PackageRestriction
+pulling its attribute and invoking its child's match.  The functions
+generated here evaluate the same tree as straight line code, pulling each
+attribute at most once and inlining the common value checks.
+"""
+
+__all__ = ("compile_restriction", "compile_selector")
+
+from pkgcore.restrictions import boolean, packages, restriction, values
+
+_sentinel = packages.PackageRestriction_mixin.__sentinel__
+_unset = object()
+_once = (None,)
+
+
+def _match_owner_cls(kls):
+    for kls in kls.__mro__:
+        if 'match' in kls.__dict__:
+            return kls
+    return None
+
+
+def _match_owner(restrict):
+    """Return the class implementing restrict's match."""
+    return _match_owner_cls(type(restrict))
+
+_attr_leaf_owner = _match_owner_cls(packages.PackageRestriction)
+_str_exact_owner = _match_owner_cls(values.StrExactMatch)
+
+
+def _boolean_kind(restrict):
+    """Return the boolean class restrict matches as, if it can be flattened."""
+    owner = _match_owner(restrict)
+    if owner not in (boolean.AndRestriction, boolean.OrRestriction):
+        return None
+    elif isinstance(restrict.restrictions, list):
+        # not finalized, thus members can still be added
+        return None
+    return owner
+
+
+def _is_conjunction(restrict):
+    """Whether restrict matches as a non negated AND of its members."""
+    return _boolean_kind(restrict) is boolean.AndRestriction and not restrict.negate
+
+
+def _is_disjunction(restrict):
+    return _boolean_kind(restrict) is boolean.OrRestriction and not restrict.negate
+
+
+def _is_attr_leaf(restrict):
+    return (_match_owner(restrict) is _attr_leaf_owner and
+            isinstance(restrict, packages.PackageRestriction))
+
+
+class _Compiler(object):
+
+    def __init__(self):
+        self.namespace = {'_sentinel': _sentinel, '_unset': _unset, '_once': _once}
+        self.lines = []
+        # attr -> local variable holding its value
+        self.attr_vars = {}
+        # variables assigned somewhere, and those definitely assigned at
+        # the current point of the generated code
+        self.assigned = set()
+        self.known = set()
+        self.guarded = set()
+
+    def bind(self, obj, prefix):
+        name = '%s%i' % (prefix, len(self.namespace))
+        self.namespace[name] = obj
+        return name
+
+    def emit(self, depth, line):
+        self.lines.append('%s%s' % ('    ' * depth, line))
+
+    def fetch(self, restrict, depth):
+        """Emit pulling the attr of restrict, returning the variable holding it."""
+        attr = restrict.attr
+        var = self.attr_vars.get(attr)
+        if var is None:
+            var = self.attr_vars[attr] = 'v%i' % len(self.attr_vars)
+        if var in self.known:
+            return var
+        pull = self.bind(restrict._pull_attr, '_pull')
+        if var in self.assigned:
+            # may have been pulled by an earlier branch
+            self.guarded.add(var)
+            self.emit(depth, 'if %s is _unset:' % var)
+            self.emit(depth + 1, '%s = %s(pkg)' % (var, pull))
+        else:
+            self.emit(depth, '%s = %s(pkg)' % (var, pull))
+        self.assigned.add(var)
+        self.known.add(var)
+        return var
+
+    def value_expr(self, restrict, var):
+        if isinstance(restrict, restriction.AlwaysBool):
+            return repr(bool(restrict.negate))
+        elif _match_owner(restrict) is _str_exact_owner:
+            exact = self.bind(restrict.exact, '_c')
+            # match() compares the stringified value
+            var = 'str(%s)' % (var,)
+            if not restrict.case_sensitive:
+                var = '%s.lower()' % (var,)
+            return '(%s %s %s)' % (var, '!=' if restrict.negate else '==', exact)
+        return '%s(%s)' % (self.bind(restrict.match, '_m'), var)
+
+    def leaf_expr(self, restrict, var):
+        expr = self.value_expr(restrict.restriction, var)
+        if restrict.negate:
+            return '(%s is _sentinel or not %s)' % (var, expr)
+        return '(%s is not _sentinel and %s)' % (var, expr)
+
+    def expr(self, restrict):
+        """Generate an expression matching restrict, pulling nothing itself."""
+        if isinstance(restrict, restriction.AlwaysBool):
+            return repr(bool(restrict.negate))
+        elif _is_attr_leaf(restrict):
+            var = self.attr_vars.get(restrict.attr)
+            if var in self.known:
+                return self.leaf_expr(restrict, var)
+        elif _boolean_kind(restrict) is not None:
+            op = ' and ' if _boolean_kind(restrict) is boolean.AndRestriction else ' or '
+            exprs = [self.expr(x) for x in restrict.restrictions]
+            if not exprs:
+                expr = repr(op == ' and ')
+            else:
+                expr = '(%s)' % op.join(exprs)
+            if restrict.negate:
+                return '(not %s)' % (expr,)
+            return expr
+        return '%s(pkg)' % (self.bind(restrict.match, '_m'),)
+
+    def test(self, restrict, depth):
+        """Emit the pulls restrict needs, returning the expression testing it."""
+        if _is_attr_leaf(restrict):
+            return self.leaf_expr(restrict, self.fetch(restrict, depth))
+        return self.expr(restrict)
+
+    def require(self, restrict, depth, fail):
+        """Emit code running fail unless restrict matches."""
+        if _is_conjunction(restrict):
+            for x in restrict.restrictions:
+                self.require(x, depth, fail)
+        elif _is_disjunction(restrict) and not fail.startswith('break'):
+            # jump out of a single pass loop on the first member matching
+            known = set(self.known)
+            self.emit(depth, 'for _ in _once:')
+            for x in restrict.restrictions:
+                self.emit(depth + 1, 'if %s:' % (self.test(x, depth + 1),))
+                self.emit(depth + 2, 'break')
+            self.emit(depth + 1, fail)
+            self.known = known
+        else:
+            self.emit(depth, 'if not %s:' % (self.test(restrict, depth),))
+            self.emit(depth + 1, fail)
+
+    def alternative(self, restrict, depth, success):
+        """Emit code running success if restrict matches, falling through otherwise."""
+        known = set(self.known)
+        if _is_conjunction(restrict):
+            self.emit(depth, 'for _ in _once:')
+            self.require(restrict, depth + 1, 'break')
+            self.emit(depth + 1, success)
+        else:
+            self.emit(depth, 'if %s:' % (self.test(restrict, depth),))
+            self.emit(depth + 1, success)
+        self.known = known
+
+    def build(self, name, body):
+        init = sorted(self.guarded)
+        if init:
+            body.insert(0, '    %s = _unset' % (' = '.join(init),))
+        source = 'def %s(pkg):\n%s\n' % (name, '\n'.join(body))
+        code = compile(source, '<compiled %s>' % (name,), 'exec')
+        exec(code, self.namespace)
+        f = self.namespace[name]
+        f.source = source
+        return f
+
+
+def compile_restriction(restrict):
+    """Compile a package restriction into a function matching it.
+
+    :return: callable taking a pkg, returning the same result as
+        restrict.match would
+    """
+    c = _Compiler()
+    kind = _boolean_kind(restrict)
+    if kind is boolean.OrRestriction:
+        result = not restrict.negate
+        for x in restrict.restrictions:
+            c.alternative(x, 1, 'return %r' % (result,))
+        c.emit(1, 'return %r' % (not result,))
+    elif kind is boolean.AndRestriction:
+        result = not restrict.negate
+        for x in restrict.restrictions:
+            c.require(x, 1, 'return %r' % (not result,))
+        c.emit(1, 'return %r' % (result,))
+    elif _is_attr_leaf(restrict):
+        c.emit(1, 'return %s' % (c.test(restrict, 1),))
+    else:
+        # nothing to flatten
+        return restrict.match
+    return c.build('match', c.lines)
+
+
+def compile_selector(pairs):
+    """Compile (restriction, data) pairs into a function selecting data.
+
+    Attributes the restrictions have in common are only pulled once per pkg.
+
+    :return: callable taking a pkg, returning a list of the data of each
+        pair whose restriction matches it, in the order given
+    """
+    c = _Compiler()
+    c.emit(1, 'l = []')
+    for restrict, data in pairs:
+        c.alternative(restrict, 1, 'l.append(%s)' % (c.bind(data, '_d'),))
+    c.emit(1, 'return l')
+    return c.build('select', c.lines)
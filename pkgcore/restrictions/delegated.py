@@ -19,15 +19,18 @@ class delegate(restriction.base):
     :obj:`pkgcore.ebuild.domain`.
     """
 
-    __slots__ = ('_transform', 'negate')
+    __slots__ = ('_transform', 'negate', 'cost')
 
     type = packages.package_type
     inst_caching = False
 
-    def __init__(self, transform_func, negate=False):
+    def __init__(self, transform_func, negate=False, cost=None):
         """
         :param transform_func: callable invoked with data, pkg, and mode
             mode may be "match", "force_True", or "force_False"
+        :param cost: estimated cost of invoking transform_func, see
+            :obj:`pkgcore.restrictions.util.restriction_cost`; if None it's
+            assumed to require a metadata pull
         """
 
         if not callable(transform_func):
@@ -35,6 +38,7 @@ class delegate(restriction.base):
 
         object.__setattr__(self, "negate", negate)
         object.__setattr__(self, "_transform", transform_func)
+        object.__setattr__(self, "cost", cost)
 
     def match(self, pkginst):
         return self._transform(pkginst, "match") != self.negate
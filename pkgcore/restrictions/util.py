@@ -37,3 +37,112 @@ def collect_package_restrictions(restrict, attrs=None, invert=False):
         for r in iflatten_func(restrict, _is_package_instance):
             if invert == attrs.isdisjoint(getattr(r, 'attrs', ())):
                 yield r
+
+
+# pkg attributes available without pulling metadata
+cheap_attrs = frozenset([
+    "category", "package", "key", "cpvstr", "version", "revision", "fullver",
+    "unversioned_atom", "versioned_atom", "repo",
+])
+
+# attributes costing more than the metadata pull, requiring further disk access
+_costly_attrs = {
+    "contents": 100,
+    "environment": 100,
+}
+
+CHEAP_COST = 1
+METADATA_COST = 10
+
+_reorderable = (boolean.AndRestriction, boolean.OrRestriction)
+
+
+def _attr_cost(attr):
+    attr = attr.split('.', 1)[0]
+    if attr in cheap_attrs:
+        return CHEAP_COST
+    return _costly_attrs.get(attr, METADATA_COST)
+
+
+def restriction_cost(restrict):
+    """Estimate the relative cost of matching a restriction against a pkg.
+
+    Restrictions can declare their cost via a cost attribute; otherwise
+    they're costed by the pkg attributes they pull, those not stating their
+    attributes assumed to require a metadata pull.  Boolean restrictions cost
+    as much as their most expensive member since the first metadata pull
+    dominates.
+
+    :return: :obj:`CHEAP_COST` for restrictions not requiring metadata,
+        :obj:`METADATA_COST` for those that do, or more for yet more costly ones
+    """
+    cost = getattr(restrict, 'cost', None)
+    if cost is not None:
+        return cost
+    elif isinstance(restrict, restriction.AlwaysBool):
+        return 0
+    elif isinstance(restrict, boolean.base):
+        return max([0] + [restriction_cost(x) for x in restrict.restrictions])
+    attrs = getattr(restrict, 'attrs', None)
+    if attrs is None:
+        attr = getattr(restrict, 'attr', None)
+        if attr is None:
+            return METADATA_COST
+        attrs = (attr,)
+    return max(_attr_cost(x) for x in attrs)
+
+
+def order_by_cost(restrict, forcing=False):
+    """Reorder boolean restrictions to evaluate their cheapest members first.
+
+    Matching results are unaffected; booleans short circuit on the first
+    member deciding the result, thus the costly members are only evaluated
+    if the cheap ones can't decide it.
+
+    :param forcing: if True, the restriction is used to force matches; only
+        non negated AndRestrictions are reordered and only by moving the
+        members not requiring metadata to the front, the order of the rest
+        affecting the solution found
+    :return: equivalent restriction, or restrict itself if nothing changed
+    """
+    if restrict.__class__ not in _reorderable:
+        return restrict
+    l = [order_by_cost(x, forcing) for x in restrict.restrictions]
+    if not forcing:
+        l.sort(key=restriction_cost)
+    elif restrict.__class__ is boolean.AndRestriction and not restrict.negate:
+        l.sort(key=lambda x: restriction_cost(x) >= METADATA_COST)
+    if all(x is y for x, y in zip(l, restrict.restrictions)):
+        return restrict
+    return restrict.change_restrictions(*l)
+
+
+def split_by_cost(restrict, threshold=METADATA_COST):
+    """Split a restriction into the parts cheaper than threshold, and the rest.
+
+    Only the members of non negated AndRestrictions are split apart.
+
+    :return: (cheap, rest) pair of restrictions that together match as
+        restrict does, either being None if there's nothing to put in it
+    """
+    if restriction_cost(restrict) < threshold:
+        return restrict, None
+    elif restrict.__class__ is not boolean.AndRestriction or restrict.negate:
+        return None, restrict
+    cheap, rest = [], []
+    for x in restrict.restrictions:
+        if restriction_cost(x) < threshold:
+            cheap.append(x)
+        else:
+            rest.append(x)
+    if not cheap:
+        return None, restrict
+    if len(cheap) > 1:
+        cheap = restrict.change_restrictions(*cheap)
+    else:
+        cheap = cheap[0]
+    if len(rest) > 1:
+        rest = restrict.change_restrictions(*rest)
+    else:
+        rest = rest[0]
+    return cheap, rest
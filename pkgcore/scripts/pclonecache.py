@@ -6,6 +6,8 @@
 
 import time
 
+from snakeoil.osutils import pjoin
+
 from pkgcore.util import commandline
 
 argparser = commandline.ArgumentParser(domain=False, description=__doc__)
@@ -19,6 +21,52 @@ argparser.add_argument(
     help="target cache to update.  Must be writable.")
 
 
+class _chfs(object):
+    """Stand-in for the data a cache entry's chksums were taken from."""
+
+    def __init__(self, **chfs):
+        self.__dict__.update(chfs)
+
+
+def _eclass_chfs(eclass, chfs):
+    data = _chfs()
+    for chf, val in chfs:
+        if chf == 'eclassdir':
+            data.path = pjoin(val, '%s.eclass' % (eclass,))
+        else:
+            setattr(data, chf, val)
+    return data
+
+
+def convert_entry(source, values):
+    """Convert an entry read from source into what target expects to store.
+
+    Read entries hold their chksum under the backend's chf key and their
+    eclasses as a sequence of (eclass, chfs) pairs, while stores take a
+    ``_chf_`` object and a mapping of eclass to chksummed objects.
+    """
+    d = dict(values)
+    d['_chf_'] = _chfs(**{source.chf_type: d.pop(source._chf_key)})
+    eclasses = d.get('_eclasses_')
+    if eclasses:
+        d['_eclasses_'] = dict(
+            (eclass, _eclass_chfs(eclass, chfs)) for eclass, chfs in eclasses)
+    return d
+
+
+@argparser.bind_final_check
+def _validate_args(parser, namespace):
+    source, target = namespace.source, namespace.target
+    # chksums missing from the source can't be made up
+    missing = set(target.eclass_chf_types).difference(source.eclass_chf_types)
+    if source.chf_type != target.chf_type:
+        missing.add(target.chf_type)
+    if missing:
+        parser.error(
+            "source cache entries lack the chksums the target cache is "
+            "validated by: %s" % ', '.join(sorted(missing)))
+
+
 @argparser.bind_main_func
 def main(options, out, err):
     if options.target.readonly:
@@ -28,7 +76,7 @@ def main(options, out, err):
 
     source, target = options.source, options.target
     if not target.autocommits:
-        target.sync_rate = 1000
+        target.sync_rate = max(target.sync_rate, 1000)
     if options.verbose:
         out.write("grabbing target's existing keys")
     valid = set()
@@ -36,11 +84,11 @@ def main(options, out, err):
     if options.verbose:
         for k, v in source.iteritems():
             out.write("updating %s" % (k,))
-            target[k] = v
+            target[k] = convert_entry(source, v)
             valid.add(k)
     else:
         for k, v in source.iteritems():
-            target[k] = v
+            target[k] = convert_entry(source, v)
             valid.add(k)
 
     for x in target.iterkeys():
@@ -49,5 +97,8 @@ def main(options, out, err):
                 out.write("deleting %s" % (x,))
             del target[x]
 
+    if not target.autocommits:
+        target.commit()
+
     if options.verbose:
         out.write("took %i seconds" % int(time.time() - start))
@@ -36,8 +36,9 @@ demandload(
     'operator:attrgetter,itemgetter',
     'snakeoil.sequences:iflatten_instance,unstable_unique',
     'pkgcore:fetch',
+    'pkgcore.ebuild:conditionals',
     'pkgcore.package:errors',
-    'pkgcore.restrictions:packages',
+    'pkgcore.restrictions:boolean,packages',
 )
 
 argparser = arghparse.ArgumentParser(
@@ -206,6 +207,9 @@ class eapi_usage_kls(histo_data):
     summary_format = ("eapi: %(key)r %(val)s pkgs found, %(percent)s of all repositories")
 
     def get_data(self, repo, options):
+        if hasattr(repo, 'metadata_columns'):
+            store = repo.metadata_columns(['EAPI'])
+            return store.histogram('EAPI', lambda x: (x or '0',)), len(store)
         eapis = {}
         pos = 0
         for pos, pkg in enumerate(repo):
@@ -218,6 +222,12 @@ eapi_usage = subparsers.add_parser(
 eapi_usage.bind_class(eapi_usage_kls())
 
 
+def _split_licenses(value):
+    return unstable_unique(iflatten_instance(conditionals.DepSet.parse(
+        value, str, operators={
+            "||": boolean.OrRestriction, "": boolean.AndRestriction})))
+
+
 class license_usage_kls(histo_data):
 
     per_repo_format = "license: %(key)r %(val)s pkgs found, %(percent)s of the repository"
@@ -225,6 +235,9 @@ class license_usage_kls(histo_data):
     summary_format = "license: %(key)r %(val)s pkgs found, %(percent)s of all repositories"
 
     def get_data(self, repo, options):
+        if hasattr(repo, 'metadata_columns'):
+            store = repo.metadata_columns(['LICENSE'])
+            return store.histogram('LICENSE', _split_licenses), len(store)
         data = {}
         pos = 0
         for pos, pkg in enumerate(repo):
@@ -245,9 +258,26 @@ class eclass_usage_kls(histo_data):
     summary_format = "eclass: %(key)r %(val)s pkgs found, %(percent)s of all repositories"
 
     def get_data(self, repo, options):
+        if hasattr(repo, 'metadata_columns'):
+            store = repo.metadata_columns(['_eclasses_'])
+            return store.histogram('_eclasses_', tuple), len(store)
+        caches = getattr(repo, 'cache', ())
+        if hasattr(caches, 'commit'):
+            caches = (caches,)
+        # use the caches' persisted eclass indexes to avoid loading each pkg's
+        # metadata, only falling back to it for pkgs they lack.
+        indexes = [x.eclass_index for x in caches
+                   if hasattr(x, 'load_eclass_index') and
+                   x.load_eclass_index(rebuild=False)]
         pos, data = 0, defaultdict(lambda:0)
         for pos, pkg in enumerate(repo):
-            for eclass in getattr(pkg, 'inherited', ()):
+            for index in indexes:
+                inherited = index.get(pkg.cpvstr)
+                if inherited is not None:
+                    break
+            else:
+                inherited = getattr(pkg, 'inherited', ())
+            for eclass in inherited:
                 data[eclass] += 1
         return data, pos + 1
 
@@ -7,6 +7,7 @@
 __all__ = (
     "sync", "sync_main", "copy", "copy_main", "regen", "regen_main",
     "perl_rebuild", "perl_rebuild_main", "env_update", "env_update_main",
+    "ebd_pool", "ebd_pool_main",
 )
 
 from snakeoil.cli import arghparse
@@ -18,16 +19,19 @@ from pkgcore.operations import OperationError
 demandload(
     'collections:defaultdict',
     'errno',
+    'itertools:izip',
     'multiprocessing:cpu_count',
     'os',
     're',
+    'sys',
     'textwrap',
     'time',
     'snakeoil:compatibility',
     'snakeoil.fileutils:AtomicWriteFile',
     'snakeoil.osutils:pjoin,listdir_dirs',
     'snakeoil.sequences:iter_stable_unique',
-    'pkgcore.ebuild:processor,triggers',
+    'pkgcore.ebuild:cpv,processor,triggers',
+    'pkgcore.ebuild:ebd_pool@ebd_pool_mod',
     'pkgcore.fs:contents,livefs',
     'pkgcore.merge:triggers@merge_triggers',
     'pkgcore.operations:observer',
@@ -210,19 +214,30 @@ def update_pkg_desc_index(repo, out, err):
     try:
         f = AtomicWriteFile(pkg_desc_index)
         res = defaultdict(dict)
-        for p in repo:
-            try:
-                res[p.key][p] = p.description
-            except compatibility.IGNORED_EXCEPTIONS as e:
-                if isinstance(e, KeyboardInterrupt):
-                    return
-                raise
-            except Exception as e:
-                err.write("caught exception '%s' while processing '%s'", (e, p))
+        if hasattr(repo, 'metadata_columns'):
+            # read descriptions in bulk rather than via pkg objects
+            store = repo.metadata_columns(['DESCRIPTION'])
+            for cpvstr, description in izip(store.cpvs, store.column('DESCRIPTION')):
+                p = cpv.versioned_CPV(cpvstr)
+                res[p.key][p] = description.strip()
+            for cpvstr, e in sorted(store.failures.iteritems()):
+                err.write("caught exception '%s' while processing '%s'" % (e, cpvstr))
                 ret = os.EX_DATAERR
+        else:
+            for p in repo:
+                try:
+                    res[p.key][p] = p.description
+                except compatibility.IGNORED_EXCEPTIONS as e:
+                    if isinstance(e, KeyboardInterrupt):
+                        return
+                    raise
+                except Exception as e:
+                    err.write("caught exception '%s' while processing '%s'", (e, p))
+                    ret = os.EX_DATAERR
         for key in sorted(res):
             pkgs = sorted(res[key])
-            f.write('%s %s: %s\n' % (key, ' '.join(p.fullver for p in pkgs), pkgs[-1].description))
+            f.write('%s %s: %s\n' % (
+                key, ' '.join(p.fullver for p in pkgs), res[key][pkgs[-1]]))
         f.close()
     except IOError as e:
         err.write("Unable to update pkg_desc_index file '%s': %s" % (pkg_desc_index, e.strerror))
@@ -258,6 +273,28 @@ regen_opts.add_argument(
         Number of threads to use for regeneration, defaults to using all
         available processors.
     """)
+regen_opts.add_argument(
+    "--jobs-mode", choices=("thread", "process"), default="thread",
+    help="run regeneration jobs in threads or in separate processes",
+    docs="""
+        Controls how the parallel regeneration jobs are run. Threads share a
+        single python process, thus the python side of regeneration (parsing
+        and cache writes) is serialized. Processes sidestep that, each one
+        driving its own ebuild processors, at the cost of requiring caches
+        that write updates out immediately; regen falls back to threads for
+        repos whose caches queue up updates.
+    """)
+regen_opts.add_argument(
+    "--changed-paths", metavar='FILE',
+    help="only regenerate metadata affected by the paths listed in FILE",
+    docs="""
+        Read a list of changed files, one per line, from FILE (or stdin if
+        FILE is '-') and only regenerate the metadata they affect; that is
+        the changed ebuilds themselves and every package inheriting a
+        changed eclass. Paths are either absolute or relative to the repo,
+        thus the output of a command like **git diff --name-only** can be
+        used directly. Cache entries for removed ebuilds are dropped.
+    """)
 regen_opts.add_argument(
     "--force", action='store_true', default=False,
     help="force regeneration to occur regardless of staleness checks or repo settings")
@@ -275,6 +312,17 @@ def regen_main(options, out, err):
     """Regenerate a repository cache."""
     ret = []
 
+    changed_paths = None
+    if options.changed_paths is not None:
+        try:
+            if options.changed_paths == '-':
+                changed_paths = sys.stdin.read().split('\n')
+            else:
+                with open(options.changed_paths) as f:
+                    changed_paths = f.read().split('\n')
+        except IOError as e:
+            regen.error("failed reading changed paths: %s" % (e,))
+
     for repo in iter_stable_unique(options.repos):
         if not repo.operations.supports("regen_cache"):
             out.write("repository %s doesn't support cache regeneration" % (repo,))
@@ -285,7 +333,8 @@ def regen_main(options, out, err):
 
         start_time = time.time()
         repo.operations.regen_cache(
-            threads=options.threads,
+            threads=options.threads, jobs_mode=options.jobs_mode,
+            changed_paths=changed_paths,
             observer=observer.formatter_output(out), force=options.force,
             eclass_caching=(not options.disable_eclass_caching))
         end_time = time.time()
@@ -371,6 +420,41 @@ def env_update_main(options, out, err):
     return 0
 
 
+ebd_pool = subparsers.add_parser(
+    "ebd-pool", parents=shared_options,
+    description="serve a pool of ebuild processors shared across invocations")
+ebd_pool.add_argument(
+    "socket", nargs='?', default=None,
+    help="path of the socket to listen on",
+    docs="""
+        Path of the UNIX socket to listen on, defaults to the value of the
+        PKGCORE_EBD_POOL environment variable.
+
+        pkgcore invocations with PKGCORE_EBD_POOL pointing at the socket lease
+        ebuild processors from the pool rather than spawning their own,
+        avoiding the startup cost of a new processor each run. Only metadata
+        generation uses pooled processors; since they run with the pool's
+        environment and output, build phases always spawn their own.
+    """)
+@ebd_pool.bind_main_func
+def ebd_pool_main(options, out, err):
+    path = options.socket
+    if path is None:
+        path = os.environ.get(ebd_pool_mod.POOL_ENV_VAR)
+        if not path:
+            ebd_pool.error(
+                "no socket specified and %s isn't set" % ebd_pool_mod.POOL_ENV_VAR)
+    out.write("serving ebuild processors on %r" % (path,))
+    try:
+        ebd_pool_mod.PoolServer(path).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except EnvironmentError as e:
+        err.write("failed serving on %r: %s" % (path, e))
+        return 1
+    return 0
+
+
 mirror = subparsers.add_parser(
     "mirror", parents=shared_options_domain,
     description="mirror the sources for a package in full- grab everything that could be required")
@@ -14,6 +14,7 @@ __all__ = ("AmbiguousQuery", "NoMatches")
 
 from functools import partial
 import sys
+import threading
 from time import time
 
 from snakeoil.sequences import iflatten_instance, stable_unique
@@ -21,8 +22,10 @@ from snakeoil.strings import pluralism
 
 from pkgcore.ebuild import resolver, restricts
 from pkgcore.ebuild.atom import atom
+from pkgcore.fetch.prefetch import prefetcher
 from pkgcore.merge import errors as merge_errors
 from pkgcore.operations import observer, format
+from pkgcore.resolver.scheduler import scheduler
 from pkgcore.resolver.util import reduce_to_failures
 from pkgcore.restrictions import packages
 from pkgcore.restrictions.boolean import OrRestriction
@@ -117,6 +120,37 @@ merge_mode.add_argument(
         specified.
     """)
 
+merge_mode.add_argument(
+    '-j', '--jobs', type=int, default=1, metavar='NUM',
+    help="number of packages to build in parallel",
+    docs="""
+        Build up to NUM packages concurrently. Packages are only built once
+        the packages satisfying their build dependencies are merged, while
+        merging itself still happens one package at a time.
+
+        Setting PORT_LOGDIR is recommended as otherwise the output of the
+        concurrent builds is interleaved on the terminal.
+    """)
+merge_mode.add_argument(
+    '--fetch-jobs', type=int, default=0, metavar='NUM',
+    help="number of packages to fetch in the background",
+    docs="""
+        Fetch the files of up to NUM upcoming packages concurrently while
+        earlier packages are built, instead of fetching each package's files
+        right before building it. Packages sharing files are never fetched
+        at the same time. Only one fetch command writes its progress to the
+        terminal at a time; the output of the others is shown once they finish.
+
+        Defaults to 0, disabling background fetching.
+    """)
+merge_mode.add_argument(
+    '--fetch-ahead', type=int, default=3, metavar='NUM',
+    help="number of packages to fetch ahead of the one being built",
+    docs="""
+        When fetching in the background, limit it to the files of the next
+        NUM packages past the furthest one being built. Defaults to 3.
+    """)
+
 resolution_options = argparser.add_argument_group("resolver options")
 resolution_options.add_argument(
     '-u', '--upgrade', action='store_true',
@@ -144,6 +178,15 @@ resolution_options.add_argument(
         to conflict with already installed dependencies that aren't involved in
         the graph of the requested operation.
     """)
+resolution_options.add_argument(
+    '--resolver-cache-pkgs', type=int, metavar='NUM',
+    help="limit the number of pkgs the resolver keeps cached",
+    docs="""
+        Bound the memory used by the resolver's query caches to roughly NUM
+        package instances, evicting the least recently used queries once
+        exceeded. By default all queries stay cached until resolution is done,
+        trading memory for speed.
+    """)
 resolution_options.add_argument(
     '-i', '--ignore-cycles', action='store_true',
     help="ignore unbreakable dep cycles",
@@ -492,6 +535,143 @@ def load_world(namespace, attr):
     setattr(namespace, attr, value)
 
 
+def fetch_pkg(domain, pkg, observer):
+    """Fetch the files of pkg, returning its operations or None on failure."""
+    pkg_ops = domain.pkg_operations(pkg, observer=observer)
+    if not pkg_ops.run_if_supported("fetch", or_return=True):
+        return None
+    return pkg_ops
+
+
+def start_prefetch(options, out, lock, domain, changes):
+    """Start fetching the files of a plan's pkgs in the background, if enabled.
+
+    :param lock: lock held by everything else writing to out
+    """
+    if options.fetch_jobs < 1:
+        return None
+    # workers run concurrently with each other and the merge loop
+    fetch_obs = observer.build_observer(
+        observer.threadsafe_output(observer.formatter_output(out), lock),
+        not options.debug)
+    prefetch = prefetcher(
+        [op.pkg for op in changes if op.desc != "remove"],
+        partial(fetch_pkg, domain, observer=fetch_obs),
+        jobs=options.fetch_jobs, lookahead=max(options.fetch_ahead, 0))
+    prefetch.start()
+    return prefetch
+
+
+def parallel_merge(options, out, domain, changes, update_world):
+    """Build the ops of a plan concurrently, merging them one at a time."""
+    lock = threading.Lock()
+    # fetchers write progress straight to the terminal; run one at a time
+    fetch_lock = threading.Lock()
+    quiet = not options.debug
+    change_count = len(changes)
+    repo_obs = observer.repo_observer(
+        observer.threadsafe_output(observer.formatter_output(out), lock), quiet)
+    prefetch = start_prefetch(options, out, lock, domain, changes)
+
+    def write(*args, **kwds):
+        with lock:
+            out.write(*args, **kwds)
+
+    def error(msg):
+        with lock:
+            out.error(msg)
+
+    def build(op):
+        prefix = '[%s] ' % (op.pkg.cpvstr,)
+        build_obs = observer.build_observer(observer.threadsafe_output(
+            observer.formatter_output(out), lock, prefix), quiet)
+        if prefetch is not None:
+            pkg_ops = prefetch.wait(op.pkg)
+        else:
+            with fetch_lock:
+                write("%sfetching %i files" % (prefix, len(op.pkg.fetchables)))
+                pkg_ops = fetch_pkg(domain, op.pkg, build_obs)
+        if pkg_ops is None:
+            error("%sfetching failed" % (prefix,))
+            return False
+        cleanup = [op.pkg.release_cached_data]
+        buildop = pkg_ops.run_if_supported("build", or_return=None)
+        pkg = op.pkg
+        if buildop is not None:
+            write("%sbuilding" % (prefix,))
+            try:
+                pkg = buildop.finalize()
+            except format.errors as e:
+                error("%sfailed building: %s" % (prefix, e))
+                return False
+            if pkg is False:
+                error("%sfailed building" % (prefix,))
+                return False
+            cleanup.append(pkg.release_cached_data)
+            pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
+            cleanup.append(buildop.cleanup)
+        cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
+        pkg = pkg_ops.run_if_supported("localize", or_return=pkg)
+        write("%sbuilt" % (prefix,))
+        return pkg, cleanup
+
+    merged = []
+
+    def merge(op, result):
+        merged.append(op)
+        count = len(merged)
+        with lock:
+            out.write("\nMerging %i of %i: %s::%s" % (
+                count, change_count, op.pkg.cpvstr, op.pkg.repo))
+            out.title("%i/%i: %s" % (count, change_count, op.pkg.cpvstr))
+        cleanup = []
+        if op.desc == "remove":
+            write(">>> Removing %s" % op.pkg.cpvstr)
+            i = domain.uninstall_pkg(op.pkg, repo_obs)
+        else:
+            pkg, cleanup = result
+            if op.desc == "replace":
+                if op.old_pkg == pkg:
+                    write(">>> Reinstalling %s" % (pkg.cpvstr))
+                else:
+                    write(">>> Replacing %s with %s" % (
+                        op.old_pkg.cpvstr, pkg.cpvstr))
+                i = domain.replace_pkg(op.old_pkg, pkg, repo_obs)
+                cleanup.append(op.old_pkg.release_cached_data)
+            else:
+                write(">>> Installing %s" % (pkg.cpvstr,))
+                i = domain.install_pkg(pkg, repo_obs)
+        try:
+            i.finish()
+        except merge_errors.BlockModification as e:
+            error("Failed to merge %s: %s" % (op.pkg, e))
+            return False
+        finally:
+            for func in cleanup:
+                func()
+        with lock:
+            update_world(op)
+        return True
+
+    jobs = scheduler(
+        changes, build, merge, options.jobs, keep_going=options.ignore_failures)
+    try:
+        success = jobs.run()
+    finally:
+        if prefetch is not None:
+            prefetch.shutdown()
+    for op, e in jobs.failed:
+        if e is not None:
+            out.error("failed processing %s: %s" % (op.pkg.cpvstr, e))
+    if not success:
+        if jobs.failed:
+            out.error("failed: %s" % ', '.join(op.pkg.cpvstr for op, e in jobs.failed))
+        if not options.ignore_failures:
+            return 1
+    out.write("finished")
+    return 0
+
+
 @argparser.bind_main_func
 def main(options, out, err):
     config = options.config
@@ -600,6 +780,8 @@ def main(options, out, err):
         extra_kwargs['resolver_cls'] = resolver.empty_tree_merge_plan
     if options.debug:
         extra_kwargs['debug'] = True
+    if options.resolver_cache_pkgs:
+        extra_kwargs['cache_max_pkgs'] = options.resolver_cache_pkgs
 
     # XXX: This should recurse on deep
     if options.newuse:
@@ -626,7 +808,8 @@ def main(options, out, err):
         vdbs=installed_repos.repos, dbs=source_repos.repos,
         verify_vdb=options.deep, nodeps=options.nodeps,
         drop_cycles=options.ignore_cycles, force_replace=options.replace,
-        process_built_depends=options.with_bdeps, **extra_kwargs)
+        process_built_depends=options.with_bdeps,
+        repo_parallelism=domain.repo_parallelism, **extra_kwargs)
 
     if options.preload_vdb_state:
         out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
@@ -658,6 +841,10 @@ def main(options, out, err):
 
     if options.debug:
         out.write(out.bold, " * ", out.reset, "resolution took %.2f seconds" % resolve_time)
+        out.write(
+            out.bold, " * ", out.reset,
+            "query cache: %(hits)i hits, %(misses)i misses, %(evictions)i evictions, "
+            "%(pkgs)i pkgs held" % resolver_inst.cache_stats())
 
     if failures:
         out.write()
@@ -717,7 +904,11 @@ def main(options, out, err):
 
     changes = resolver_inst.state.ops(only_real=True)
 
-    build_obs = observer.build_observer(observer.formatter_output(out), not options.debug)
+    # shared with background fetching
+    output_lock = threading.Lock()
+    build_obs = observer.build_observer(
+        observer.threadsafe_output(observer.formatter_output(out), output_lock),
+        not options.debug)
     repo_obs = observer.repo_observer(observer.formatter_output(out), not options.debug)
 
     # don't run pkg_pretend if only fetching
@@ -763,7 +954,23 @@ def main(options, out, err):
             "Would you like to {} these packages?".format(action))):
         return
 
+    def update_world(op):
+        if world_set is not None:
+            if op.desc == "remove":
+                out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
+                removal_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
+                update_worldset(world_set, removal_pkg, remove=True)
+            elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
+                if not options.upgrade:
+                    out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
+                    add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
+                    update_worldset(world_set, add_pkg)
+
+    if options.jobs > 1 and not options.fetchonly:
+        return parallel_merge(options, out, domain, changes, update_world)
+
     change_count = len(changes)
+    prefetch = start_prefetch(options, out, output_lock, domain, changes)
 
     # left in place for ease of debugging.
     cleanup = []
@@ -782,9 +989,12 @@ def main(options, out, err):
                 if not options.fetchonly and options.debug:
                     out.write("Forcing a clean of workdir")
 
-                pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
                 out.write("\n%i files required-" % len(op.pkg.fetchables))
-                if not pkg_ops.run_if_supported("fetch", or_return=True):
+                if prefetch is not None:
+                    pkg_ops = prefetch.wait(op.pkg)
+                else:
+                    pkg_ops = fetch_pkg(domain, op.pkg, build_obs)
+                if pkg_ops is None:
                     out.error("fetching failed for %s" % (op.pkg.cpvstr,))
                     if not options.ignore_failures:
                         return 1
@@ -852,16 +1062,7 @@ def main(options, out, err):
             # mainly to protect against any code following triggering reloads
             # basically, be protective
 
-            if world_set is not None:
-                if op.desc == "remove":
-                    out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
-                    removal_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                    update_worldset(world_set, removal_pkg, remove=True)
-                elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
-                    if not options.upgrade:
-                        out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
-                        add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                        update_worldset(world_set, add_pkg)
+            update_world(op)
 
 
 #    again... left in place for ease of debugging.
@@ -870,7 +1071,8 @@ def main(options, out, err):
 #    else:
 #        import pdb;pdb.set_trace()
     finally:
-        pass
+        if prefetch is not None:
+            prefetch.shutdown()
 
     # the final run from the loop above doesn't invoke cleanups;
     # we could ignore it, but better to run it to ensure nothing is
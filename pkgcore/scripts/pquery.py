@@ -23,7 +23,7 @@ from snakeoil.cli import arghparse
 from snakeoil.demandload import demandload
 from snakeoil.formatters import decorate_forced_wrapping
 
-from pkgcore.ebuild import conditionals, atom
+from pkgcore.ebuild import conditionals, atom, restricts
 from pkgcore.restrictions import packages, values, boolean
 from pkgcore.util import (
     commandline, repo_utils, parserestrict, packages as pkgutils)
@@ -36,6 +36,7 @@ demandload(
     'snakeoil.sequences:iter_stable_unique',
     'pkgcore.fs:fs@fs_module,contents@contents_module',
     'pkgcore.repository:multiplex',
+    'pkgcore.util:thread_pool',
 )
 
 
@@ -485,6 +486,15 @@ repo_group.add_argument(
 
         By default, virtuals are included during matching.
     """)
+repo_group.add_argument(
+    '-j', '--jobs', type=int, metavar='NUM',
+    help='number of repos to query concurrently',
+    docs="""
+        Query up to NUM repos concurrently, defaulting to the domain's
+        repo_parallelism setting. Output is still ordered by repo, but each
+        repo's matches are collected in full before being printed, thus this
+        doesn't help with --early-out.
+    """)
 
 
 class RawAwareStoreRepoObject(commandline.StoreRepoObject):
@@ -672,9 +682,8 @@ def parse_revdep(value):
         targetatom = atom.atom(value)
     except atom.MalformedAtom as e:
         raise argparser.error(e)
-    val_restrict = values.FlatteningRestriction(
-        atom.atom,
-        values.AnyMatch(values.FunctionRestriction(targetatom.intersects)))
+    val_restrict = restricts.DependencyMatch(
+        [targetatom.key], values.FunctionRestriction(targetatom.intersects))
     return packages.OrRestriction(*list(
         packages.PackageRestriction(dep, val_restrict)
         for dep in ('depends', 'rdepends', 'post_rdepends')))
@@ -694,9 +703,9 @@ def revdep_pkgs_finalize(sequence, namespace):
         for repo in namespace.repos:
             l.extend(repo.itermatch(atom_inst))
     # have our pkgs; now build the restrict.
-    any_restrict = values.AnyMatch(
+    r = restricts.DependencyMatch(
+        set(pkg.key for pkg in l),
         values.FunctionRestriction(partial(_revdep_pkgs_match, tuple(l))))
-    r = values.FlatteningRestriction(atom.atom, any_restrict)
     return list(packages.PackageRestriction(dep, r)
                 for dep in ('depends', 'rdepends', 'post_rdepends'))
 
@@ -945,6 +954,9 @@ def _validate_args(parser, namespace):
     if namespace.one_attr and namespace.print_revdep:
         parser.error('--print-revdep with --force-one-attr or --one-attr does not make sense')
 
+    if namespace.jobs is not None and namespace.jobs < 1:
+        parser.error('--jobs must be a positive integer')
+
     def process_attrs(sequence):
         for attr in sequence:
             if attr == 'all':
@@ -978,9 +990,26 @@ def main(options, out, err):
 
     if options.query is None:
         return 0
-    for repo in options.repos:
+
+    # Note repo.metadata_columns() isn't used for bulk --attr output, even
+    # for --all: domain repos filter pkgs by visibility and render attrs
+    # against the pkg's USE configuration, while the columns hold every pkg's
+    # raw cache values, and stringify_attr() formats attrs from the parsed
+    # pkg objects rather than those strings.
+    jobs = options.jobs
+    if jobs is None:
+        jobs = getattr(options.domain, 'repo_parallelism', 1)
+    repos = options.repos
+    if jobs > 1 and len(repos) > 1:
+        matches = thread_pool.imap_ordered(
+            lambda repo: list(repo.itermatch(options.query, sorter=sorted)),
+            repos, threads=jobs)
+    else:
+        matches = (repo.itermatch(options.query, sorter=sorted) for repo in repos)
+
+    for repo in repos:
         try:
-            for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=sorted)):
+            for pkgs in pkgutils.groupby_pkg(next(matches)):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
@@ -129,6 +129,41 @@ class BaseTest(TestCase):
             sorted([('foon', (('mtime', 2L),)), ('spork', (('mtime', 1L),))]),
             sorted(self.cache['spork']['_eclasses_']))
 
+    def test_eclass_entry_sharing(self):
+        cache = self.get_db()
+        cache['spork'] = {'_eclasses_': {'eutils': _chf_obj, 'git-r3': _chf_obj}}
+        cache['foon'] = {'_eclasses_': {'eutils': _chf_obj}}
+        spork = dict((x[0], x) for x in cache['spork']['_eclasses_'])
+        foon = cache['foon']['_eclasses_']
+        self.assertIdentical(spork['eutils'], foon[0])
+        # the table is the cache's own, going away along with it
+        other = self.get_db()
+        other['foon'] = {'_eclasses_': {'eutils': _chf_obj}}
+        other_foon = other['foon']['_eclasses_']
+        self.assertEqual(foon, other_foon)
+        self.assertNotIdentical(foon[0], other_foon[0])
+
+    def test_eclass_index(self):
+        cache = self.get_db()
+        cache['spork'] = {'_eclasses_': {'eutils': _chf_obj, 'git-r3': _chf_obj}}
+        cache['foon'] = {'_eclasses_': {'eutils': _chf_obj}}
+        cache['dork'] = {'foo': 'bar'}
+        # built from the existing entries on first access
+        index = cache.eclass_index
+        self.assertEqual(sorted(index), ['dork', 'foon', 'spork'])
+        self.assertEqual(index.consumers('eutils'), frozenset(['foon', 'spork']))
+        self.assertEqual(index.consumers(['git-r3', 'nonexistent']),
+                         frozenset(['spork']))
+        self.assertEqual(index.get('dork'), ())
+
+        # and maintained from then on
+        cache['dork'] = {'_eclasses_': {'git-r3': _chf_obj}}
+        del cache['spork']
+        self.assertIs(cache.eclass_index, index)
+        self.assertEqual(index.consumers('git-r3'), frozenset(['dork']))
+        self.assertEqual(index.consumers('eutils'), frozenset(['foon']))
+        self.assertEqual(sorted(index.eclasses()), ['eutils', 'git-r3'])
+
     def test_readonly(self):
         self.cache = self.get_db()
         self.cache['spork'] = {'foo':'bar'}
@@ -0,0 +1,48 @@
+# License: GPL2/BSD
+
+from snakeoil.test import TestCase
+
+from pkgcore.cache.columns import MetadataColumns
+
+
+class TestMetadataColumns(TestCase):
+
+    def mk_store(self):
+        store = MetadataColumns(['EAPI', 'LICENSE', '_eclasses_'])
+        store.append('cat/foo-1', {'EAPI': '5', 'LICENSE': 'GPL-2',
+                                   '_eclasses_': {'b': None, 'a': None}})
+        store.append('cat/foo-2', {'EAPI': '6', 'LICENSE': 'GPL-2 BSD'})
+        store.append('cat/bar-1', {'EAPI': '5', 'LICENSE': 'GPL-2'})
+        return store
+
+    def test_it(self):
+        store = self.mk_store()
+        self.assertEqual(len(store), 3)
+        self.assertEqual(list(store), ['cat/foo-1', 'cat/foo-2', 'cat/bar-1'])
+        self.assertIn('cat/bar-1', store)
+        self.assertNotIn('cat/bar-2', store)
+        self.assertEqual(store.ordinal('cat/foo-2'), 1)
+        self.assertRaises(KeyError, store.ordinal, 'cat/bar-2')
+        self.assertEqual(store.column('EAPI'), ['5', '6', '5'])
+        self.assertEqual(store.get('cat/foo-1', '_eclasses_'), ('a', 'b'))
+        self.assertEqual(
+            store.row(1), {'EAPI': '6', 'LICENSE': 'GPL-2 BSD', '_eclasses_': ()})
+        # pkgs share equal values
+        licenses = store.column('LICENSE')
+        self.assertIs(licenses[0], licenses[2])
+
+    def test_queries(self):
+        store = self.mk_store()
+        self.assertEqual(dict(store.histogram('EAPI')), {'5': 2, '6': 1})
+        calls = []
+        def split(val):
+            calls.append(val)
+            return val.split()
+        self.assertEqual(
+            dict(store.histogram('LICENSE', split)), {'GPL-2': 3, 'BSD': 1})
+        self.assertEqual(sorted(calls), ['GPL-2', 'GPL-2 BSD'])
+        self.assertEqual(
+            dict(store.histogram('_eclasses_', tuple)), {'a': 1, 'b': 1})
+        del calls[:]
+        self.assertEqual(store.select('EAPI', lambda x: calls.append(x) or x == '5'), [0, 2])
+        self.assertEqual(calls, ['5', '6'])
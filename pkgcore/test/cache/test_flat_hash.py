@@ -1,6 +1,10 @@
 # Copyright: 2006 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
+import os
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
 from snakeoil.test.mixins import TempDirMixin
 
 from pkgcore.cache import flat_hash
@@ -24,3 +28,35 @@ class TestFlatHash(util.GenericCacheMixin, TempDirMixin):
     def get_db(self, readonly=False):
         return db(self.dir,
             auxdbkeys=self.cache_keys, readonly=readonly)
+
+
+class TestMd5Cache(TempDirMixin):
+
+    def get_db(self, readonly=False):
+        db = flat_hash.md5_cache(
+            pjoin(self.dir, 'repo'), auxdbkeys=('SLOT', '_eclasses_'),
+            readonly=readonly)
+        db.index_dir = pjoin(self.dir, 'indexes')
+        return db
+
+    def test_eclass_index(self):
+        db = self.get_db()
+        self.assertFalse(db.eclass_index_location.startswith(db.location))
+        self.assertFalse(db.load_eclass_index(rebuild=False))
+        db['dev-util/foo-1'] = {
+            'SLOT': '0',
+            '_chf_': LazilyHashedPath('/nonexistent/path', md5=0L),
+            '_eclasses_': {
+                'eutils': LazilyHashedPath('/nonexistent/eclass', md5=1L)},
+        }
+        self.assertEqual(
+            db.eclass_index.consumers(['eutils']), frozenset(['dev-util/foo-1']))
+        db.commit()
+
+        # the index is kept out of the repo, where syncing would clobber it
+        self.assertFalse(os.path.exists(pjoin(db.location, '.eclass-index')))
+        self.assertTrue(os.path.exists(db.eclass_index_location))
+        db = self.get_db(True)
+        self.assertTrue(db.load_eclass_index(rebuild=False))
+        self.assertEqual(
+            db.eclass_index.consumers(['eutils']), frozenset(['dev-util/foo-1']))
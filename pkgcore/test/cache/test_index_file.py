@@ -0,0 +1,43 @@
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, index_file
+from pkgcore.test import malleable_obj
+
+
+class TestIndexFile(TempDirMixin, TestCase):
+
+    def test_it(self):
+        path = pjoin(self.dir, 'index')
+        self.assertIdentical(None, index_file.read(path, 'magic 1', list))
+        index = malleable_obj(lines=['a\tb', 'c'], modified=True)
+        access = []
+        index_file.write(
+            path, 'magic 1', index, lambda x: x.lines, ('stamp',), access.append)
+        self.assertFalse(index.modified)
+        # ensure_access got the temp file, which is gone now
+        self.assertEqual(len(access), 1)
+        self.assertNotEqual(access[0], path)
+        self.assertEqual(os.listdir(self.dir), ['index'])
+
+        self.assertEqual(
+            index_file.read(path, 'magic 1', list, ('stamp',)), ['a\tb', 'c'])
+        self.assertIdentical(None, index_file.read(path, 'magic 2', list, ('stamp',)))
+        self.assertIdentical(None, index_file.read(path, 'magic 1', list, ('other',)))
+
+        def parse(lines):
+            raise ValueError('bad line')
+        self.assertRaises(
+            errors.CacheError, index_file.read, path, 'magic 1', parse, ('stamp',))
+
+    def test_failed_write(self):
+        path = pjoin(self.dir, 'missing', 'index')
+        index = malleable_obj(modified=True)
+        self.assertRaises(
+            errors.CacheError, index_file.write, path, 'magic', index, lambda x: ())
+        self.assertTrue(index.modified)
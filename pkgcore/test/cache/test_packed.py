@@ -0,0 +1,88 @@
+# License: GPL2/BSD
+
+import operator
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, packed
+from pkgcore.test.cache import util, test_base
+
+
+class db(packed.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return packed.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(packed.database.__getitem__(self, cpv).iteritems())
+        d.pop('_%s_' % self.chf_type, None)
+        return d
+
+
+class TestPacked(util.GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(pjoin(self.dir, 'cache'),
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_persistence(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0', 'EAPI': '5'}
+        cache['dev-util/bar-2'] = {'SLOT': '2'}
+        self.assertFalse(os.path.exists(cache.location))
+        cache.commit()
+        self.assertTrue(os.path.exists(cache.location))
+
+        cache = self.get_db(True)
+        self.assertEqual(sorted(cache), ['dev-util/bar-2', 'dev-util/foo-1'])
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '0', 'EAPI': '5'})
+        self.assertEqual(
+            sorted(cache.iteritems()),
+            [('dev-util/bar-2', {'SLOT': '2'}),
+             ('dev-util/foo-1', {'SLOT': '0', 'EAPI': '5'})])
+        self.assertRaises(KeyError, operator.getitem, cache, 'dev-util/foo-2')
+
+    def test_updates(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        cache['dev-util/bar-2'] = {'SLOT': '2'}
+        cache.commit()
+
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '1'}
+        cache['dev-util/foo-2'] = {'SLOT': '2'}
+        del cache['dev-util/bar-2']
+        # pending updates are visible before they're committed
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '1'})
+        cache.commit()
+        self.assertEqual(cache['dev-util/foo-2'], {'SLOT': '2'})
+
+        cache = self.get_db()
+        self.assertEqual(sorted(cache), ['dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '1'})
+        self.assertEqual(cache['dev-util/foo-2'], {'SLOT': '2'})
+
+    def test_eclasses(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'_eclasses_': {
+            'eutils': test_base._mk_chf_obj(mtime=1)}}
+        cache.commit()
+        cache = self.get_db()
+        self.assertEqual(
+            cache['dev-util/foo-1']['_eclasses_'],
+            [('eutils', (('eclassdir', '/nonexistent'), ('mtime', 1L)))])
+
+    def test_corruption(self):
+        with open(pjoin(self.dir, 'cache'), 'w') as f:
+            f.write('dev-util/foo-1 0 10\n')
+        cache = self.get_db()
+        self.assertRaises(
+            errors.GeneralCacheCorruption, operator.contains, cache, 'dev-util/foo-1')
+
+        cache = self.get_db()
+        cache._data = {'dev-util/foo-1': 'SLOT=0\n'}
+        self.assertRaises(
+            errors.CacheCorruption, operator.getitem, cache, 'dev-util/foo-1')
@@ -0,0 +1,46 @@
+# License: GPL2/BSD
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, revdep_index
+
+
+class TestRevdepIndex(TempDirMixin, TestCase):
+
+    def test_it(self):
+        index = revdep_index.RevdepIndex([
+            ('cat/foo-1', '1', ['dev-libs/a', 'dev-libs/b', 'dev-libs/a']),
+            ('cat/bar-1', None, ['dev-libs/b'])])
+        self.assertFalse(index.modified)
+        self.assertEqual(index.get('cat/foo-1'), ('1', ('dev-libs/a', 'dev-libs/b')))
+        self.assertEqual(index.revdeps('dev-libs/a'), frozenset(['cat/foo-1']))
+        self.assertEqual(
+            index.revdeps(['dev-libs/b', 'dev-libs/c']),
+            frozenset(['cat/foo-1', 'cat/bar-1']))
+
+        index.add('cat/foo-1', '2', ['dev-libs/c'])
+        self.assertTrue(index.modified)
+        self.assertEqual(index.revdeps('dev-libs/a'), frozenset())
+        index.discard('cat/bar-1')
+        self.assertEqual(index.revdeps('dev-libs/b'), frozenset())
+        self.assertEqual(list(index), ['cat/foo-1'])
+
+    def test_persistence(self):
+        path = pjoin(self.dir, 'index')
+        self.assertIdentical(None, revdep_index.read_index(path))
+        index = revdep_index.RevdepIndex([
+            ('cat/foo-1', '1 eutils:1', ['dev-libs/a']),
+            ('cat/bar-1', None, [])])
+        revdep_index.write_index(path, index)
+        self.assertEqual(
+            sorted(revdep_index.read_index(path).iteritems()),
+            [('cat/bar-1', (None, ())), ('cat/foo-1', ('1 eutils:1', ('dev-libs/a',)))])
+
+        with open(path, 'w') as f:
+            f.write('blah\n')
+        self.assertIdentical(None, revdep_index.read_index(path))
+        with open(path, 'w') as f:
+            f.write('%s\ncat/foo-1\n' % revdep_index._MAGIC)
+        self.assertRaises(errors.CacheError, revdep_index.read_index, path)
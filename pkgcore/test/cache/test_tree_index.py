@@ -0,0 +1,39 @@
+# License: GPL2/BSD
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, tree_index
+
+
+class TestTreeIndex(TempDirMixin, TestCase):
+
+    def test_it(self):
+        index = tree_index.TreeIndex([('cat', 1, ['foo', 'bar'])])
+        self.assertFalse(index.modified)
+        self.assertEqual(index.get('cat'), (1, ('foo', 'bar')))
+        index.add('cat/foo', None, ['1', '2'])
+        self.assertTrue(index.modified)
+        index.discard('cat')
+        self.assertEqual(list(index), ['cat/foo'])
+
+    def test_persistence(self):
+        path = pjoin(self.dir, 'index')
+        self.assertIdentical(None, tree_index.read_index(path, '/repo'))
+        index = tree_index.TreeIndex([
+            ('cat', 10L, ['foo']), ('cat/foo', None, ['1', '2-r1']), ('cat/bar', 5L, [])])
+        tree_index.write_index(path, index, '/repo')
+        self.assertEqual(
+            sorted(tree_index.read_index(path, '/repo').iteritems()),
+            [('cat', (10, ('foo',))), ('cat/bar', (5, ())),
+             ('cat/foo', (None, ('1', '2-r1')))])
+        # indexes of other repos are ignored
+        self.assertIdentical(None, tree_index.read_index(path, '/other'))
+
+        with open(path, 'w') as f:
+            f.write('blah\n')
+        self.assertIdentical(None, tree_index.read_index(path, '/repo'))
+        with open(path, 'w') as f:
+            f.write('%s\n/repo\ncat\tfoo\n' % tree_index._MAGIC)
+        self.assertRaises(errors.CacheError, tree_index.read_index, path, '/repo')
@@ -63,3 +63,29 @@ class GenericCacheMixin(TestCase):
             d = dict(raw_data)
             db[key] = d
 
+
+    def test_eclass_index(self):
+        db = self.get_db(False)
+        for key, raw_data in self.test_data:
+            db[key] = dict(raw_data)
+        db.commit()
+        index = db.eclass_index
+        self.assertEqual(
+            index.consumers('eutils'), frozenset(x[0] for x in self.test_data))
+        if db.eclass_index_location is None:
+            return
+        db.commit()
+
+        # a fresh instance loads the persisted index rather than rebuilding it
+        db = self.get_db(True)
+        self.assertTrue(db.load_eclass_index(rebuild=False))
+        self.assertEqual(sorted(db.eclass_index), sorted(index))
+
+        # modifications made without the index loaded invalidate it
+        db = self.get_db(False)
+        db['dev-util/foo-1'] = {'SLOT': '0', '_eclasses_': {}}
+        db.commit()
+        db = self.get_db(False)
+        self.assertFalse(db.load_eclass_index(rebuild=False))
+        self.assertIn('dev-util/foo-1', db.eclass_index)
+        self.assertNotIn('.eclass-index', list(db))
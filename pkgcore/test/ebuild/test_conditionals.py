@@ -200,6 +200,19 @@ class native_DepSetParsingTest(base):
     def test_atom_interaction(self):
         self.gen_depset("a/b[x(+)]", element_func=atom)
 
+    def test_sharing(self):
+        d = self.gen_depset("a/b x? ( c/d )", element_kls=atom)
+        self.assertIs(d, self.gen_depset("a/b x? ( c/d )", element_kls=atom))
+        # parse args are part of the identity
+        self.assertIsNot(d, self.gen_depset("a/b x? ( c/d )", element_kls=atom,
+                                            transitive_use_atoms=True))
+        self.assertIsNot(d, self.gen_depset(
+            "a/b x? ( c/d )", element_kls=atom, operators={"": boolean.AndRestriction}))
+        self.assertIsNot(d, self.gen_depset("a/b x? ( c/d )", element_kls=atom, shared=False))
+        # unhashable args aren't shared
+        self.assertEqual(
+            self.gen_depset("a", operators={"": []}).restrictions, ("a",))
+
 
 class cpy_DepSetParsingTest(native_DepSetParsingTest):
 
@@ -199,6 +199,10 @@ class native_CpvTest(TestCase):
         # swap the ordering, so that it's no longer obj1.__cmp__, but obj2s
         self.assertTrue(obj2 < obj1, '%r must be < %r' % (obj2, obj1))
 
+        if obj1.fullver and obj2.fullver:
+            self.assertTrue(obj1.version_key > obj2.version_key,
+                'version_key, %r > %r' % (obj1, obj2))
+
         if self.run_cpy_ver_cmp and obj1.fullver and obj2.fullver:
             self.assertTrue(cpv.cpy_ver_cmp(obj1.version, obj1.revision,
                 obj2.version, obj2.revision) > 0,
@@ -291,6 +295,34 @@ class native_CpvTest(TestCase):
         self.assertEqual(DummySubclass("da/ba-6.0", versioned=True),
             DummySubclass("da/ba-6.0-r0", versioned=True))
 
+    def test_version_key(self):
+        vkls = self.vkls
+        self.assertEqual(self.ukls("da/ba").version_key, None)
+        for v1, v2 in (("6.0_alpha", "6.0_alpha0"), ("6.01.0", "6.010.0"),
+                       ("1.0", "1.0-r0"), ("1.0", "1.00")):
+            self.assertEqual(vkls("da/ba-%s" % v1).version_key,
+                             vkls("da/ba-%s" % v2).version_key)
+        self.assertEqual(cpv.fullver_key("6.0b-r2"),
+                         vkls("da/ba-6.0b-r2").version_key)
+        self.assertRaises(cpv.InvalidCPV, cpv.fullver_key, "6.0-bad")
+
+        # keys of versions differing only in revision share a prefix
+        prefix = cpv.ver_key("1.0", False)
+        for ver in ("1.0", "1.0-r1", "1.0-r100"):
+            key = vkls("da/ba-%s" % ver).version_key
+            self.assertTrue(prefix <= key < prefix + '\x02', ver)
+        for ver in ("1.0a", "1.0_p1", "1.0.1", "1.01"):
+            key = vkls("da/ba-%s" % ver).version_key
+            self.assertFalse(prefix <= key < prefix + '\x02', ver)
+
+        vers = ["1.0", "1.0-r1", "1_alpha", "1_alpha2", "1.0b", "1.0.0",
+                "1.02", "1.1", "10", "2_p1", "2_pre", "2.0_beta_p3",
+                "01.0", "1.0010"]
+        pkgs = [vkls("da/ba-%s" % x) for x in vers]
+        self.assertEqual(
+            [x.fullver for x in sorted(pkgs, key=lambda x: x.version_key)],
+            [x.fullver for x in sorted(pkgs)])
+
     def test_no_init(self):
         """Test if the cpv is in a somewhat sane state if __init__ fails.
 
@@ -0,0 +1,143 @@
+# License: GPL2/BSD
+
+import os
+import pickle
+import socket
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild import ebd_pool, const as e_const
+
+
+class FakeProcessor(object):
+
+    def __init__(self):
+        cread, self.cwrite = os.pipe()
+        self.dread, dwrite = os.pipe()
+        self.ebd_read = os.fdopen(cread, 'r')
+        self.ebd_write = os.fdopen(dwrite, 'w')
+        self._preloaded_eclasses = {}
+        self._metadata_paths = None
+        self.shutdown = False
+
+    def _export_state(self):
+        return {
+            'ebd': e_const.EBUILD_DAEMON_PATH, 'pid': None,
+            'userpriv': False, 'sandbox': False, 'sandbox_log': None,
+            'dont_export_vars': ['foo'],
+            'preloaded_eclasses': self._preloaded_eclasses,
+            'metadata_paths': self._metadata_paths,
+        }
+
+    def clear_preloaded_eclasses(self):
+        self._preloaded_eclasses.clear()
+        return True
+
+    def shutdown_processor(self, ignore_keyboard_interrupt=False):
+        self.shutdown = True
+
+
+class TestPool(TempDirMixin, TestCase):
+
+    def test_messages(self):
+        left, right = socket.socketpair()
+        ebd_pool._send_msg(left, {'foo': ['bar']})
+        ebd_pool._send_msg(left, None)
+        self.assertEqual(ebd_pool._recv_msg(right), {'foo': ['bar']})
+        self.assertEqual(ebd_pool._recv_msg(right), None)
+        # only plain data is accepted, pickles can run arbitrary code
+        data = pickle.dumps(['foo'])
+        left.sendall(ebd_pool._header.pack(len(data)) + data)
+        self.assertRaises(ValueError, ebd_pool._recv_msg, right)
+        left.close()
+        self.assertRaises(EOFError, ebd_pool._recv_msg, right)
+
+    def test_peer_uid(self):
+        left, right = socket.socketpair()
+        self.assertEqual(ebd_pool._peer_uid(left), os.getuid())
+
+    def test_untrusted_pool(self):
+        path = pjoin(self.dir, 'sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        with mock.patch.object(ebd_pool, '_peer_uid', return_value=os.getuid() + 1), \
+                mock.patch.object(ebd_pool, '_send_msg') as send_msg:
+            self.assertIdentical(None, ebd_pool.lease_processor(path, False, False))
+            # nothing was sent to, or read from, another user's pool
+            self.assertFalse(send_msg.called)
+        listener.close()
+
+    def test_missing_pool(self):
+        self.assertIdentical(
+            None, ebd_pool.lease_processor(pjoin(self.dir, 'sock'), False, False))
+
+    def test_lease(self):
+        ebp = FakeProcessor()
+        server = ebd_pool.PoolServer(pjoin(self.dir, 'sock'))
+        client, server_sock = socket.socketpair()
+        ebd_pool._send_msg(client, (False, False))
+        with mock.patch('pkgcore.ebuild.processor.request_ebuild_processor',
+                        return_value=ebp), \
+                mock.patch('pkgcore.ebuild.processor.release_ebuild_processor') as release:
+            server._lease(server_sock)
+            self.assertEqual(list(server._leases.values()), [ebp])
+
+            state = ebd_pool._recv_msg(client)
+            self.assertEqual(state['dont_export_vars'], ['foo'])
+            read_fd = ebd_pool.recv_handle(client)
+            write_fd = ebd_pool.recv_handle(client)
+            # the passed fds are the processor's pipes
+            os.write(ebp.cwrite, b'dude!\n')
+            self.assertEqual(os.read(read_fd, 6), b'dude!\n')
+            os.write(write_fd, b'alive\n')
+            self.assertEqual(os.read(ebp.dread, 6), b'alive\n')
+
+            # returned with state, it's kept around for reuse
+            ebd_pool._send_msg(client, {
+                'preloaded_eclasses': {'eutils': '/eutils.eclass'},
+                'metadata_paths': ('/bin',)})
+            server._return(server_sock)
+            release.assert_called_once_with(ebp)
+            self.assertFalse(ebp.shutdown)
+            self.assertEqual(ebp._preloaded_eclasses, {'eutils': '/eutils.eclass'})
+            self.assertEqual(ebp._metadata_paths, ('/bin',))
+            self.assertEqual(server._leases, {})
+
+            # clients disconnecting without returning state discard it
+            release.reset_mock()
+            client, server_sock = socket.socketpair()
+            ebd_pool._send_msg(client, (False, False))
+            server._lease(server_sock)
+            # the preloaded eclass vanished since, thus the preloads were dropped
+            self.assertEqual(ebp._preloaded_eclasses, {})
+            client.close()
+            server._return(server_sock)
+            release.assert_called_once_with(ebp)
+            self.assertTrue(ebp.shutdown)
+
+    def test_metadata_only(self):
+        # build phases need the client's stdio and env, thus never lease
+        from pkgcore.ebuild import processor
+        ebp = FakeProcessor()
+        with mock.patch.dict(os.environ, {ebd_pool.POOL_ENV_VAR: 'sock'}), \
+                mock.patch.object(ebd_pool, 'lease_processor',
+                                  return_value=ebp) as lease, \
+                mock.patch.object(processor, 'EbuildProcessor') as spawned, \
+                mock.patch.object(processor, 'inactive_ebp_list', []), \
+                mock.patch.object(processor, 'active_ebp_list', []):
+            self.assertIdentical(
+                spawned.return_value,
+                processor.request_ebuild_processor(sandbox=False))
+            self.assertFalse(lease.called)
+            self.assertIdentical(
+                ebp, processor.request_ebuild_processor(
+                    sandbox=False, metadata=True))
+            lease.assert_called_once_with('sock', False, False)
@@ -40,6 +40,17 @@ class TestBase(TestCase):
         assertRebuildResults(True, 'eclass1', 100)
         assertRebuildResults(False, 'eclass1', 200)
 
+    def test_get_valid_entries(self):
+        valid = self.ec.get_valid_entries(['mtime'])
+        self.assertEqual(
+            valid, frozenset((x, (('mtime', self.ec.eclasses[x].mtime),))
+                             for x in ("eclass1", "eclass2")))
+        self.assertIdentical(valid, self.ec.get_valid_entries(('mtime',)))
+        # validated entries share the eclass data instances
+        got = self.ec.rebuild_cache_entry([('eclass1', (('mtime', 100),))])
+        self.assertIdentical(got, self.ec.get_eclass_data(['eclass1']))
+        self.assertEqual(self.ec.rebuild_cache_entry([]), {})
+
     def test_get_eclass_data(self):
         keys = self.ec.eclasses.keys()
         data = self.ec.get_eclass_data([])
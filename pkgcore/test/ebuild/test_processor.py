@@ -0,0 +1,166 @@
+# License: GPL2/BSD
+
+import os
+from StringIO import StringIO
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test import SkipTest, TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild import processor
+
+
+class TestEclassFunctionCache(TempDirMixin, TestCase):
+
+    def setUp(self):
+        if os.getuid() != 0:
+            raise SkipTest("requires root privs to store entries")
+        TempDirMixin.setUp(self)
+        self.cache = processor.EclassFunctionCache(pjoin(self.dir, 'cache'))
+
+    def mk_eclass(self, name, data, eclassdir='eclass'):
+        path = pjoin(self.dir, eclassdir, '%s.eclass' % name)
+        ensure_dirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+        return LazilyHashedPath(path)
+
+    def store(self, eclass, data, body):
+        tmp, path = self.cache.get_store_paths(eclass, data)
+        self.assertEqual(os.path.dirname(tmp), self.cache.location)
+        with open(path, 'w') as f:
+            f.write(body)
+        return path
+
+    def test_it(self):
+        foo = self.mk_eclass('foo', 'foo() { :; }\n')
+        self.assertIdentical(None, self.cache.get('foo', foo))
+        path = self.store('foo', foo, 'body')
+        self.assertEqual(os.stat(self.cache.location).st_mode & 07777, 0755)
+        self.assertEqual(self.cache.get('foo', foo), 'body')
+        # nothing to do for already stored entries
+        self.assertIdentical(None, self.cache.get_store_paths('foo', foo))
+
+        # storing a newer version drops the old one, leaving other eclasses
+        git = self.mk_eclass('foo-git', 'foo_git() { :; }\n')
+        self.store('foo-git', git, 'git')
+        foo = self.mk_eclass('foo', 'foo() { true; }\n')
+        self.assertIdentical(None, self.cache.get('foo', foo))
+        tmp, new_path = self.cache.get_store_paths('foo', foo)
+        self.assertNotEqual(path, new_path)
+        self.assertEqual(os.listdir(self.cache.location),
+                         [os.path.basename(self.cache._path('foo-git', git))])
+
+    def test_eclassdirs(self):
+        # differing versions from separate repos don't evict each other
+        foo1 = self.mk_eclass('foo', 'foo() { :; }\n', 'repo1')
+        foo2 = self.mk_eclass('foo', 'foo() { true; }\n', 'repo2')
+        self.store('foo', foo1, 'repo1')
+        self.store('foo', foo2, 'repo2')
+        self.assertEqual(self.cache.get('foo', foo1), 'repo1')
+        self.assertEqual(self.cache.get('foo', foo2), 'repo2')
+
+    def test_untrusted(self):
+        foo = self.mk_eclass('foo', 'foo() { :; }\n')
+        path = self.store('foo', foo, 'body')
+        os.chmod(path, 0664)
+        self.assertIdentical(None, self.cache.get('foo', foo))
+        os.chmod(path, 0644)
+        os.chown(path, 12345, -1)
+        self.assertIdentical(None, self.cache.get('foo', foo))
+        os.chown(path, 0, -1)
+        self.assertEqual(self.cache.get('foo', foo), 'body')
+        # a writable cache dir allows entries to be swapped out
+        os.chmod(self.cache.location, 0775)
+        self.assertIdentical(None, self.cache.get('foo', foo))
+        # storing restores the dir's perms
+        self.store('foo-git', self.mk_eclass('foo-git', ''), 'git')
+        self.assertEqual(self.cache.get('foo', foo), 'body')
+
+
+class FakeEclass(object):
+
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeEclassCache(object):
+
+    def __init__(self, **eclasses):
+        self.eclasses = {k: FakeEclass(v) for k, v in eclasses.iteritems()}
+
+
+class TestIterKeys(TestCase):
+
+    def mk_processor(self, replies):
+        ebp = processor.EbuildProcessor.__new__(processor.EbuildProcessor)
+        ebp.pid = None
+        ebp.processing_lock = False
+        ebp.dont_export_vars = []
+        ebp._outstanding_expects = []
+        ebp._preloaded_eclasses = {}
+        ebp._eclass_caching = False
+        ebp._metadata_paths = None
+        ebp.ebd_read = StringIO(''.join(replies))
+        ebp.ebd_write = StringIO()
+        return ebp
+
+    @staticmethod
+    def metadata_reply(**keys):
+        data = ''.join('%s=%s\n' % x for x in sorted(keys.iteritems()))
+        return 'metadata %i\n%sphases succeeded\n' % (len(data), data)
+
+    def iter_keys(self, ebp, pkgs, ecache, depth):
+        with mock.patch.object(processor, 'expected_ebuild_env',
+                               lambda pkg, depends: {'PF': pkg}):
+            for x in ebp.iter_keys(pkgs, ecache, depth=depth):
+                yield x
+
+    def test_pipelined(self):
+        ebp = self.mk_processor([
+            'eclass_paths_received\n', 'metadata_path_received\n',
+            self.metadata_reply(SLOT='0'),
+            'phases failed\n',
+            self.metadata_reply(SLOT='1', EAPI='5'),
+            'eclass_paths_received\n'])
+        ecache = FakeEclassCache(foo='/eclass/foo.eclass')
+        results = self.iter_keys(ebp, ['a', 'b', 'c'], ecache, 2)
+        self.assertEqual(next(results), ('a', {'SLOT': '0'}))
+        written = ebp.ebd_write.getvalue()
+        self.assertIn('set_eclass_paths 23\nfoo /eclass/foo.eclass\n', written)
+        # requests for all three were sent prior to handing back the first
+        self.assertEqual(written.count('gen_metadata '), 3)
+        self.assertEqual(list(results), [
+            ('b', None), ('c', {'SLOT': '1', 'EAPI': '5'})])
+        self.assertTrue(ebp.ebd_write.getvalue().endswith('set_eclass_paths 0\n'))
+        self.assertFalse(ebp.locked)
+
+    def test_early_close(self):
+        ebp = self.mk_processor([
+            'eclass_paths_received\n', 'metadata_path_received\n',
+            self.metadata_reply(SLOT='0'),
+            self.metadata_reply(SLOT='1'),
+            'eclass_paths_received\n'])
+        results = self.iter_keys(ebp, ['a', 'b'], FakeEclassCache(), 2)
+        self.assertEqual(next(results), ('a', {'SLOT': '0'}))
+        results.close()
+        # the outstanding request was collected, leaving the daemon usable
+        self.assertEqual(ebp.ebd_read.read(), '')
+        self.assertFalse(ebp.locked)
+
+    def test_unpipelined_fallback(self):
+        # eclasses not available as files require inherit requests
+        ebp = self.mk_processor([])
+        ecache = FakeEclassCache(foo=None)
+        with mock.patch.object(processor.EbuildProcessor, 'get_keys',
+                               lambda self, pkg, ecache: {'PF': pkg}):
+            self.assertEqual(
+                list(ebp.iter_keys(['a', 'b'], ecache)),
+                [('a', {'PF': 'a'}), ('b', {'PF': 'b'})])
+        self.assertEqual(ebp.ebd_write.getvalue(), '')
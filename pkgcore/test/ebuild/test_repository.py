@@ -10,14 +10,18 @@ try:
 except ImportError:
     import mock
 
+from snakeoil.chksum import LazilyHashedPath
 from snakeoil.fileutils import touch
 from snakeoil.osutils import ensure_dirs, pjoin
 from snakeoil.test.mixins import TempDirMixin
 
+from pkgcore.cache import flat_hash
 from pkgcore.ebuild import errors as ebuild_errors
 from pkgcore.ebuild import repository, restricts, eclass_cache
 from pkgcore.ebuild.atom import atom
 from pkgcore.repository import errors
+from pkgcore.restrictions import packages, values
+from pkgcore.test.cache import test_base
 
 
 class UnconfiguredTreeTest(TempDirMixin):
@@ -189,6 +193,167 @@ class UnconfiguredTreeTest(TempDirMixin):
                     repo.itermatch(atom('cat/pkg'))), ['cat/pkg-3'])
                 os.unlink(fp)
 
+    def test_regen_targets(self):
+        for pkg in ('foo', 'bar', 'baz'):
+            ensure_dirs(pjoin(self.dir, 'cat', pkg))
+            touch(pjoin(self.dir, 'cat', pkg, '%s-1.ebuild' % pkg))
+        touch(pjoin(self.dir, 'cat', 'foo', 'foo-2.ebuild'))
+        cache = test_base.DictCache(auxdbkeys=('_eclasses_',))
+        cache['cat/foo-1'] = {}
+        cache['cat/bar-1'] = {'_eclasses_': {'eutils': test_base._chf_obj}}
+        cache['cat/gone-1'] = {'_eclasses_': {'eutils': test_base._chf_obj}}
+        repo = self.mk_tree(self.dir, cache=cache)
+        get_targets = repo.operations._get_regen_targets
+
+        pkgs, removed = get_targets(['cat/foo/Manifest', 'profiles/use.desc', ''])
+        self.assertEqual((pkgs, removed), ([], set()))
+
+        pkgs, removed = get_targets([
+            'cat/foo/foo-2.ebuild', pjoin(self.dir, 'cat/baz/baz-1.ebuild'),
+            'cat/foo/foo-3.ebuild'])
+        self.assertEqual(
+            sorted(x.cpvstr for x in pkgs), ['cat/baz-1', 'cat/foo-2'])
+        self.assertEqual(removed, set(['cat/foo-3']))
+
+        pkgs, removed = get_targets(['eclass/eutils.eclass'])
+        self.assertEqual([x.cpvstr for x in pkgs], ['cat/bar-1'])
+        self.assertEqual(removed, set(['cat/gone-1']))
+
+    def test_revdep_index(self):
+        epath = pjoin(self.dir, 'eclass')
+        ensure_dirs(epath)
+        with open(pjoin(epath, 'e.eclass'), 'w') as f:
+            f.write('\n')
+        os.utime(pjoin(epath, 'e.eclass'), (0, 100))
+        cache = flat_hash.database(pjoin(self.dir, 'cache'), readonly=False)
+        eclasses = eclass_cache.cache(epath)
+        deps = {
+            'foo': ('x? ( >=dev-libs/a-1 ) !dev-libs/b', 'e'),
+            'bar': ('dev-libs/b', ''),
+            'baz': ('', ''),
+        }
+        for pkg, (depend, inherit) in deps.iteritems():
+            path = pjoin(self.dir, 'cat', pkg, '%s-1.ebuild' % pkg)
+            ensure_dirs(os.path.dirname(path))
+            touch(path)
+            os.utime(path, (0, 100))
+            cache['cat/%s-1' % pkg] = {
+                'EAPI': '5', 'SLOT': '0', 'RDEPEND': depend,
+                '_eclasses_': eclasses.get_eclass_data(inherit.split()),
+                '_chf_': LazilyHashedPath(path)}
+        cache.commit()
+
+        def revdeps(repo, *atoms):
+            r = packages.OrRestriction(*[
+                packages.PackageRestriction('rdepends', restricts.DependencyMatch(
+                    [a.key], values.FunctionRestriction(a.intersects)))
+                for a in atoms])
+            return sorted(x.cpvstr for x in repo.itermatch(r))
+
+        repo = self.mk_tree(self.dir, cache=(cache,), eclass_cache=eclasses)
+        self.assertEqual(revdeps(repo, atom('dev-libs/b')), ['cat/bar-1', 'cat/foo-1'])
+        self.assertEqual(revdeps(repo, atom('=dev-libs/a-0')), [])
+        self.assertEqual(revdeps(repo, atom('dev-libs/a'), atom('dev-libs/c')), ['cat/foo-1'])
+        self.assertTrue(os.path.exists(cache.revdep_index_location))
+
+        # the persisted index is reused...
+        repo = self.mk_tree(
+            self.dir, cache=(cache,), eclass_cache=eclass_cache.cache(epath))
+        with mock.patch.object(repo, '_index_revdeps') as index_revdeps:
+            self.assertEqual(revdeps(repo, atom('dev-libs/b')), ['cat/bar-1', 'cat/foo-1'])
+            self.assertFalse(index_revdeps.called)
+        # ...while pkgs whose inherited eclasses changed are reindexed
+        os.utime(pjoin(epath, 'e.eclass'), (0, 200))
+        repo = self.mk_tree(
+            self.dir, cache=(cache,), eclass_cache=eclass_cache.cache(epath))
+        with mock.patch.object(repo, '_index_revdeps') as index_revdeps:
+            repo.revdep_index
+            self.assertEqual(
+                [x[0][1] for x in index_revdeps.call_args_list], [('cat', 'foo', '1')])
+
+    def test_md5_cache_revdep_index(self):
+        path = pjoin(self.dir, 'cat', 'foo', 'foo-1.ebuild')
+        ensure_dirs(os.path.dirname(path))
+        touch(path)
+        os.utime(path, (0, 100))
+        cache = flat_hash.md5_cache(self.dir, readonly=False)
+        cache.index_dir = pjoin(self.dir, 'indexes')
+        cache['cat/foo-1'] = {
+            'EAPI': '5', 'SLOT': '0', 'RDEPEND': 'dev-libs/b',
+            '_eclasses_': {}, '_chf_': LazilyHashedPath(path)}
+        cache.commit()
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        self.assertEqual(sorted(repo.revdep_index.revdeps('dev-libs/b')), ['cat/foo-1'])
+        # persisted outside the repo, where syncing won't clobber it
+        self.assertTrue(cache.revdep_index_location.startswith(cache.index_dir))
+        self.assertTrue(os.path.exists(cache.revdep_index_location))
+
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        with mock.patch.object(repo, '_index_revdeps') as index_revdeps:
+            self.assertEqual(sorted(repo.revdep_index.revdeps('dev-libs/b')), ['cat/foo-1'])
+            self.assertFalse(index_revdeps.called)
+
+    def test_metadata_columns(self):
+        cache = flat_hash.database(pjoin(self.dir, 'cache'), readonly=False)
+        for pkg, license in (('foo', 'GPL-2'), ('bar', 'BSD'), ('baz', '')):
+            path = pjoin(self.dir, 'cat', pkg, '%s-1.ebuild' % pkg)
+            ensure_dirs(os.path.dirname(path))
+            touch(path)
+            cache['cat/%s-1' % pkg] = {
+                'EAPI': '5', 'SLOT': '0', 'LICENSE': license,
+                '_chf_': LazilyHashedPath(path)}
+        cache.commit()
+        # invalidate the baz cache entry
+        os.utime(pjoin(self.dir, 'cat', 'baz', 'baz-1.ebuild'), (0, 100))
+
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        with mock.patch.object(repo.package_class, '_update_metadata') as update:
+            update.side_effect = lambda pkg, ebp=None: {'EAPI': '6', 'LICENSE': 'MIT'}
+            store = repo.metadata_columns(['EAPI', 'LICENSE'])
+            self.assertEqual([x[0][0].cpvstr for x in update.call_args_list], ['cat/baz-1'])
+        self.assertEqual(sorted(store), ['cat/bar-1', 'cat/baz-1', 'cat/foo-1'])
+        self.assertEqual(store.get('cat/foo-1', 'LICENSE'), 'GPL-2')
+        self.assertEqual(store.get('cat/baz-1', 'EAPI'), '6')
+        self.assertEqual(dict(store.histogram('EAPI')), {'5': 2, '6': 1})
+        self.assertEqual(store.failures, {})
+
+    def test_tree_index(self):
+        cache = flat_hash.database(pjoin(self.dir, 'cache'), readonly=False)
+        ensure_dirs(cache.location)
+        for cpv in ('cat/foo-1', 'cat/foo-2', 'cat/bar-1'):
+            cat, pkg = cpv.split('/')
+            path = pjoin(self.dir, cat, pkg.rsplit('-', 1)[0], '%s.ebuild' % pkg)
+            ensure_dirs(os.path.dirname(path))
+            touch(path)
+        # tree creation may add dirs to the repo; backdate after it
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        for path in ('', 'cat', 'cat/foo', 'cat/bar'):
+            os.utime(pjoin(self.dir, path), (0, 100))
+
+        self.assertEqual(
+            sorted(x.cpvstr for x in repo), ['cat/bar-1', 'cat/foo-1', 'cat/foo-2'])
+        repo.flush_tree_index()
+        self.assertTrue(os.path.exists(cache.tree_index_location))
+
+        # listings are served from the persisted index...
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        with mock.patch.object(repository, 'listdir_dirs') as listdir_dirs, \
+                mock.patch.object(repository, 'listdir_files') as listdir_files:
+            self.assertEqual(sorted(repo.packages['cat']), ['bar', 'foo'])
+            self.assertEqual(repo.versions[('cat', 'bar')], ('1',))
+            self.assertFalse(listdir_dirs.called)
+            self.assertFalse(listdir_files.called)
+        self.assertFalse(repo.tree_index.modified)
+
+        # ...while changed directories are rescanned
+        touch(pjoin(self.dir, 'cat', 'bar', 'bar-2.ebuild'))
+        os.utime(pjoin(self.dir, 'cat', 'bar'), (0, 200))
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        self.assertEqual(sorted(repo.versions[('cat', 'bar')]), ['1', '2'])
+        self.assertEqual(sorted(repo.versions[('cat', 'foo')]), ['1', '2'])
+        self.assertEqual(
+            repo.tree_index.get('cat/bar'), (200, ('1', '2')))
+
     def test_package_mask(self):
         with open(pjoin(self.pdir, 'package.mask'), 'w') as f:
             f.write(textwrap.dedent('''\
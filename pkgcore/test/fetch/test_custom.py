@@ -0,0 +1,71 @@
+# License: GPL2/BSD
+
+from StringIO import StringIO
+import os
+import threading
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fetch import custom, fetchable
+
+# marks itself as started, then waits for the other fetch to start
+overlapping_command = """
+touch "${DISTDIR}/${FILE}.started"
+echo "fetching ${FILE}"
+for x in $(seq 100); do
+    [ $(ls "${DISTDIR}" | grep -c started$) -ge 2 ] && break
+    sleep 0.05
+done
+echo "fetched ${FILE}"
+ls "${DISTDIR}" | grep -c started$ > "${DISTDIR}/${FILE}"
+"""
+
+
+class TestFetcher(TempDirMixin, TestCase):
+
+    def test_concurrent_fetches(self):
+        fetcher = custom.fetcher(self.dir, overlapping_command, userpriv=False)
+        targets = [fetchable(x, uri=['http://example.com/' + x])
+                   for x in ('a', 'b')]
+        results = {}
+
+        def fetch(target):
+            results[target.filename] = fetcher.fetch(target)
+
+        stdout = StringIO()
+        threads = [threading.Thread(target=fetch, args=(x,)) for x in targets]
+        # with the terminal busy, both fetches capture their output
+        with mock.patch('sys.stdout', stdout):
+            with fetcher._terminal_lock:
+                for t in threads:
+                    t.start()
+                for x in targets:
+                    path = pjoin(self.dir, x.filename)
+                    for i in xrange(100):
+                        if os.path.exists(path):
+                            break
+                        time.sleep(0.05)
+                # nothing is shown while the terminal is in use
+                self.assertEqual(stdout.getvalue(), '')
+            for t in threads:
+                t.join(10)
+
+        self.assertEqual(
+            results, dict((x, pjoin(self.dir, x)) for x in ('a', 'b')))
+        for x in ('a', 'b'):
+            # both fetch commands were running at the same time
+            with open(pjoin(self.dir, x)) as f:
+                self.assertEqual(f.read().strip(), '2')
+        # each command's output is replayed in one piece
+        output = stdout.getvalue().splitlines()
+        self.assertEqual(sorted(output[::2]), ['fetching a', 'fetching b'])
+        self.assertEqual(
+            [x.replace('fetching', 'fetched') for x in output[::2]], output[1::2])
@@ -0,0 +1,97 @@
+# License: GPL2/BSD
+
+import threading
+import time
+
+from snakeoil.test import TestCase
+
+from pkgcore.fetch import fetchable
+from pkgcore.fetch.prefetch import prefetcher
+from pkgcore.test import malleable_obj
+
+
+def mk_pkg(name, *files):
+    return malleable_obj(name=name, fetchables=tuple(fetchable(x) for x in files))
+
+
+class TestPrefetcher(TestCase):
+
+    def setUp(self):
+        self.started = {}
+        self.release = {}
+
+    def mk_pkgs(self, *files):
+        pkgs = []
+        for idx, l in enumerate(files):
+            pkg = mk_pkg(str(idx), *l)
+            self.started[pkg.name] = threading.Event()
+            self.release[pkg.name] = threading.Event()
+            pkgs.append(pkg)
+        return pkgs
+
+    def fetch(self, pkg):
+        self.started[pkg.name].set()
+        self.release[pkg.name].wait(5)
+        if pkg.name == 'fail':
+            raise ValueError(pkg.name)
+        return pkg.name
+
+    def test_lookahead(self):
+        pkgs = self.mk_pkgs(['a'], ['b'], ['c'], ['d'])
+        p = prefetcher(pkgs, self.fetch, jobs=3, lookahead=1)
+        p.start()
+        try:
+            self.assertTrue(self.started['0'].wait(5))
+            self.assertTrue(self.started['1'].wait(5))
+            time.sleep(0.05)
+            self.assertFalse(self.started['2'].is_set())
+            self.release['0'].set()
+            self.assertEqual(p.wait(pkgs[0]), '0')
+            self.assertFalse(self.started['2'].is_set())
+            for x in self.release.itervalues():
+                x.set()
+            self.assertEqual([p.wait(x) for x in pkgs[1:]], ['1', '2', '3'])
+        finally:
+            p.shutdown()
+
+    def test_shared_files(self):
+        pkgs = self.mk_pkgs(['a', 'shared'], ['shared'], ['b'])
+        p = prefetcher(pkgs, self.fetch, jobs=3)
+        p.start()
+        try:
+            self.assertTrue(self.started['0'].wait(5))
+            self.assertTrue(self.started['2'].wait(5))
+            time.sleep(0.05)
+            self.assertFalse(self.started['1'].is_set())
+            self.release['0'].set()
+            self.assertTrue(self.started['1'].wait(5))
+            for x in self.release.itervalues():
+                x.set()
+            self.assertEqual([p.wait(x) for x in reversed(pkgs)], ['2', '1', '0'])
+        finally:
+            p.shutdown()
+
+    def test_failure(self):
+        pkgs = [mk_pkg('fail', 'a'), mk_pkg('ok', 'b')]
+        for pkg in pkgs:
+            self.started[pkg.name] = threading.Event()
+            self.release[pkg.name] = threading.Event()
+            self.release[pkg.name].set()
+        p = prefetcher(pkgs, self.fetch, jobs=2)
+        p.start()
+        try:
+            self.assertRaises(ValueError, p.wait, pkgs[0])
+            self.assertEqual(p.wait(pkgs[1]), 'ok')
+        finally:
+            p.shutdown()
+
+    def test_inline(self):
+        # pkgs the workers didn't get to are fetched by the caller
+        pkgs = self.mk_pkgs(['a'], ['b'])
+        for x in self.release.itervalues():
+            x.set()
+        p = prefetcher(pkgs, self.fetch, jobs=1, lookahead=0)
+        self.assertEqual(p.wait(pkgs[1]), '1')
+        p.start()
+        p.shutdown()
+        self.assertEqual(p.wait(pkgs[0]), '0')
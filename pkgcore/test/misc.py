@@ -67,6 +67,8 @@ class FakeProfile(object):
 
 class FakeRepo(object):
 
+    livefs = False
+
     def __init__(self, pkgs=(), repo_id='', location='', masks=(), **kwds):
         self.pkgs = pkgs
         self.repo_id = repo_id or location
@@ -0,0 +1,52 @@
+# License: GPL2/BSD
+
+from snakeoil.test import TestCase
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository.misc import caching_repo
+from pkgcore.repository.util import SimpleTree
+
+
+class TestCachingRepo(TestCase):
+
+    def setUp(self):
+        self.repo = SimpleTree({
+            "dev-util": {"foo": ["1", "2"], "bar": ["1"]},
+            "dev-lib": {"baz": ["1", "2", "3"]}})
+
+    def test_caching(self):
+        repo = caching_repo(self.repo, sorted)
+        l = repo.match(atom("dev-util/foo"))
+        self.assertEqual([x.cpvstr for x in l], ["dev-util/foo-1", "dev-util/foo-2"])
+        self.assertIs(repo.match(atom("dev-util/foo")), l)
+        self.assertEqual(
+            repo.cache_stats(),
+            {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1, 'pkgs': 2})
+        repo.clear()
+        self.assertIsNot(repo.match(atom("dev-util/foo")), l)
+
+    def test_max_entries(self):
+        repo = caching_repo(self.repo, sorted, max_entries=2)
+        foo = repo.match(atom("dev-util/foo"))
+        repo.match(atom("dev-util/bar"))
+        # refresh foo, leaving bar the least recently used
+        self.assertIs(repo.match(atom("dev-util/foo")), foo)
+        repo.match(atom("dev-lib/baz"))
+        self.assertEqual(repo.cache_stats()['evictions'], 1)
+        self.assertIs(repo.match(atom("dev-util/foo")), foo)
+        self.assertEqual(repo.cache_stats()['misses'], 3)
+        repo.match(atom("dev-util/bar"))
+        self.assertEqual(repo.cache_stats()['misses'], 4)
+
+    def test_max_pkgs(self):
+        repo = caching_repo(self.repo, sorted, max_pkgs=3)
+        list(repo.match(atom("dev-util/foo")))
+        list(repo.match(atom("dev-util/bar")))
+        self.assertEqual(repo.cache_stats()['evictions'], 0)
+        list(repo.match(atom("dev-lib/baz")))
+        # the budget is enforced once the loaded pkgs are accounted for
+        repo.match(atom("dev-util/bar"))
+        stats = repo.cache_stats()
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['pkgs'], 1)
@@ -64,7 +64,29 @@ class TestMultiplex(TestCase):
             list(x.cpvstr for x in self.ctree.itermatch(packages.AlwaysTrue, sorter=rev_sorted)),
             rev_sorted(self.tree1_list + self.tree2_list))
 
+    def test_ordering(self):
+        # matches are returned in tree order
+        self.assertEqual(
+            [x.cpvstr for x in self.ctree.itermatch(packages.AlwaysTrue)],
+            [x.cpvstr for x in self.tree1.itermatch(packages.AlwaysTrue)] +
+            [x.cpvstr for x in self.tree2.itermatch(packages.AlwaysTrue)])
+
     def test_install(self):
         raise Exception()
     test_install.todo = "need to implement tests for multiplexing down repo_ops"
     test_replace = test_uninstall = test_install
+
+
+class TestParallelMultiplex(TestMultiplex):
+
+    kls = staticmethod(partial(tree, parallelism=2))
+
+    def test_errors(self):
+        class Broken(SimpleTree):
+            def itermatch(self, *args, **kwds):
+                raise ValueError("broken")
+
+        ctree = self.kls(self.tree1, Broken({}))
+        i = ctree.itermatch(packages.AlwaysTrue)
+        self.assertRaises(ValueError, list, i)
+        self.assertRaises(TypeError, tree, self.tree1, threads=2)
@@ -161,6 +161,30 @@ class TestPrototype(TestCase):
             sorted(versioned_CPV(x) for x in (
                 "dev-lib/fake-1.0", "dev-lib/fake-1.0-r1")))
 
+    def test_version_ranges(self):
+        vers = ["1.0", "0.9", "1.0-r1", "1.1_rc1", "1.1", "2", "1.00", "1.0.1"]
+        repo = SimpleTree({"dev-util": {"foo": vers}})
+        cp = ("dev-util", "foo")
+        self.assertEqual(
+            repo.versions[cp],
+            ("0.9", "1.0", "1.00", "1.0-r1", "1.0.1", "1.1_rc1", "1.1", "2"))
+        pkgs = [versioned_CPV("dev-util/foo-%s" % x) for x in vers]
+        for a, count in (("=dev-util/foo-1.0", 2), ("~dev-util/foo-1.0", 3),
+                         ("<dev-util/foo-1.1", 6), ("<=dev-util/foo-1.0-r1", 4),
+                         (">dev-util/foo-1.0", 5), (">=dev-util/foo-1.1_rc1", 3),
+                         (">=dev-util/foo-3", 0), ("=dev-util/foo-1*", 8),
+                         ("dev-util/foo", 8)):
+            a = atom(a)
+            self.assertEqual(len(repo.versions.select(cp, a)), count, a)
+            self.assertEqual(
+                sorted(repo.itermatch(a)), sorted(x for x in pkgs if a.match(x)))
+
+        # invalid versions are never skipped
+        repo.versions.force_regen(cp, ("1.0", "bad-ver", "2"))
+        self.assertEqual(repo.versions[cp], ("bad-ver", "1.0", "2"))
+        self.assertEqual(
+            repo.versions.select(cp, atom(">dev-util/foo-1.0")), ("bad-ver", "2"))
+
     def test_iter(self):
         self.assertEqual(
             sorted(self.repo),
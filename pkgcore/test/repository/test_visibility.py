@@ -1,10 +1,16 @@
 # Copyright: 2006 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 from pkgcore.ebuild.atom import atom
 from pkgcore.ebuild.cpv import versioned_CPV
 from pkgcore.repository.visibility import filterTree
 from pkgcore.restrictions import packages, values
+from pkgcore.restrictions.delegated import delegate
 from pkgcore.test.repository.test_prototype import SimpleTree
 from snakeoil.test import TestCase
 
@@ -52,3 +58,35 @@ class TestVisibility(TestCase):
                 *[values.StrExactMatch(x) for x in ("diffball", "fake")])))
         self.assertEqual(
             sorted(vrepo), sorted(repo.itermatch(atom("dev-util/bsdiff"))))
+
+    def test_prefiltering(self):
+        repo, _ = self.setup_repos()
+        vrepo = filterTree(repo, packages.AndRestriction(
+            delegate(lambda pkg, mode: True),
+            atom("=dev-util/diffball-1.0", negate_vers=True)), True)
+        self.assertIdentical(vrepo._prefilter, vrepo.restriction[1])
+        l = []
+        def f(pkg, mode):
+            l.append(pkg.cpvstr)
+            return True
+        # the query's metadata check isn't run for pkgs the filter rejects
+        # without needing metadata
+        self.assertEqual(
+            [x.cpvstr for x in vrepo.itermatch(delegate(f))],
+            ['dev-util/diffball-0.7'])
+        self.assertEqual(l, ['dev-util/diffball-0.7'])
+
+    def test_query_atom(self):
+        repo, _ = self.setup_repos()
+        vrepo = filterTree(repo, packages.AndRestriction(
+            delegate(lambda pkg, mode: True),
+            packages.PackageRestriction(
+                "category", values.StrExactMatch("dev-util"))), True)
+        a = atom(">=dev-util/diffball-1.0")
+        # the query's package and versions still narrow down the candidates
+        # when combined with the filter
+        with mock.patch.object(
+                repo.versions, 'select', wraps=repo.versions.select) as select:
+            self.assertEqual(
+                [x.cpvstr for x in vrepo.itermatch(a)], ['dev-util/diffball-1.0'])
+        select.assert_called_once_with(('dev-util', 'diffball'), a)
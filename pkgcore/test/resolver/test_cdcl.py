@@ -0,0 +1,106 @@
+# License: GPL2/BSD
+
+import itertools
+
+from snakeoil.test import TestCase
+
+from pkgcore.resolver.cdcl import solver, at_most_one
+
+
+class TestSolver(TestCase):
+
+    def mk_solver(self, nvars, *clauses):
+        s = solver()
+        for x in xrange(nvars):
+            s.new_var()
+        for clause in clauses:
+            s.add_clause(clause)
+        return s
+
+    def brute_force(self, nvars, clauses):
+        for values in itertools.product((False, True), repeat=nvars):
+            if all(any(values[abs(x) - 1] == (x > 0) for x in c) for c in clauses):
+                return True
+        return False
+
+    def assertModel(self, s, clauses):
+        for clause in clauses:
+            self.assertTrue(any(s.value(x) for x in clause), clause)
+
+    def test_sat(self):
+        clauses = [(1, 2), (-1, 3), (-2, -3), (-3, 4)]
+        s = self.mk_solver(4, *clauses)
+        self.assertTrue(s.solve())
+        self.assertModel(s, clauses)
+
+    def test_unsat(self):
+        s = self.mk_solver(2, (1, 2), (1, -2), (-1, 2), (-1, -2))
+        self.assertFalse(s.solve())
+        self.assertFalse(s.ok)
+        s = self.mk_solver(1, (1,))
+        self.assertFalse(s.add_clause((-1,)))
+        self.assertFalse(s.solve())
+
+    def test_phase(self):
+        s = solver()
+        a, b = s.new_var(), s.new_var(True)
+        self.assertTrue(s.solve())
+        self.assertEqual((s.value(a), s.value(b)), (False, True))
+        # a is decided first, forcing b off
+        s.add_clause((-b, a))
+        self.assertTrue(s.solve())
+        self.assertEqual((s.value(a), s.value(b)), (False, False))
+
+    def test_assumptions(self):
+        s = self.mk_solver(3, (-1, 2), (-2, 3))
+        self.assertTrue(s.solve((1,)))
+        self.assertTrue(s.value(3))
+        self.assertFalse(s.solve((1, -3)))
+        # assumptions don't stick
+        self.assertTrue(s.ok)
+        self.assertTrue(s.solve((-3,)))
+        self.assertFalse(s.value(1))
+        self.assertEqual(s.fixed(1), None)
+        s.add_clause((1,))
+        self.assertEqual((s.fixed(1), s.fixed(-3)), (True, False))
+
+    def test_random(self):
+        import random
+        rand = random.Random(1)
+        for x in xrange(300):
+            nvars = rand.randint(1, 8)
+            clauses = [
+                tuple(rand.choice((1, -1)) * rand.randint(1, nvars)
+                      for y in xrange(rand.randint(1, 3)))
+                for z in xrange(rand.randint(1, 4 * nvars))]
+            assumptions = [rand.choice((1, -1)) * rand.randint(1, nvars)
+                           for y in xrange(rand.randint(0, 2))]
+            s = self.mk_solver(nvars, *clauses)
+            expected = self.brute_force(
+                nvars, clauses + [(y,) for y in assumptions])
+            self.assertEqual(s.solve(assumptions), expected, (clauses, assumptions))
+            if expected:
+                self.assertModel(s, clauses)
+
+    def test_budget(self):
+        # pigeonhole; 7 pigeons, 6 holes
+        s = solver()
+        holes = [[s.new_var(True) for hole in xrange(6)] for pigeon in xrange(7)]
+        for pigeon in holes:
+            s.add_clause(pigeon)
+        for hole in zip(*holes):
+            at_most_one(s, hole)
+        self.assertEqual(s.solve(max_conflicts=10), None)
+        self.assertEqual(s.conflicts, 10)
+        self.assertTrue(s.ok)
+
+    def test_at_most_one(self):
+        for count in (3, 8):
+            s = solver()
+            lits = [s.new_var(True) for x in xrange(count)]
+            at_most_one(s, lits)
+            self.assertTrue(s.solve())
+            self.assertEqual(sum(s.value(x) for x in lits), 1)
+            self.assertTrue(s.solve([-x for x in lits]))
+            self.assertFalse(s.solve((lits[0], lits[-1])))
+            self.assertFalse(s.solve((lits[1], lits[2])))
@@ -4,8 +4,9 @@
 from snakeoil.currying import post_curry
 from snakeoil.test import TestCase
 
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver import plan
-from pkgcore.test.misc import FakePkg
+from pkgcore.test.misc import FakePkg, FakeRepo
 
 
 class TestPkgSorting(TestCase):
@@ -30,3 +31,91 @@ class TestPkgSorting(TestCase):
 
     test_pkg_sort_lowest = post_curry(check_it, plan.pkg_sort_lowest,
         [11,9,1,6], [1,6,9,11])
+
+
+class TestNogoods(TestCase):
+
+    def mk_repo(self, *pkgs):
+        repo = FakeRepo([], repo_id='test')
+        repo.pkgs = [FakePkg(cpv, repo=repo, data={'RDEPEND': rdep})
+                     for cpv, rdep in pkgs]
+        return repo
+
+    def resolve(self, repo, target, learn_nogoods):
+        resolver = plan.merge_plan(
+            [repo], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy,
+            learn_nogoods=learn_nogoods)
+        calls = []
+        resolve_atom = resolver._resolve_atom
+        def counter(*args):
+            calls.append(str(args[0]))
+            return resolve_atom(*args)
+        resolver._resolve_atom = counter
+        ret = resolver.add_atoms([atom(target)])
+        ops = [str(x) for x in resolver.state.iter_ops()]
+        return resolver, bool(ret), ops, calls
+
+    def test_reuse(self):
+        # every alternative of the || pulls in app/bad via another pkg, which
+        # can't be satisfied alongside lib/z-1; it's only resolved once
+        repo = self.mk_repo(
+            ('app/top-1', '=lib/z-1 || ( app/p1 app/p2 app/p3 )'),
+            ('app/p1-1', 'app/q1'), ('app/p2-1', 'app/q2'),
+            ('app/p3-1', 'app/q3'), ('app/q1-1', 'app/bad'),
+            ('app/q2-1', 'app/bad'), ('app/q3-1', 'app/bad'),
+            ('app/bad-2', 'lib/x =lib/z-2'), ('app/bad-1', 'lib/x =lib/z-2'),
+            ('lib/x-1', 'lib/y'), ('lib/y-1', ''),
+            ('lib/z-1', ''), ('lib/z-2', ''))
+        r1, failed1, ops1, calls1 = self.resolve(repo, 'app/top', False)
+        r2, failed2, ops2, calls2 = self.resolve(repo, 'app/top', True)
+        self.assertTrue(failed1)
+        self.assertEqual((failed1, ops1), (failed2, ops2))
+        self.assertEqual(r1.nogood_hits, 0)
+        self.assertTrue(r2.nogood_hits)
+        self.assertTrue(len(calls2) < len(calls1))
+
+    def test_backjumping(self):
+        # the conflict is between top's lib/z-1 and what app/bad wants, the
+        # app/m1 vs app/m2 choice is irrelevant to it; as m2 requires app/bad
+        # too, it's skipped rather than tried once m1 fails
+        for learn in (False, True):
+            for conflict in ('=lib/z-2', '!<lib/z-2'):
+                pkgs = [
+                    ('app/m1-1', '=lib/x-1 app/bad'),
+                    ('app/m2-1', '=lib/x-2 app/bad'), ('app/m3-1', ''),
+                    ('app/bad-1', 'lib/x %s' % conflict),
+                    ('lib/x-1', ''), ('lib/x-2', ''), ('lib/z-1', ''),
+                    ('lib/z-2', '')]
+                repo = self.mk_repo(
+                    ('app/top-1', '=lib/z-1 || ( app/m1 app/m2 )'), *pkgs)
+                r, failed, ops, calls = self.resolve(repo, 'app/top', learn)
+                self.assertTrue(failed)
+                self.assertNotIn('app/m2', calls)
+                self.assertEqual(calls.count('app/bad'), 1)
+                self.assertEqual(calls.count('lib/x'), 1)
+
+                # alternatives not requiring app/bad are still tried
+                repo = self.mk_repo(
+                    ('app/top-1', '=lib/z-1 || ( app/m1 app/m2 app/m3 )'), *pkgs)
+                r, failed, ops, calls = self.resolve(repo, 'app/top', learn)
+                self.assertFalse(failed)
+                self.assertNotIn('app/m2', calls)
+                self.assertIn('add: ebuild src: app/m3-1', ops)
+                self.assertNotIn('add: ebuild src: lib/x-1', ops)
+
+    def test_invalidation(self):
+        # app/bad fails under app/p1 due to the lib/z-1 it adds; that
+        # nogood mustn't apply once p1 is backed out
+        repo = self.mk_repo(
+            ('app/top-1', '|| ( app/p1 app/p2 )'),
+            ('app/p1-1', '=lib/z-1 app/bad'), ('app/p2-1', 'app/bad'),
+            ('app/bad-1', 'lib/x =lib/z-2'),
+            ('lib/x-1', ''), ('lib/z-1', ''), ('lib/z-2', ''))
+        for learn in (False, True):
+            r, failed, ops, calls = self.resolve(repo, 'app/top', learn)
+            self.assertFalse(failed)
+            self.assertIn('add: ebuild src: app/p2-1', ops)
+            self.assertIn('add: ebuild src: lib/z-2', ops)
+            self.assertNotIn('add: ebuild src: lib/z-1', ops)
+            self.assertEqual(r.nogood_hits, 0)
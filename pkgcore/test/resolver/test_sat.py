@@ -0,0 +1,139 @@
+# License: GPL2/BSD
+
+from snakeoil.test import TestCase
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import plan, sat
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+def mk_repo(pkgs, livefs=False):
+    repo = FakeRepo([], repo_id=('vdb' if livefs else 'test'), livefs=livefs)
+    l = []
+    for x in pkgs:
+        cpv, rdep, dep, slot = tuple(x) + ('', '', '0')[len(x) - 1:]
+        l.append(FakePkg(cpv, slot=slot, repo=repo,
+                         data={'RDEPEND': rdep, 'DEPEND': dep}))
+    repo.pkgs = l
+    return repo
+
+
+class TestSatPlan(TestCase):
+
+    def resolve(self, src, vdb, targets, resolver_cls=sat.sat_plan,
+                upgrade=True, **kwds):
+        if upgrade:
+            func = resolver.upgrade_resolver
+        else:
+            func = resolver.min_install_resolver
+        r = func([vdb], [src], resolver_cls=resolver_cls, **kwds)
+        ret = r.add_atoms([atom(x) for x in targets])
+        return r, ret, [str(x) for x in r.state.iter_ops()]
+
+    def assertSamePlan(self, src, vdb, targets):
+        for upgrade in (False, True):
+            r1, ret1, ops1 = self.resolve(
+                src, vdb, targets, plan.merge_plan, upgrade)
+            r2, ret2, ops2 = self.resolve(
+                src, vdb, targets, sat.sat_plan, upgrade)
+            self.assertEqual((bool(ret1), ops1), (bool(ret2), ops2))
+        return ops2
+
+    def test_or_groups(self):
+        # app/p1 drags in lib/z-1, conflicting with app/bad's needs
+        src = mk_repo([
+            ('app/top-1', '|| ( app/p1 app/p2 )'),
+            ('app/p1-1', '=lib/z-1 app/bad'), ('app/p2-1', 'app/bad'),
+            ('app/bad-1', 'lib/x =lib/z-2'),
+            ('lib/x-1',), ('lib/z-1',), ('lib/z-2',)])
+        ops = self.assertSamePlan(src, mk_repo([], True), ['app/top'])
+        self.assertEqual(ops, [
+            'add: ebuild src: lib/x-1', 'add: ebuild src: lib/z-2',
+            'add: ebuild src: app/bad-1', 'add: ebuild src: app/p2-1',
+            'add: ebuild src: app/top-1'])
+
+    def test_installed(self):
+        src = mk_repo([
+            ('app/a-2', 'lib/b !lib/c', 'dev/tool'), ('app/a-1', 'lib/b'),
+            ('lib/b-1',), ('lib/b-2',), ('lib/c-1',),
+            ('lib/c-2', '', '', '1'), ('dev/tool-1',)])
+        vdb = mk_repo([('lib/b-1',), ('lib/c-1',), ('app/a-1', 'lib/b')], True)
+        self.assertSamePlan(src, vdb, ['app/a'])
+        ops = self.assertSamePlan(src, vdb, ['app/a', 'lib/c'])
+        self.assertEqual(ops, [
+            'replace: ebuild src: lib/b-1 with ebuild src: lib/b-2',
+            'add: ebuild src: lib/c-2'])
+
+    def test_blocker_replacement(self):
+        # lib/c-1 is blocked, thus upgraded prior to app/a going in
+        src = mk_repo([
+            ('app/a-2', '!<lib/c-2'), ('app/a-1',), ('lib/c-1',),
+            ('lib/c-2',), ('lib/d-1', 'lib/c')])
+        vdb = mk_repo([('lib/c-1',), ('lib/d-1', 'lib/c')], True)
+        ops = self.assertSamePlan(src, vdb, ['=app/a-2'])
+        self.assertEqual(ops, [
+            'replace: ebuild src: lib/c-1 with ebuild src: lib/c-2',
+            'add: ebuild src: app/a-2'])
+
+    def test_failure(self):
+        # merge_plan leaves partial state behind; sat_plan adds nothing
+        src = mk_repo([
+            ('app/a-2', '!<lib/c-2'), ('lib/c-1',), ('lib/c-2',)])
+        vdb = mk_repo([('lib/c-1',)], True)
+        r, ret, ops = self.resolve(src, vdb, ['=app/a-2', '=lib/c-1'])
+        self.assertTrue(ret)
+        self.assertEqual(ret[0], [atom('=lib/c-1')])
+        self.assertEqual(ops, [])
+        self.assertEqual(r.targets, [])
+        # the failed targets aren't kept around
+        ret = r.add_atoms([atom('=app/a-2')])
+        self.assertFalse(ret)
+        self.assertEqual([str(x) for x in r.state.iter_ops()], [
+            'replace: ebuild src: lib/c-1 with ebuild src: lib/c-2',
+            'add: ebuild src: app/a-2'])
+
+    def test_unsolvable_dep(self):
+        src = mk_repo([('app/a-1', 'lib/missing'), ('app/b-1',)])
+        r, ret, ops = self.resolve(src, mk_repo([], True), ['app/b', 'app/a'])
+        self.assertEqual(ret[0], [atom('app/a')])
+        self.assertEqual(ops, [])
+
+    def test_incremental(self):
+        src = mk_repo([('app/a-1', 'lib/b'), ('lib/b-1',), ('app/c-1', 'lib/b')])
+        r, ret, ops = self.resolve(src, mk_repo([], True), ['app/a'])
+        self.assertFalse(ret)
+        self.assertFalse(r.add_atoms([atom('app/c')]))
+        self.assertEqual(r.targets, [atom('app/a'), atom('app/c')])
+        self.assertEqual([str(x) for x in r.state.iter_ops()], [
+            'add: ebuild src: lib/b-1', 'add: ebuild src: app/a-1',
+            'add: ebuild src: app/c-1'])
+        self.assertRaises(ValueError, r.reset, 1)
+        r.reset()
+        self.assertEqual(list(r.state.iter_ops()), [])
+
+    def test_load_vdb_state(self):
+        src = mk_repo([('lib/b-1',), ('lib/b-2',), ('app/a-1', 'lib/b')])
+        vdb = mk_repo([('lib/b-1',), ('app/a-1', 'lib/b')], True)
+        r = resolver.upgrade_resolver([vdb], [src], resolver_cls=sat.sat_plan)
+        r.load_vdb_state()
+        self.assertEqual(list(r.state.iter_ops()), [])
+        self.assertFalse(r.add_atoms([atom('lib/b')]))
+        self.assertEqual([str(x) for x in r.state.iter_ops()], [
+            'replace: ebuild src: lib/b-1 with ebuild src: lib/b-2'])
+
+    def test_max_conflicts(self):
+        # trying app/p1 first hits a conflict between its lib/z deps
+        src = mk_repo([
+            ('app/top-1', '|| ( app/p1 app/p2 )'),
+            ('app/p1-1', '=lib/z-1 =lib/z-2'), ('app/p2-1',),
+            ('lib/z-1',), ('lib/z-2',)])
+        r, ret, ops = self.resolve(src, mk_repo([], True), ['app/top'])
+        self.assertFalse(ret)
+        self.assertEqual(ops, [
+            'add: ebuild src: app/p2-1', 'add: ebuild src: app/top-1'])
+        r, ret, ops = self.resolve(
+            src, mk_repo([], True), ['app/top'], max_conflicts=1)
+        self.assertTrue(ret)
+        self.assertEqual(ret[0], [atom('app/top')])
+        self.assertEqual(ops, [])
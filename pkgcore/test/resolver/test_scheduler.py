@@ -0,0 +1,113 @@
+# License: GPL2/BSD
+
+import threading
+
+from snakeoil.test import TestCase
+
+from pkgcore.resolver import scheduler
+from pkgcore.test import malleable_obj
+from pkgcore.test.misc import FakePkg
+
+
+def mk_op(cpv, depend='', rdepend='', desc='add', old=None):
+    op = malleable_obj(desc=desc, pkg=FakePkg(
+        cpv, data={'DEPEND': depend, 'RDEPEND': rdepend}))
+    if old is not None:
+        op.desc, op.old_pkg = 'replace', FakePkg(old)
+    return op
+
+
+class TestScheduler(TestCase):
+
+    def test_build_graph(self):
+        ops = [
+            mk_op('dev-libs/a-1'),
+            mk_op('dev-libs/b-1', rdepend='dev-libs/a'),
+            mk_op('dev-util/c-1', depend='>=dev-libs/b-1 !dev-libs/x'),
+            mk_op('dev-util/d-1', depend='dev-util/e', rdepend='<dev-libs/b-1'),
+            mk_op('dev-util/e-1', depend='dev-util/d'),
+            mk_op('dev-libs/old-1', desc='remove'),
+            mk_op('dev-util/f-1'),
+        ]
+        build, merge = scheduler.build_graph(ops)
+        self.assertEqual(build, [set(), set(), {1}, set(), {3}, {0, 1, 2, 3, 4}, {5}])
+        self.assertEqual(merge, [set(), {0}, set(), set(), set(), set(), set()])
+
+    def test_blockers(self):
+        ops = [
+            mk_op('dev-libs/a-2', old='dev-libs/a-1'),
+            mk_op('dev-libs/b-2', old='dev-libs/b-1'),
+            mk_op('dev-util/c-1', depend='!<dev-libs/a-2', rdepend='!<dev-libs/b-2'),
+            # blockers not matching the replaced pkgs add no edges
+            mk_op('dev-util/d-1', rdepend='!<dev-libs/a-1 !dev-libs/x'),
+            # pkgs replaced later on are waited for...
+            mk_op('dev-util/e-1', rdepend='!<dev-libs/f-2'),
+            mk_op('dev-libs/f-2', old='dev-libs/f-1'),
+            # ...unless they require the blocking op, keeping the plan's order
+            mk_op('dev-util/g-1', rdepend='!<dev-libs/h-2'),
+            mk_op('dev-libs/h-2', old='dev-libs/h-1', depend='dev-util/g'),
+        ]
+        build, merge = scheduler.build_graph(ops)
+        self.assertEqual(
+            build, [set(), set(), {0}, set(), set(), set(), set(), {6}])
+        self.assertEqual(
+            merge, [set(), set(), {1}, set(), {5}, set(), set(), set()])
+
+    def test_run(self):
+        ops = [
+            mk_op('dev-libs/a-1'),
+            mk_op('dev-libs/b-1', depend='dev-libs/a'),
+            mk_op('dev-util/c-1', rdepend='dev-libs/b'),
+            mk_op('dev-util/d-1'),
+        ]
+        merged, built = [], []
+        # hold a's build until d's is done, proving they run concurrently
+        d_built = threading.Event()
+
+        def build(op):
+            if op.pkg.package == 'a':
+                d_built.wait(5)
+            elif op.pkg.package == 'b':
+                self.assertIn('a', merged)
+            built.append(op.pkg.package)
+            if op.pkg.package == 'd':
+                d_built.set()
+            return op.pkg.package
+
+        def merge(op, result):
+            self.assertEqual(result, op.pkg.package)
+            merged.append(result)
+
+        jobs = scheduler.scheduler(ops, build, merge, 2)
+        self.assertTrue(jobs.run(), msg=jobs.failed)
+        self.assertLess(built.index('d'), built.index('a'))
+        # c's merge waits on b's
+        self.assertLess(merged.index('b'), merged.index('c'))
+        self.assertEqual(sorted(merged), ['a', 'b', 'c', 'd'])
+        self.assertEqual(jobs.failed, [])
+
+    def test_failures(self):
+        ops = [
+            mk_op('dev-libs/a-1'),
+            mk_op('dev-libs/b-1', depend='dev-libs/a'),
+            mk_op('dev-libs/c-1'),
+        ]
+
+        def build(op):
+            if op.pkg.package == 'a':
+                raise ValueError('a')
+            return op.pkg.package
+
+        merged = []
+        jobs = scheduler.scheduler(ops, build, lambda op, r: merged.append(r), 1)
+        self.assertFalse(jobs.run())
+        self.assertEqual([(op.pkg.package, str(e)) for op, e in jobs.failed], [('a', 'a')])
+        self.assertEqual(merged, [])
+
+        merged = []
+        jobs = scheduler.scheduler(
+            ops, lambda op: op.pkg.package != 'c' and op.pkg.package,
+            lambda op, r: merged.append(r), 2, keep_going=True)
+        self.assertFalse(jobs.run())
+        self.assertEqual([(op.pkg.package, e) for op, e in jobs.failed], [('c', None)])
+        self.assertEqual(merged, ['a', 'b'])
@@ -0,0 +1,139 @@
+# License: GPL2/BSD
+
+from snakeoil.test import TestCase
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import versioned_CPV
+from pkgcore.restrictions import compiler, packages, values
+from pkgcore.test import malleable_obj
+
+
+class CountingPkg(object):
+
+    def __init__(self, cpvstr, **kwds):
+        self._pkg = versioned_CPV(cpvstr)
+        self._vals = kwds
+        self.pulls = []
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        self.pulls.append(attr)
+        if attr in self._vals:
+            return self._vals[attr]
+        return getattr(self._pkg, attr)
+
+
+class TestCompiler(TestCase):
+
+    pkgs = [
+        ("dev-util/foo-1", {"slot": "0"}),
+        ("dev-util/foo-2", {"slot": "2"}),
+        ("dev-util/bar-1", {"slot": "0"}),
+        ("dev-lib/foo-1", {}),
+        ("dev-lib/BAR-1.0-r1", {"slot": "1"}),
+    ]
+
+    def cat(self, val, **kwds):
+        return packages.PackageRestriction("category", values.StrExactMatch(val), **kwds)
+
+    def pkg(self, val, **kwds):
+        return packages.PackageRestriction("package", values.StrExactMatch(val), **kwds)
+
+    def slot(self, val, **kwds):
+        return packages.PackageRestriction("slot", values.StrExactMatch(val), **kwds)
+
+    @property
+    def restrictions(self):
+        yield self.cat("dev-util")
+        yield self.slot("0", negate=True)
+        yield packages.PackageRestriction(
+            "package", values.StrExactMatch("bar", case_sensitive=False))
+        yield packages.PackageRestriction(
+            "package", values.StrRegex("^f"))
+        yield packages.AlwaysTrue
+        yield packages.AndRestriction()
+        yield packages.OrRestriction()
+        yield atom("=dev-util/foo-2")
+        yield atom("dev-util/foo:0")
+        yield packages.AndRestriction(self.cat("dev-util"), self.slot("0"))
+        yield packages.AndRestriction(self.cat("dev-util"), self.slot("0"), negate=True)
+        yield packages.OrRestriction(atom("dev-util/bar"), atom(">=dev-util/foo-2"))
+        yield packages.OrRestriction(
+            atom("dev-util/bar"), self.slot("1"), negate=True)
+        yield packages.AndRestriction(
+            self.cat("dev-util"),
+            packages.OrRestriction(self.pkg("bar"), self.slot("2")),
+            packages.OrRestriction(
+                packages.AndRestriction(self.cat("dev-util"), self.pkg("foo")),
+                self.slot("0", negate=True)))
+        yield packages.AndRestriction(
+            self.cat("dev-lib"),
+            packages.AndRestriction(self.pkg("foo"), self.slot("0"), negate=True))
+        yield packages.OrRestriction(
+            packages.AndRestriction(self.cat("dev-lib"), self.slot("1")),
+            packages.AndRestriction(self.cat("dev-util"), self.slot("2")))
+
+    def test_compile_restriction(self):
+        for r in self.restrictions:
+            f = compiler.compile_restriction(r)
+            for cpv, vals in self.pkgs:
+                pkg = malleable_obj(**vals)
+                pkg.__dict__.update(
+                    (x, getattr(versioned_CPV(cpv), x))
+                    for x in ("category", "package", "key", "fullver",
+                              "version", "revision"))
+                self.assertEqual(
+                    f(pkg), r.match(pkg), msg="%s against %s" % (r, cpv))
+
+    def test_non_str_attrs(self):
+        # StrExactMatch stringifies values, thus matches ints and the like
+        pkg = versioned_CPV("dev-util/foo-1.0-r2")
+        for r in (
+                packages.PackageRestriction("revision", values.StrExactMatch("2")),
+                packages.PackageRestriction("revision", values.StrExactMatch("3")),
+                packages.PackageRestriction(
+                    "revision", values.StrExactMatch("2", negate=True)),
+                packages.PackageRestriction(
+                    "revision", values.StrExactMatch("2", case_sensitive=False)),
+                packages.PackageRestriction(
+                    "revision", values.StrExactMatch("2"), negate=True),
+                packages.PackageRestriction("version", values.StrExactMatch("1.0")),
+                packages.PackageRestriction(
+                    "version", values.StrExactMatch("1.0", case_sensitive=False))):
+            self.assertEqual(
+                compiler.compile_restriction(r)(pkg), r.match(pkg), msg=str(r))
+
+    def test_pulls(self):
+        # attrs are pulled once, and only if needed
+        f = compiler.compile_restriction(packages.OrRestriction(
+            packages.AndRestriction(self.cat("dev-lib"), self.slot("1")),
+            packages.AndRestriction(self.cat("dev-util"), self.slot("2"))))
+        pkg = CountingPkg("dev-util/foo-2", slot="2")
+        self.assertTrue(f(pkg))
+        self.assertEqual(pkg.pulls, ["category", "slot"])
+        pkg = CountingPkg("dev-util/foo-2", slot="1")
+        self.assertFalse(f(pkg))
+        self.assertEqual(pkg.pulls, ["category", "slot"])
+        pkg = CountingPkg("dev-foo/foo-2")
+        self.assertFalse(f(pkg))
+        self.assertEqual(pkg.pulls, ["category"])
+
+    def test_unfinalized(self):
+        r = packages.AndRestriction(self.cat("dev-util"), finalize=False)
+        f = compiler.compile_restriction(r)
+        r.add_restriction(self.pkg("foo"))
+        self.assertFalse(f(versioned_CPV("dev-util/bar-1")))
+
+    def test_compile_selector(self):
+        f = compiler.compile_selector([
+            (atom("dev-util/foo"), 1),
+            (packages.AlwaysFalse, 2),
+            (atom("<dev-util/foo-2"), 3),
+            (self.cat("dev-util"), 4),
+        ])
+        pkg = CountingPkg("dev-util/foo-1")
+        self.assertEqual(f(pkg), [1, 3, 4])
+        self.assertEqual(pkg.pulls.count("category"), 1)
+        self.assertEqual(f(versioned_CPV("dev-util/foo-2")), [1, 4])
+        self.assertEqual(f(versioned_CPV("dev-lib/foo-2")), [])
@@ -1,7 +1,9 @@
 # Copyright: 2006 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
+from pkgcore.ebuild.atom import atom
 from pkgcore.restrictions import util, packages, values
+from pkgcore.restrictions.delegated import delegate
 from snakeoil.test import TestCase
 
 
@@ -32,3 +34,74 @@ class Test_collect_package_restrictions(TestCase):
             self.assertEqual(
                 list(util.collect_package_restrictions(r, attrs=[k])),
                 [v] * 2)
+
+
+class TestCost(TestCase):
+
+    cheap = packages.PackageRestriction("category", values.StrExactMatch("dev-util"))
+    metadata = packages.PackageRestriction("slot", values.StrExactMatch("0"))
+    costly = packages.PackageRestriction("contents", values.AlwaysTrue)
+
+    def test_restriction_cost(self):
+        self.assertEqual(util.restriction_cost(packages.AlwaysTrue), 0)
+        self.assertEqual(util.restriction_cost(self.cheap), util.CHEAP_COST)
+        self.assertEqual(
+            util.restriction_cost(packages.PackageRestriction(
+                "repo.repo_id", values.StrExactMatch("gentoo"))),
+            util.CHEAP_COST)
+        self.assertEqual(util.restriction_cost(self.metadata), util.METADATA_COST)
+        self.assertTrue(util.restriction_cost(self.costly) > util.METADATA_COST)
+        self.assertEqual(
+            util.restriction_cost(packages.OrRestriction(self.cheap, self.metadata)),
+            util.METADATA_COST)
+        self.assertEqual(
+            util.restriction_cost(delegate(lambda pkg, mode: True)),
+            util.METADATA_COST)
+        self.assertEqual(
+            util.restriction_cost(delegate(lambda pkg, mode: True, cost=util.CHEAP_COST)),
+            util.CHEAP_COST)
+        self.assertEqual(util.restriction_cost(atom("=dev-util/foo-1")), util.CHEAP_COST)
+        self.assertEqual(util.restriction_cost(atom("dev-util/foo:1")), util.METADATA_COST)
+
+    def test_order_by_cost(self):
+        r = packages.AndRestriction(self.cheap, self.metadata)
+        self.assertIdentical(util.order_by_cost(r), r)
+        r = packages.AndRestriction(
+            self.costly, packages.OrRestriction(self.metadata, self.cheap),
+            self.cheap)
+        self.assertEqual(
+            util.order_by_cost(r),
+            packages.AndRestriction(
+                self.cheap, packages.OrRestriction(self.cheap, self.metadata),
+                self.costly))
+        # forcing only hoists what doesn't require metadata
+        self.assertEqual(
+            util.order_by_cost(r, forcing=True),
+            packages.AndRestriction(
+                self.cheap, self.costly,
+                packages.OrRestriction(self.metadata, self.cheap)))
+        r = packages.OrRestriction(self.metadata, self.cheap)
+        self.assertIdentical(util.order_by_cost(r, forcing=True), r)
+        r = packages.AndRestriction(self.metadata, self.cheap, negate=True)
+        self.assertIdentical(util.order_by_cost(r, forcing=True), r)
+        self.assertEqual(
+            util.order_by_cost(r),
+            packages.AndRestriction(self.cheap, self.metadata, negate=True))
+        # atoms order their own restrictions
+        a = atom("dev-util/foo:1")
+        self.assertIdentical(util.order_by_cost(a), a)
+
+    def test_split_by_cost(self):
+        self.assertEqual(util.split_by_cost(self.cheap), (self.cheap, None))
+        self.assertEqual(util.split_by_cost(self.metadata), (None, self.metadata))
+        r = packages.AndRestriction(self.metadata, self.cheap)
+        self.assertEqual(util.split_by_cost(r), (self.cheap, self.metadata))
+        r = packages.AndRestriction(self.metadata, self.cheap, self.costly, self.cheap)
+        self.assertEqual(
+            util.split_by_cost(r),
+            (packages.AndRestriction(self.cheap, self.cheap),
+             packages.AndRestriction(self.metadata, self.costly)))
+        r = packages.AndRestriction(self.metadata, self.cheap, negate=True)
+        self.assertEqual(util.split_by_cost(r), (None, r))
+        r = packages.OrRestriction(self.metadata, self.cheap)
+        self.assertEqual(util.split_by_cost(r), (None, r))
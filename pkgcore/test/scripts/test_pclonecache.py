@@ -2,7 +2,11 @@
 # License: BSD/GPL2
 
 from snakeoil import compatibility
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
 
+from pkgcore.cache import flat_hash, packed
 from pkgcore.config import basics, ConfigHint
 from pkgcore.scripts import pclonecache
 from pkgcore.test.scripts.helpers import ArgParseMixin
@@ -42,3 +46,46 @@ class CommandlineTest(TestCase, ArgParseMixin):
             'spork', 'spork2',
             spork=basics.HardCodedConfigSection({'class': Cache,}),
             spork2=basics.HardCodedConfigSection({'class': Cache,}))
+
+
+class CloneTest(TempDirMixin, TestCase, ArgParseMixin):
+
+    _argparser = pclonecache.argparser
+
+    def test_md5_to_packed(self):
+        repo = pjoin(self.dir, 'repo')
+        source = flat_hash.md5_cache(repo)
+        eutils = LazilyHashedPath('/nonexistent', md5=0x1234)
+        source['dev-util/foo-1'] = {
+            'SLOT': '0', '_chf_': LazilyHashedPath('/nonexistent', md5=0xab),
+            '_eclasses_': {'eutils': eutils}}
+        source['dev-util/bar-2'] = {
+            'SLOT': '2', '_chf_': LazilyHashedPath('/nonexistent', md5=0xcd)}
+
+        packed_location = pjoin(self.dir, 'packed')
+        self.assertOut(
+            [], 'source', 'target',
+            source=basics.HardCodedConfigSection({
+                'class': flat_hash.md5_cache, 'location': repo,
+                'readonly': True}),
+            target=basics.HardCodedConfigSection({
+                'class': packed.md5_cache, 'location': packed_location}))
+
+        target = packed.md5_cache(packed_location, readonly=True)
+        self.assertEqual(sorted(target), sorted(source))
+        for cpv in source:
+            self.assertEqual(target[cpv], source[cpv])
+        self.assertEqual(
+            list(target['dev-util/foo-1']['_eclasses_']),
+            [('eutils', (('md5', 0x1234L),))])
+
+    def test_incompatible(self):
+        self.assertError(
+            "source cache entries lack the chksums the target cache is "
+            "validated by: eclassdir, mtime",
+            'source', 'target',
+            source=basics.HardCodedConfigSection({
+                'class': flat_hash.md5_cache, 'location': self.dir}),
+            target=basics.HardCodedConfigSection({
+                'class': packed.database,
+                'location': pjoin(self.dir, 'packed')}))
@@ -235,3 +235,13 @@ class TestRegen(TestCase, ArgParseMixin):
         self.assertEqual(
             [options.repos[0].__class__, options.threads],
             [TestSimpleTree, 2])
+        self.assertEqual(options.jobs_mode, 'thread')
+
+        options = self.parse(
+            'spork', '--jobs-mode', 'process', spork=basics.HardCodedConfigSection(
+                {'class': fake_repo}))
+        self.assertEqual(options.jobs_mode, 'process')
+        self.assertError(
+            "argument --jobs-mode: invalid choice: 'fork' (choose from 'thread', 'process')",
+            'spork', '--jobs-mode', 'fork', spork=basics.HardCodedConfigSection(
+                {'class': fake_repo}))
@@ -75,3 +75,24 @@ class CommandlineTest(TestCase, ArgParseMixin):
 
     def test_no_contents(self):
         self.assertOut([], '--contents', '--all', test_domain=domain_config)
+
+    def test_jobs(self):
+        self.assertError(
+            '--jobs must be a positive integer', '--jobs', '0', '--all',
+            domain=domain_config)
+
+        @configurable(typename='repo')
+        def other_repo():
+            return util.SimpleTree({'dev-util': {'bsdiff': ('0.4',)}})
+
+        config = basics.HardCodedConfigSection({
+            'class': FakeDomain,
+            'repos': [basics.HardCodedConfigSection({'class': fake_repo}),
+                      basics.HardCodedConfigSection({'class': other_repo})],
+            'vdb': [basics.HardCodedConfigSection({'class': fake_vdb})],
+            'default': True,
+            })
+        # matches are output in repo order regardless of concurrency
+        expected = ['spork/foon-1', 'spork/foon-2', 'dev-util/bsdiff-0.4']
+        self.assertOut(expected, '--all', test_domain=config)
+        self.assertOut(expected, '-j', '2', '--all', test_domain=config)
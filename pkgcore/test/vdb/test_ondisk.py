@@ -0,0 +1,258 @@
+# License: GPL2/BSD
+
+from functools import partial
+import os
+import shutil
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.restrictions import packages, values
+from pkgcore.test import malleable_obj
+from pkgcore.util import parserestrict
+from pkgcore.vdb import ondisk, repo_ops
+
+
+def replace_pkg(repo, old_cpv, new_cpv, tmpdir, paths=(), **data):
+    """Replace an installed pkg via the vdb replace op, returning the op."""
+    old_pkg, = (x for x in repo if x.cpvstr == old_cpv)
+    category, pf = new_cpv.split('/')
+    package, fullver = pf.rsplit('-', 1)
+    data = dict((k.lower(), v) for k, v in data.iteritems())
+    new_pkg = malleable_obj(
+        category=category, package=package, fullver=fullver, cpvstr=new_cpv,
+        PF=pf, ebuild=None, tracked_attributes=['contents'] + sorted(data),
+        contents=contentsSet(
+            fs.fsFile(x, strict=False, chksums={'md5': 0L}, mtime=0)
+            for x in paths),
+        **data)
+    op = repo_ops.replace(repo, old_pkg, new_pkg, None)
+    op.start()
+    op.add_data(malleable_obj(tmpdir=tmpdir))
+    op.finish()
+    return op
+
+
+class TestMetadataCache(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache_location = pjoin(self.dir, 'cache')
+
+    def mk_pkg(self, cpv, mtime=None, **data):
+        path = pjoin(self.vdb, cpv)
+        os.makedirs(path)
+        for key, val in data.iteritems():
+            with open(pjoin(path, key), 'w') as f:
+                f.write(val)
+        if mtime is None:
+            # old enough to be cached
+            mtime = time.time() - 60
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def get_repo(self, **kwds):
+        kwds.setdefault('cache_location', self.cache_location)
+        return ondisk.tree(self.vdb, **kwds)
+
+    def test_it(self):
+        path = self.mk_pkg(
+            'dev-util/foo-1', SLOT='1\n', USE='a b\n', EAPI='5\n',
+            DEPEND='dev-libs/bar\n', repository='gentoo\n')
+        repo = self.get_repo()
+        pkg, = repo
+        self.assertEqual(pkg.slot, '1')
+        self.assertEqual(sorted(pkg.use), ['a', 'b'])
+        self.assertEqual(pkg.source_repository, 'gentoo')
+        self.assertEqual(str(pkg.depends), 'dev-libs/bar')
+        repo.flush_metadata_cache()
+        self.assertTrue(os.path.exists(pjoin(self.cache_location, 'metadata')))
+
+        # cached values are used while the pkg dir mtime is unchanged
+        st = os.stat(path)
+        for key in ('SLOT', 'USE'):
+            os.unlink(pjoin(path, key))
+        os.utime(path, (st.st_atime, st.st_mtime))
+        pkg, = self.get_repo()
+        self.assertEqual(pkg.slot, '1')
+        self.assertEqual(sorted(pkg.use), ['a', 'b'])
+        self.assertEqual(str(pkg.eapi), '5')
+        # missing files are cached as well
+        self.assertEqual(str(pkg.post_rdepends), '')
+
+        # modifications invalidate the entry
+        with open(pjoin(path, 'SLOT'), 'w') as f:
+            f.write('2\n')
+        os.utime(path, (st.st_atime, st.st_mtime + 5))
+        pkg, = self.get_repo()
+        self.assertEqual(pkg.slot, '2')
+
+    def test_racy_entries(self):
+        self.mk_pkg('dev-util/foo-1', mtime=time.time(), SLOT='0\n')
+        repo = self.get_repo()
+        pkg, = repo
+        self.assertEqual(pkg.slot, '0')
+        self.assertNotIn('dev-util/foo-1', repo.metadata_cache)
+
+    def test_escaping(self):
+        self.mk_pkg('dev-util/foo-1', IUSE='a\\nb\nc\n')
+        repo = self.get_repo()
+        pkg, = repo
+        self.assertEqual(pkg.data['IUSE'], 'a\\nb\nc\n')
+        repo.flush_metadata_cache()
+        entry = self.get_repo().metadata_cache['dev-util/foo-1']
+        self.assertEqual(entry['IUSE'], 'a\\\\nb\\nc\\n')
+        pkg, = self.get_repo()
+        self.assertEqual(pkg.data['IUSE'], 'a\\nb\nc\n')
+
+    def test_update(self):
+        self.mk_pkg('dev-util/foo-1', SLOT='0\n')
+        self.mk_pkg('dev-util/foo-2', SLOT='0\n')
+        repo = self.get_repo()
+        self.assertEqual(sorted(pkg.slot for pkg in repo), ['0', '0'])
+        repo.flush_metadata_cache()
+
+        # entries of merged pkgs are stored regardless of their mtime
+        self.mk_pkg('dev-util/bar-1', mtime=time.time(), SLOT='1\n')
+        repo.update_metadata_cache('dev-util/bar-1')
+        self.assertIn('dev-util/bar-1', repo.metadata_cache)
+        repo.update_metadata_cache('dev-util/foo-1', removed=True)
+        self.assertNotIn('dev-util/foo-1', repo.metadata_cache)
+        repo.flush_metadata_cache()
+
+        # flushing drops entries of pkgs that were removed behind our back
+        os.rename(pjoin(self.vdb, 'dev-util', 'foo-2'),
+                  pjoin(self.vdb, 'dev-util', 'foo-3'))
+        repo = self.get_repo()
+        repo.update_metadata_cache('dev-util/bar-1')
+        repo.flush_metadata_cache()
+        self.assertEqual(
+            sorted(self.get_repo().metadata_cache.iterkeys()), ['dev-util/bar-1'])
+
+    def test_replace(self):
+        self.mk_pkg('dev-util/foo-1', SLOT='0\n')
+        repo = self.get_repo()
+        self.assertEqual([pkg.slot for pkg in repo], ['0'])
+        replace_pkg(repo, 'dev-util/foo-1', 'dev-util/foo-2', self.dir, SLOT='1')
+        # finishing the op persists the cache rather than leaving it to exit
+        cache = self.get_repo().metadata_cache
+        self.assertEqual(list(cache.iterkeys()), ['dev-util/foo-2'])
+        self.assertEqual(cache['dev-util/foo-2']['SLOT'], '1\\n')
+
+    def test_disabled(self):
+        self.mk_pkg('dev-util/foo-1', SLOT='0\n')
+        repo = self.get_repo(disable_cache=True)
+        self.assertIdentical(None, repo.metadata_cache)
+        pkg, = repo
+        self.assertEqual(pkg.slot, '0')
+        repo.flush_metadata_cache()
+        self.assertFalse(os.path.exists(self.cache_location))
+
+
+class TestOwnersIndex(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache_location = pjoin(self.dir, 'cache')
+
+    def mk_pkg(self, cpv, contents, mtime=None):
+        path = pjoin(self.vdb, cpv)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        with open(pjoin(path, 'CONTENTS'), 'w') as f:
+            f.write(''.join('%s\n' % x for x in contents))
+        if mtime is None:
+            mtime = time.time() - 60
+        os.utime(pjoin(path, 'CONTENTS'), (mtime, mtime))
+
+    def get_repo(self):
+        return ondisk.tree(self.vdb, cache_location=self.cache_location)
+
+    def test_it(self):
+        self.mk_pkg('dev-util/foo-1', ['dir /usr', 'dir /usr/bin', 'obj /usr/bin/foo 0 1'])
+        self.mk_pkg('dev-util/bar-1', ['dir /usr', 'sym /usr/bin/bar -> foo 1'])
+        repo = self.get_repo()
+        self.assertEqual(
+            sorted(repo.owners_index.owners('/usr')), ['dev-util/bar-1', 'dev-util/foo-1'])
+        self.assertTrue(os.path.exists(pjoin(self.cache_location, 'owners')))
+
+        # the persisted index is used for pkgs unmodified since
+        with open(pjoin(self.vdb, 'dev-util/foo-1', 'CONTENTS'), 'a') as f:
+            f.write('obj /usr/bin/foo2 0 1\n')
+        os.utime(pjoin(self.vdb, 'dev-util/foo-1', 'CONTENTS'), (0, time.time() - 60))
+        self.mk_pkg('dev-util/bar-1', ['dir /usr', 'sym /usr/bin/bar2 -> foo 1'], mtime=0)
+        self.mk_pkg('dev-util/baz-1', ['dir /usr'])
+        index = self.get_repo().owners_index
+        self.assertEqual(index.owners('/usr/bin/foo2'), {})
+        self.assertEqual(index.owners('/usr/bin/bar2'), {'dev-util/bar-1': ['/usr/bin/bar2']})
+        self.assertEqual(index.owners('/usr/bin/bar'), {})
+        self.assertEqual(len(index.owners('/usr')), 3)
+
+        # uninstalled pkgs are dropped
+        shutil.rmtree(pjoin(self.vdb, 'dev-util/baz-1'))
+        self.assertEqual(len(self.get_repo().owners_index.owners('/usr')), 2)
+
+    def test_replace(self):
+        self.mk_pkg('dev-util/foo-1', ['dir /usr', 'obj /usr/bin/foo 0 1'])
+        repo = self.get_repo()
+        self.assertEqual(list(repo.owners_index.owners('/usr/bin/foo')), ['dev-util/foo-1'])
+        replace_pkg(repo, 'dev-util/foo-1', 'dev-util/foo-2', self.dir, ['/usr/bin/foo2'])
+        # finishing the op persists the index, sparing the next run a rescan
+        repo = self.get_repo()
+        with mock.patch('pkgcore.vdb.owners.iter_contents_paths') as scan:
+            index = repo.owners_index
+            self.assertFalse(scan.called)
+        self.assertEqual(index.owners('/usr/bin/foo'), {})
+        self.assertEqual(list(index.owners('/usr/bin/foo2')), ['dev-util/foo-2'])
+
+    def test_racy_entries(self):
+        self.mk_pkg('dev-util/foo-1', ['obj /usr/bin/foo 0 1'], mtime=time.time())
+        index = self.get_repo().owners_index
+        self.assertEqual(index.owners('/usr/bin/foo'), {'dev-util/foo-1': ['/usr/bin/foo']})
+        self.assertIdentical(None, index.get('dev-util/foo-1')[0])
+
+    def test_itermatch(self):
+        self.mk_pkg('dev-util/foo-1', ['dir /usr', 'obj /usr/bin/foo 0 1'])
+        self.mk_pkg('dev-util/foo-2', ['dir /usr', 'obj /usr/bin/foo2 0 1'])
+        self.mk_pkg('dev-util/bar-1', ['dir /usr', 'obj /usr/bin/bar 0 1'])
+        repo = self.get_repo()
+        owns = parserestrict.comma_separated_containment(
+            'contents', values_kls=contentsSet,
+            token_kls=partial(fs.fsBase, strict=False))
+        owns_re = lambda x: packages.PackageRestriction('contents', values.AnyMatch(
+            values.GetAttrRestriction('location', values.StrRegex(x))))
+
+        self.assertEqual(repo.find_owners(owns('/usr/bin/foo')), {'dev-util/foo-1': ['/usr/bin/foo']})
+        with mock.patch.object(repo, '_get_categories') as get_categories:
+            self.assertEqual(
+                sorted(x.cpvstr for x in repo.itermatch(owns('/usr/bin/foo,/usr/bin/bar'))),
+                ['dev-util/bar-1', 'dev-util/foo-1'])
+            self.assertEqual(
+                [x.cpvstr for x in repo.itermatch(packages.AndRestriction(
+                    owns_re('^/usr/bin/foo'), packages.PackageRestriction(
+                        'fullver', values.StrExactMatch('2'))))],
+                ['dev-util/foo-2'])
+            self.assertEqual(
+                [x.cpvstr for x in repo.itermatch(packages.OrRestriction(
+                    owns('/usr/bin/bar'), owns_re('foo2$')), sorter=sorted)],
+                ['dev-util/bar-1', 'dev-util/foo-2'])
+            # the index sufficed for finding the candidates
+            self.assertFalse(get_categories.called)
+
+        # restrictions the index can't resolve fall back to scanning
+        self.assertEqual(
+            sorted(x.cpvstr for x in repo.itermatch(packages.OrRestriction(
+                owns('/usr/bin/bar'), packages.PackageRestriction(
+                    'fullver', values.StrExactMatch('2'))))),
+            ['dev-util/bar-1', 'dev-util/foo-2'])
@@ -0,0 +1,86 @@
+# License: GPL2/BSD
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors
+from pkgcore.vdb import owners
+
+
+class TestOwnersIndex(TempDirMixin, TestCase):
+
+    def test_iter_contents_paths(self):
+        path = pjoin(self.dir, 'CONTENTS')
+        with open(path, 'w') as f:
+            f.write(
+                "dir /usr\n"
+                "dir /usr/bin/\n"
+                "obj /usr/bin/foo bar d41d8cd98f00b204e9800998ecf8427e 100\n"
+                "sym /usr/bin/baz -> foo bar 100\n"
+                "fif /run/fifo\n"
+                "bogus /blah\n")
+        self.assertEqual(
+            list(owners.iter_contents_paths(path)),
+            ['/usr', '/usr/bin', '/usr/bin/foo bar', '/usr/bin/baz', '/run/fifo'])
+        self.assertEqual(list(owners.iter_contents_paths(pjoin(self.dir, 'missing'))), [])
+
+    def test_it(self):
+        index = owners.OwnersIndex([
+            ('dev-util/foo-1', 1, ['/usr', '/usr/bin/foo']),
+            ('dev-util/bar-1', 2, ['/usr', '/usr/bin/bar'])])
+        self.assertFalse(index.modified)
+        self.assertEqual(
+            index.owners(['/usr/bin/foo', '/usr/bin/bar', '/nonexistent']),
+            {'dev-util/foo-1': ['/usr/bin/foo'], 'dev-util/bar-1': ['/usr/bin/bar']})
+        self.assertEqual(
+            sorted(index.owners('/usr')), ['dev-util/bar-1', 'dev-util/foo-1'])
+        self.assertEqual(
+            index.match(lambda x: x.endswith('foo')), {'dev-util/foo-1': ['/usr/bin/foo']})
+
+        index.add('dev-util/foo-1', 3, ['/usr/bin/foo2'])
+        self.assertTrue(index.modified)
+        self.assertEqual(index.get('dev-util/foo-1'), (3, ('/usr/bin/foo2',)))
+        self.assertEqual(index.owners('/usr/bin/foo'), {})
+        index.discard('dev-util/bar-1')
+        self.assertEqual(index.owners('/usr'), {})
+        self.assertEqual(list(index), ['dev-util/foo-1'])
+
+    def test_persistence(self):
+        path = pjoin(self.dir, 'owners')
+        self.assertIdentical(None, owners.read_index(path))
+        index = owners.OwnersIndex([
+            ('dev-util/foo-1', 1, ['/usr', '/usr/bin/foo']),
+            ('dev-util/bar-1', None, [])])
+        index.modified = True
+        owners.write_index(path, index)
+        self.assertFalse(index.modified)
+        index = owners.read_index(path)
+        self.assertEqual(
+            sorted(index.iteritems()),
+            [('dev-util/bar-1', (None, ())),
+             ('dev-util/foo-1', (1, ('/usr', '/usr/bin/foo')))])
+
+        with open(path, 'w') as f:
+            f.write('blah\n')
+        self.assertIdentical(None, owners.read_index(path))
+        with open(path, 'w') as f:
+            f.write('%s\n/usr\n' % owners._MAGIC)
+        self.assertRaises(errors.CacheError, owners.read_index, path)
+
+    def test_replace(self):
+        # a replace unmerges the old version and merges the new one; paths
+        # both own move over to the new version once written out
+        path = pjoin(self.dir, 'owners')
+        index = owners.OwnersIndex([
+            ('dev-util/foo-1', 1, ['/usr', '/usr/bin/foo']),
+            ('dev-util/bar-1', 1, ['/usr'])])
+        index.discard('dev-util/foo-1')
+        index.add('dev-util/foo-2', 2, ['/usr', '/usr/bin/foo', '/usr/bin/foo2'])
+        owners.write_index(path, index)
+        index = owners.read_index(path)
+        self.assertEqual(sorted(index), ['dev-util/bar-1', 'dev-util/foo-2'])
+        self.assertEqual(
+            index.owners(['/usr/bin/foo', '/usr/bin/foo2']),
+            {'dev-util/foo-2': ['/usr/bin/foo', '/usr/bin/foo2']})
+        self.assertEqual(sorted(index.owners('/usr')), ['dev-util/bar-1', 'dev-util/foo-2'])
@@ -75,3 +75,50 @@ def map_async(iterable, functor, *args, **kwds):
         reclaim_threads(threads)
 
     assert q.empty()
+
+
+def imap_ordered(functor, iterable, threads=None):
+    """Map functor across a pool of threads, yielding results in order.
+
+    All items are dispatched up front; results are yielded as soon as they
+    and all prior results are available.  An exception raised by functor is
+    reraised in place of its result.
+    """
+    items = list(iterable)
+    if threads is None:
+        threads = cpu_count()
+    threads = max(min(len(items), threads), 1)
+
+    q = Queue.Queue()
+    for x in enumerate(items):
+        q.put(x)
+    results = [None] * len(items)
+    done = [threading.Event() for x in items]
+
+    def worker():
+        while True:
+            try:
+                idx, item = q.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[idx] = (True, functor(item))
+            except Exception as e:
+                results[idx] = (False, e)
+            done[idx].set()
+
+    for x in xrange(threads):
+        t = threading.Thread(target=worker)
+        # don't block exit if the consumer bails out early
+        t.daemon = True
+        t.start()
+
+    for idx, event in enumerate(done):
+        # waiting w/out a timeout blocks signals, thus KeyboardInterrupt
+        while not event.wait(0.1):
+            pass
+        success, result = results[idx]
+        results[idx] = None
+        if not success:
+            raise result
+        yield result
@@ -6,26 +6,53 @@ __all__ = ("tree", "ConfiguredTree")
 import errno
 from functools import partial
 import os
+import re
 import stat
 
 from snakeoil import compatibility, data_source, klass
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import readfile
 from snakeoil.mappings import IndeterminantDict
-from snakeoil.osutils import listdir_dirs, pjoin
+from snakeoil.osutils import ensure_dirs, listdir_dirs, pjoin, stat_mtime_long
 
 from pkgcore.config import ConfigHint
 from pkgcore.ebuild import ebuild_built
 from pkgcore.ebuild.cpv import versioned_CPV
 from pkgcore.ebuild.errors import InvalidCPV
 from pkgcore.repository import errors, multiplex, prototype
+from pkgcore.restrictions import packages, values
 
 demandload(
+    'time',
+    'weakref',
+    'snakeoil.chksum:LazilyHashedPath',
+    'snakeoil.process.spawn:atexit_register',
+    'pkgcore.cache:errors@cache_errors,packed',
     'pkgcore.log:logger',
-    'pkgcore.vdb:repo_ops',
+    'pkgcore.vdb:owners,repo_ops',
     'pkgcore.vdb.contents:ContentsFile',
 )
 
+_unescape_re = re.compile(r'\\(.)')
+
+
+def _escape(value):
+    # cache entries are stored one key per line
+    return value.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _unescape(value):
+    if '\\' not in value:
+        return value
+    return _unescape_re.sub(
+        lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def _flush_metadata_cache(tree_ref):
+    tree = tree_ref()
+    if tree is not None:
+        tree.flush_metadata_cache()
+
 
 class tree(prototype.tree):
     livefs = True
@@ -41,6 +68,11 @@ class tree(prototype.tree):
          'disable_cache': 'bool'},
         typename='repo')
 
+    # keys cached in cache_location, saving a file read each on access
+    cached_keys = frozenset([
+        'SLOT', 'USE', 'IUSE', 'DEPEND', 'RDEPEND', 'PDEPEND', 'KEYWORDS',
+        'repository', 'EAPI'])
+
     def __init__(self, location, cache_location=None, repo_id='vdb',
                  disable_cache=False):
         prototype.tree.__init__(self, frozen=False)
@@ -52,6 +84,7 @@ class tree(prototype.tree):
             cache_location = pjoin("/var/cache/edb/dep", location.lstrip("/"))
         self.cache_location = cache_location
         self._versions_tmp_cache = {}
+        self._metadata_cache_dirty = self._metadata_cache_flush_registered = False
         try:
             st = os.stat(self.location)
             if not stat.S_ISDIR(st.st_mode):
@@ -146,10 +179,242 @@ class tree(prototype.tree):
     }
 
     def _get_metadata(self, pkg):
-        return IndeterminantDict(
-            partial(self._internal_load_key, pjoin(
-                self.location, pkg.category,
-                "%s-%s" % (pkg.package, pkg.fullver))))
+        path = pjoin(self.location, pkg.category, "%s-%s" % (pkg.package, pkg.fullver))
+        cached = self._get_cached_metadata(pkg.cpvstr, path)
+        if cached is None:
+            return IndeterminantDict(partial(self._internal_load_key, path))
+        return IndeterminantDict(partial(self._load_key, path, cached))
+
+    def _load_key(self, path, cached, key):
+        key = self._metadata_rewrites.get(key, key)
+        if key in self.cached_keys:
+            try:
+                return cached[key]
+            except KeyError:
+                # the file didn't exist when cached
+                raise KeyError((path, key))
+        return self._internal_load_key(path, key)
+
+    @klass.jit_attr_named('_metadata_cache')
+    def metadata_cache(self):
+        """:obj:`pkgcore.cache.packed.database` caching :obj:`cached_keys`
+
+        None if caching is disabled.
+        """
+        if self.cache_location is None:
+            return None
+        return packed.database(
+            pjoin(self.cache_location, 'metadata'), auxdbkeys=self.cached_keys)
+
+    def _get_cached_metadata(self, cpv, path):
+        """Return the cached keys of the pkg at path, updating the cache as needed.
+
+        :return: mapping of cached keys to their values, or None if caching
+            isn't possible
+        """
+        cache = self.metadata_cache
+        if cache is None:
+            return None
+        try:
+            chf = LazilyHashedPath(path, mtime=stat_mtime_long(path))
+        except EnvironmentError:
+            return None
+        try:
+            entry = cache[cpv]
+            if cache.validate_entry(entry, chf, None):
+                return {k: _unescape(v) for k, v in entry.iteritems()
+                        if k in self.cached_keys}
+        except KeyError:
+            pass
+        except cache_errors.CacheError as e:
+            logger.debug("disabling vdb metadata cache, failed reading it: %s", e)
+            self._metadata_cache = None
+            return None
+
+        data = self._read_cached_keys(path)
+        # entries modified within the mtime's resolution could change
+        # again without the mtime changing; leave them for a later run
+        if time.time() - chf.mtime >= 2:
+            self._store_cached_metadata(cpv, chf, data)
+        return data
+
+    def _read_cached_keys(self, path):
+        data = {}
+        for key in self.cached_keys:
+            val = readfile(pjoin(path, key), True)
+            if val is not None:
+                data[key] = val
+        return data
+
+    def _store_cached_metadata(self, cpv, chf, data):
+        entry = {k: _escape(v) for k, v in data.iteritems()}
+        entry['_chf_'] = chf
+        self.metadata_cache[cpv] = entry
+        self._metadata_cache_modified()
+
+    def _metadata_cache_modified(self):
+        self._metadata_cache_dirty = True
+        if not self._metadata_cache_flush_registered:
+            atexit_register(_flush_metadata_cache, weakref.ref(self))
+            self._metadata_cache_flush_registered = True
+
+    def update_metadata_cache(self, cpv, removed=False):
+        """Update the metadata cache for a merged or unmerged pkg.
+
+        The update is written out by the next :obj:`flush_metadata_cache`.
+
+        :param cpv: cpv string of the pkg
+        :param removed: whether the pkg was unmerged
+        """
+        cache = self.metadata_cache
+        if cache is None:
+            return
+        try:
+            if removed:
+                try:
+                    del cache[cpv]
+                except KeyError:
+                    return
+                self._metadata_cache_modified()
+            else:
+                path = pjoin(self.location, cpv)
+                try:
+                    chf = LazilyHashedPath(path, mtime=stat_mtime_long(path))
+                except EnvironmentError:
+                    return
+                # we're the ones that just wrote it, thus no need to wait
+                # for the mtime to settle
+                self._store_cached_metadata(cpv, chf, self._read_cached_keys(path))
+        except cache_errors.CacheError as e:
+            logger.debug("failed updating vdb metadata cache: %s", e)
+
+    def flush_metadata_cache(self):
+        """Write out pending metadata cache updates, dropping entries for
+        pkgs no longer installed."""
+        cache = self.metadata_cache
+        if cache is None or not self._metadata_cache_dirty:
+            return
+        try:
+            installed = set(
+                "%s/%s-%s" % (cp + (ver,))
+                for cp, vers in self.versions.iteritems() for ver in vers)
+            for cpv in [x for x in cache.iterkeys() if x not in installed]:
+                del cache[cpv]
+            cache.commit()
+        except cache_errors.CacheError as e:
+            logger.debug("failed writing vdb metadata cache: %s", e)
+        self._metadata_cache_dirty = False
+
+    @klass.jit_attr_named('_owners_index')
+    def owners_index(self):
+        """:obj:`pkgcore.vdb.owners.OwnersIndex` of the installed pkgs
+
+        Loaded from cache_location if possible, regenerating the entries of
+        pkgs modified since and persisting the result.
+        """
+        index = None
+        if self.cache_location is not None:
+            try:
+                index = owners.read_index(pjoin(self.cache_location, 'owners'))
+            except cache_errors.CacheError as e:
+                logger.debug("ignoring vdb owners index: %s", e)
+        if index is None:
+            index = owners.OwnersIndex()
+
+        installed = set()
+        now = time.time()
+        for (cat, pkg), vers in self.versions.iteritems():
+            for ver in vers:
+                cpv = "%s/%s-%s" % (cat, pkg, ver)
+                installed.add(cpv)
+                self._update_owners(index, cpv, now)
+        for cpv in [x for x in index if x not in installed]:
+            index.discard(cpv)
+        self._write_owners_index(index)
+        return index
+
+    def _update_owners(self, index, cpv, now=None):
+        path = pjoin(self.location, cpv, 'CONTENTS')
+        try:
+            mtime = stat_mtime_long(path)
+        except EnvironmentError:
+            # no CONTENTS, thus nothing owned
+            mtime = -1
+        entry = index.get(cpv)
+        if entry is not None and entry[0] == mtime:
+            return
+        paths = owners.iter_contents_paths(path) if mtime != -1 else ()
+        if now is not None and now - mtime < 2:
+            # modifications within the mtime's resolution would go unnoticed
+            mtime = None
+        index.add(cpv, mtime, paths)
+
+    def _write_owners_index(self, index):
+        if self.cache_location is None or not index.modified:
+            return
+        try:
+            if ensure_dirs(self.cache_location, mode=0755):
+                owners.write_index(pjoin(self.cache_location, 'owners'), index)
+        except cache_errors.CacheError as e:
+            logger.debug("failed writing vdb owners index: %s", e)
+
+    def update_owners_index(self, cpv, removed=False):
+        """Update the owners index for a merged or unmerged pkg.
+
+        Does nothing if the index isn't loaded; pkgs modified since it was
+        persisted are picked up when it's next loaded.  The update is written
+        out by the next :obj:`flush_owners_index`.
+
+        :param cpv: cpv string of the pkg
+        :param removed: whether the pkg was unmerged
+        """
+        index = getattr(self, '_owners_index', None)
+        if not isinstance(index, owners.OwnersIndex):
+            return
+        if removed:
+            index.discard(cpv)
+        else:
+            self._update_owners(index, cpv)
+
+    def flush_owners_index(self):
+        """Write out pending owners index updates."""
+        index = getattr(self, '_owners_index', None)
+        if isinstance(index, owners.OwnersIndex):
+            self._write_owners_index(index)
+
+    def find_owners(self, restrict):
+        """Find the pkgs a restriction on contents matches using the owners index.
+
+        :param restrict: a :obj:`pkgcore.restrictions.packages.PackageRestriction`
+            on the contents attribute, either containment of fs objects or
+            paths (``pquery --owns``), or any fs object's location matching
+            (``pquery --owns-re``)
+        :return: dict mapping cpv strings of pkgs that may match to the list
+            of their paths that matched, or None if restrict can't be
+            resolved via the index
+        """
+        if (not isinstance(restrict, packages.PackageRestriction) or
+                restrict.negate or restrict.attr != 'contents'):
+            return None
+        child = restrict.restriction
+        if isinstance(child, values.ContainmentMatch2) and not child.negate:
+            return self.owners_index.owners(
+                getattr(x, 'location', x) for x in child.vals)
+        if isinstance(child, values.AnyMatch) and not child.negate:
+            child = child.restriction
+            if (isinstance(child, values.GetAttrRestriction) and
+                    not child.negate and child.attr == 'location'):
+                return self.owners_index.match(child.restriction.match)
+        return None
+
+    def _identify_candidates(self, restrict, sorter):
+        # contents restrictions are resolved via the owners index rather
+        # than parsing every pkg's CONTENTS
+        candidates = self._identify_indexed_candidates(
+            restrict, ('contents',), self.find_owners)
+        if candidates is None:
+            return prototype.tree._identify_candidates(self, restrict, sorter)
+        return candidates
 
     def _internal_load_key(self, path, key):
         key = self._metadata_rewrites.get(key, key)
@@ -212,5 +477,7 @@ class ConfiguredTree(multiplex.tree):
         multiplex.tree.__init__(self, raw_vdb)
 
     frozen = klass.alias_attr("raw_vdb.frozen")
+    owners_index = klass.alias_attr("raw_vdb.owners_index")
+    find_owners = klass.alias_attr("raw_vdb.find_owners")
 
 tree.configure = ConfiguredTree
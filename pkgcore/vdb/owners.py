@@ -0,0 +1,161 @@
+# License: GPL2/BSD
+
+"""
+file ownership index, mapping paths to the installed pkgs owning them
+"""
+
+__all__ = ("OwnersIndex", "iter_contents_paths", "read_index", "write_index")
+
+from snakeoil.fileutils import readlines_ascii
+from snakeoil.osutils import normpath
+
+from pkgcore.cache import index_file
+
+_MAGIC = "pkgcore-owners-index 1"
+
+
+def iter_contents_paths(path):
+    """Yield the locations listed in a CONTENTS file.
+
+    Unlike :obj:`pkgcore.vdb.contents.ContentsFile` no fs objects are
+    created; unknown entries are skipped.
+    """
+    for line in readlines_ascii(path, True, True):
+        kind, _, rest = line.partition(" ")
+        if kind == "obj":
+            # obj <path> <md5> <mtime>
+            location = rest.rsplit(" ", 2)[0]
+        elif kind == "sym":
+            # sym <path> -> <target> <mtime>
+            location = rest.split(" -> ", 1)[0]
+        elif kind in ("dir", "dev", "fif"):
+            location = rest
+        else:
+            continue
+        yield normpath(location)
+
+
+class OwnersIndex(object):
+    """Tracks the paths each installed pkg owns, and the reverse.
+
+    Entries carry the mtime of the CONTENTS file they were generated from,
+    None marking entries that need to be regenerated regardless.
+
+    :ivar modified: whether the index changed since it was last persisted
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}
+        # paths map to the owning cpv, or a tuple of cpvs if shared
+        self._owners = {}
+        for cpv, mtime, paths in entries:
+            self.add(cpv, mtime, paths)
+        self.modified = False
+
+    def add(self, cpv, mtime, paths):
+        """Set the paths owned by cpv, replacing any prior entry."""
+        self.discard(cpv)
+        paths = tuple(paths)
+        self._entries[cpv] = (mtime, paths)
+        owners = self._owners
+        # most paths have a single owner; add those in bulk
+        new = dict.fromkeys(paths, cpv)
+        for path in filter(owners.__contains__, new):
+            existing = owners[path]
+            if isinstance(existing, tuple):
+                new[path] = existing + (cpv,)
+            else:
+                new[path] = (existing, cpv)
+        owners.update(new)
+        self.modified = True
+
+    def discard(self, cpv):
+        """Drop cpv from the index, if it's present."""
+        entry = self._entries.pop(cpv, None)
+        if entry is None:
+            return
+        owners = self._owners
+        for path in entry[1]:
+            existing = owners[path]
+            if not isinstance(existing, tuple):
+                del owners[path]
+                continue
+            existing = tuple(x for x in existing if x != cpv)
+            owners[path] = existing[0] if len(existing) == 1 else existing
+        self.modified = True
+
+    def owners(self, paths):
+        """Find the owners of the given paths.
+
+        :return: dict mapping owning cpvs to the list of paths each owns
+        """
+        if isinstance(paths, basestring):
+            paths = (paths,)
+        d = {}
+        get = self._owners.get
+        for path in paths:
+            cpvs = get(path)
+            if cpvs is None:
+                continue
+            elif not isinstance(cpvs, tuple):
+                cpvs = (cpvs,)
+            for cpv in cpvs:
+                d.setdefault(cpv, []).append(path)
+        return d
+
+    def match(self, matcher):
+        """Find the owners of the paths matcher returns True for.
+
+        :return: dict mapping owning cpvs to the list of matching paths each owns
+        """
+        return self.owners(x for x in self._owners if matcher(x))
+
+    def get(self, cpv, default=None):
+        """Return the (mtime, paths) entry of cpv, or default if it isn't indexed."""
+        return self._entries.get(cpv, default)
+
+    def __contains__(self, cpv):
+        return cpv in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def iteritems(self):
+        return self._entries.iteritems()
+
+
+def _parse(lines):
+    entries = []
+    paths = None
+    for line in lines:
+        if line[0] == '/':
+            paths.append(line)
+            continue
+        cpv, mtime = line.split('\t')
+        paths = []
+        entries.append((cpv, None if mtime == '-' else long(mtime), paths))
+    return OwnersIndex(entries)
+
+
+def _serialize(index):
+    for cpv, (mtime, paths) in sorted(index.iteritems()):
+        yield "%s\t%s" % (cpv, '-' if mtime is None else mtime)
+        for x in paths:
+            yield x
+
+
+def read_index(path):
+    """Load an owners index.
+
+    :return: :obj:`OwnersIndex` instance, or None if missing or of an
+        unknown format
+    """
+    return index_file.read(path, _MAGIC, _parse)
+
+
+def write_index(path, index):
+    """Store an owners index."""
+    index_file.write(path, _MAGIC, index, _serialize)
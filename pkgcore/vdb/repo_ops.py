@@ -117,8 +117,15 @@ class install(repo_ops.install):
     def finalize_data(self):
         os.rename(self.tmp_write_path, self.install_path)
         update_mtime(self.repo.location)
+        self.repo.update_metadata_cache(self.new_pkg.cpvstr)
+        self.repo.update_owners_index(self.new_pkg.cpvstr)
         return True
 
+    def finish(self):
+        self.repo.flush_metadata_cache()
+        self.repo.flush_owners_index()
+        return repo_ops.install.finish(self)
+
 
 class uninstall(repo_ops.uninstall):
 
@@ -134,8 +141,15 @@ class uninstall(repo_ops.uninstall):
         update_mtime(self.repo.location)
         shutil.rmtree(self.remove_path)
         update_mtime(self.repo.location)
+        self.repo.update_metadata_cache(self.old_pkg.cpvstr, removed=True)
+        self.repo.update_owners_index(self.old_pkg.cpvstr, removed=True)
         return True
 
+    def finish(self):
+        self.repo.flush_metadata_cache()
+        self.repo.flush_owners_index()
+        return repo_ops.uninstall.finish(self)
+
 
 # should convert these to mixins.
 class replace(repo_ops.replace, install, uninstall):
@@ -159,6 +173,11 @@ class replace(repo_ops.replace, install, uninstall):
         install.finalize_data(self)
         return True
 
+    def finish(self):
+        self.repo.flush_metadata_cache()
+        self.repo.flush_owners_index()
+        return repo_ops.replace.finish(self)
+
 
 class operations(repo_ops.operations):
 